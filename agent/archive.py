@@ -0,0 +1,609 @@
+"""
+Searchable archive of generated posts and reviews.
+Every DayContent and WeeklyReview produced by agent.tools is appended to
+a local archive when XHS_ARCHIVE_DIR is set. Full-text search uses an
+inverted index over character bigrams/trigrams (see textutil.ngrams),
+with filters by niche, style and date.
+
+On disk the archive is a list of segments. Each segment is an
+append-only JSONL file of records plus, once sealed, a binary .idx file
+holding per-document metadata arrays and the postings of every n-gram.
+New records go to an in-memory live segment that is sealed every
+SEGMENT_DOCS records; runs of MERGE_FACTOR sealed segments of the same
+size tier are merged into one, so a search touches O(log n) segments.
+
+One process at a time may open an archive for writing: it holds an
+exclusive lock on the directory's write.lock until close(). Tools such as
+scripts/search_archive.py open it read_only, which never truncates, seals,
+merges or deletes files, so they are safe next to a running server.
+"""
+
+import os
+import json
+import time
+import zlib
+import struct
+import threading
+from array import array
+from itertools import accumulate
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .textutil import is_cjk, ngram_set, runs
+
+try:
+    import fcntl
+except ImportError:  # Windows: no inter-process lock
+    fcntl = None
+
+ARCHIVE_DIR = os.getenv("XHS_ARCHIVE_DIR")
+# Records per sealed segment before merging
+SEGMENT_DOCS = 4096
+MERGE_FACTOR = 4
+# Rarest query n-grams intersected before candidates are verified
+MAX_QUERY_GRAMS = 8
+
+POST = "post"
+REVIEW = "review"
+_KINDS = (POST, REVIEW)
+
+# Bumped when the indexed n-grams change; older indexes are rebuilt on open
+_MAGIC = b"XHSIDX2\n"
+_HEADER_LEN = struct.Struct(">I")
+# Postings longer than this are stored as zlib-compressed id deltas
+_COMPRESS_BYTES = 64
+
+
+class ArchiveLockedError(OSError):
+    """Raised when another process has the archive open for writing."""
+
+
+def record_text(kind: str, data: Dict[str, Any]) -> str:
+    if kind == REVIEW:
+        return " ".join([data.get("reflection", "")] + list(data.get("suggestions", [])))
+    return " ".join(
+        [data.get("title", ""), data.get("hook", ""), data.get("cta", "")]
+        + list(data.get("bullets", [])) + list(data.get("tags", []))
+    )
+
+
+@dataclass
+class Hit:
+    """One search result."""
+    id: int
+    kind: str
+    created_at: float
+    niche: Optional[str]
+    style: Optional[str]
+    data: Dict[str, Any]
+
+
+class _Segment:
+    """Records [base, base + count) with their metadata and postings."""
+
+    def __init__(self, directory: str, seq: int, base: int):
+        self.directory = directory
+        self.seq = seq
+        self.base = base
+        self.offsets = array("Q")
+        self.created = array("d")
+        self.niches = array("H")
+        self.styles = array("H")
+        self.kinds = array("B")
+        # Live segments: gram -> local ids. Sealed: gram -> (offset, length, compressed) in blob
+        self.postings: Dict[str, array] = {}
+        self.spans: Dict[str, Tuple[int, int, int]] = {}
+        self.blob = b""
+        self.sealed = False
+
+    @property
+    def count(self) -> int:
+        return len(self.offsets)
+
+    @property
+    def docs_path(self) -> str:
+        return os.path.join(self.directory, f"{self.seq:06d}.docs.jsonl")
+
+    @property
+    def idx_path(self) -> str:
+        return os.path.join(self.directory, f"{self.seq:06d}.idx")
+
+    def index(self, local_id: int, text: str):
+        for gram in ngram_set(text):
+            ids = self.postings.get(gram)
+            if ids is None:
+                ids = self.postings[gram] = array("I")
+            ids.append(local_id)
+
+    def ids(self, gram: str) -> array:
+        """Sorted local ids of records containing gram."""
+        if not self.sealed:
+            return self.postings.get(gram, array("I"))
+        span = self.spans.get(gram)
+        ids = array("I")
+        if span is None:
+            return ids
+        offset, length, compressed = span
+        raw = self.blob[offset:offset + length]
+        if compressed:
+            ids.frombytes(zlib.decompress(raw))
+            return array("I", accumulate(ids))
+        ids.frombytes(raw)
+        return ids
+
+    def read(self, local_id: int) -> Dict[str, Any]:
+        with open(self.docs_path, "rb") as f:
+            f.seek(self.offsets[local_id])
+            return json.loads(f.readline())
+
+    def seal(self):
+        """Write the .idx file and switch to the compact postings blob."""
+        parts = []
+        spans = {}
+        position = 0
+        for gram in sorted(self.postings):
+            ids = self.postings[gram]
+            raw = ids.tobytes()
+            compressed = len(raw) > _COMPRESS_BYTES
+            if compressed:
+                deltas = array("I", [ids[0]])
+                deltas.extend(b - a for a, b in zip(ids, ids[1:]))
+                raw = zlib.compress(deltas.tobytes(), 1)
+            spans[gram] = (position, len(raw), int(compressed))
+            parts.append(raw)
+            position += len(raw)
+        self.blob = b"".join(parts)
+        self.spans = spans
+        self.postings = {}
+        self.sealed = True
+        self._write_idx()
+
+    def _write_idx(self):
+        header = json.dumps(
+            {"base": self.base, "count": self.count, "grams": self.spans},
+            ensure_ascii=False, separators=(",", ":")
+        ).encode("utf-8")
+        tmp = self.idx_path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(_MAGIC)
+            f.write(_HEADER_LEN.pack(len(header)))
+            f.write(header)
+            for values in (self.offsets, self.created, self.niches, self.styles, self.kinds):
+                f.write(values.tobytes())
+            f.write(self.blob)
+        os.replace(tmp, self.idx_path)
+
+    @classmethod
+    def load(cls, directory: str, seq: int) -> "_Segment":
+        path = os.path.join(directory, f"{seq:06d}.idx")
+        with open(path, "rb") as f:
+            data = f.read()
+        if not data.startswith(_MAGIC):
+            raise ValueError(f"not an archive index: {path}")
+        position = len(_MAGIC)
+        (header_len,) = _HEADER_LEN.unpack_from(data, position)
+        position += _HEADER_LEN.size
+        header = json.loads(data[position:position + header_len])
+        position += header_len
+
+        segment = cls(directory, seq, header["base"])
+        count = header["count"]
+        for values in (segment.offsets, segment.created, segment.niches, segment.styles, segment.kinds):
+            size = values.itemsize * count
+            values.frombytes(data[position:position + size])
+            position += size
+        segment.blob = data[position:]
+        segment.spans = {gram: tuple(span) for gram, span in header["grams"].items()}
+        segment.sealed = True
+        return segment
+
+
+class Archive:
+    """
+    Append-only post/review archive with n-gram full-text search.
+    Safe to share between threads. A writable archive raises
+    ArchiveLockedError if another process already has it open for writing;
+    a read_only one searches a snapshot taken at open.
+    """
+
+    def __init__(self, directory: str, segment_docs: int = SEGMENT_DOCS, read_only: bool = False):
+        self.directory = directory
+        self.segment_docs = segment_docs
+        self.read_only = read_only
+        self._lock = threading.Lock()
+        self._segments: List[_Segment] = []
+        self._labels: List[str] = [""]  # code 0 = no niche/style
+        self._codes: Dict[str, int] = {"": 0}
+        self._lock_file = None
+        if read_only:
+            if not os.path.isdir(directory):
+                raise FileNotFoundError(f"archive directory not found: {directory}")
+        else:
+            os.makedirs(directory, exist_ok=True)
+            self._lock_file = self._acquire_write_lock()
+        self._load()
+
+    def _acquire_write_lock(self):
+        f = open(os.path.join(self.directory, "write.lock"), "a")
+        if fcntl is not None:
+            try:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                f.close()
+                raise ArchiveLockedError(
+                    f"archive {self.directory} is open for writing in another process; open it read_only"
+                )
+        return f
+
+    def close(self):
+        """Release the write lock (a closed archive must not be written to)."""
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+    def _check_writable(self):
+        if self.read_only:
+            raise ValueError("archive opened read_only")
+
+    # -- loading ---------------------------------------------------------
+
+    def _labels_path(self) -> str:
+        return os.path.join(self.directory, "labels.json")
+
+    def _load(self):
+        if os.path.exists(self._labels_path()):
+            with open(self._labels_path(), encoding="utf-8") as f:
+                self._labels = json.load(f)
+            self._codes = {label: i for i, label in enumerate(self._labels)}
+
+        seqs = sorted(int(name.split(".")[0]) for name in os.listdir(self.directory) if name.endswith(".docs.jsonl"))
+        sealed, live = [], []
+        for seq in seqs:
+            if not os.path.exists(os.path.join(self.directory, f"{seq:06d}.idx")):
+                live.append(self._reindex(seq))
+                continue
+            try:
+                segment = _Segment.load(self.directory, seq)
+            except ValueError:
+                # Older index format: rebuild it from the records
+                segment = self._reindex(seq)
+                if not self.read_only:
+                    segment.seal()
+            sealed.append(segment)
+
+        # A merge interrupted before deleting its inputs leaves segments that
+        # a sealed merge output covers; one interrupted before sealing its
+        # output leaves a partial live segment overlapping its inputs.
+        sealed.sort(key=lambda s: (s.base, -s.count))
+        next_id = 0
+        for segment in sealed:
+            if segment.base < next_id:
+                self._discard(segment)
+                continue
+            self._segments.append(segment)
+            next_id = segment.base + segment.count
+        for segment in live:
+            if segment.count and segment.base < next_id:
+                self._discard(segment)
+                continue
+            if segment.count:
+                self._segments.append(segment)
+                next_id = segment.base + segment.count
+            else:
+                self._discard(segment)
+        if not self.read_only:
+            for segment in self._segments[:-1]:
+                if not segment.sealed:
+                    segment.seal()
+        if not self._segments or self._segments[-1].sealed:
+            self._segments.append(_Segment(self.directory, self._next_seq(), next_id))
+
+    def _reindex(self, seq: int) -> _Segment:
+        """Rebuild a live segment from its records."""
+        segment = _Segment(self.directory, seq, 0)
+        path = os.path.join(self.directory, f"{seq:06d}.docs.jsonl")
+        offset = 0
+        torn = False
+        with open(path, "rb") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    torn = True
+                    break
+                if segment.count == 0:
+                    segment.base = record["id"]
+                self._append_meta(segment, offset, record)
+                offset += len(line)
+        if torn and not self.read_only:
+            # Drop a partially written final record
+            with open(path, "r+b") as f:
+                f.truncate(offset)
+        return segment
+
+    def _discard(self, segment: _Segment):
+        """Drop a leftover segment at load (its files too, unless read_only)."""
+        if not self.read_only:
+            self._remove_files(segment)
+
+    @staticmethod
+    def _remove_files(segment: _Segment):
+        for path in (segment.idx_path, segment.docs_path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _next_seq(self) -> int:
+        return max((s.seq for s in self._segments), default=0) + 1
+
+    # -- writing ---------------------------------------------------------
+
+    def _code(self, label: Optional[str]) -> int:
+        label = label or ""
+        code = self._codes.get(label)
+        if code is None:
+            code = self._codes[label] = len(self._labels)
+            self._labels.append(label)
+            if self.read_only:
+                return code
+            tmp = self._labels_path() + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self._labels, f, ensure_ascii=False)
+            os.replace(tmp, self._labels_path())
+        return code
+
+    def _append_meta(self, segment: _Segment, offset: int, record: Dict[str, Any]):
+        local_id = segment.count
+        segment.offsets.append(offset)
+        segment.created.append(record["created_at"])
+        segment.niches.append(self._code(record.get("niche")))
+        segment.styles.append(self._code(record.get("style")))
+        segment.kinds.append(_KINDS.index(record["kind"]))
+        segment.index(local_id, record_text(record["kind"], record["data"]))
+
+    def add(
+        self,
+        kind: str,
+        items: Iterable[Dict[str, Any]],
+        niche: Optional[str] = None,
+        style: Optional[str] = None
+    ) -> List[int]:
+        """Append records (DayContent/WeeklyReview dicts). Returns their ids."""
+        self._check_writable()
+        now = time.time()
+        ids = []
+        with self._lock:
+            segment = self._segments[-1]
+            with open(segment.docs_path, "ab") as f:
+                offset = f.tell()
+                for data in items:
+                    doc_id = segment.base + segment.count
+                    record = {"id": doc_id, "kind": kind, "created_at": now, "niche": niche, "style": style, "data": data}
+                    line = (json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+                    f.write(line)
+                    self._append_meta(segment, offset, record)
+                    offset += len(line)
+                    ids.append(doc_id)
+            if segment.count >= self.segment_docs:
+                self._seal_locked()
+        return ids
+
+    def add_posts(self, days: Iterable, niche: Optional[str] = None, style: Optional[str] = None) -> List[int]:
+        return self.add(POST, (d.to_dict() for d in days), niche, style)
+
+    def add_review(self, review, niche: Optional[str] = None, style: Optional[str] = None) -> List[int]:
+        return self.add(REVIEW, [review.to_dict()], niche, style)
+
+    def flush(self):
+        """Seal the live segment so its index is on disk."""
+        self._check_writable()
+        with self._lock:
+            if self._segments[-1].count:
+                self._seal_locked()
+
+    def _seal_locked(self):
+        live = self._segments[-1]
+        live.seal()
+        self._segments.append(_Segment(self.directory, self._next_seq(), live.base + live.count))
+        self._maybe_merge_locked()
+
+    # -- merging ---------------------------------------------------------
+
+    def _tier(self, segment: _Segment) -> int:
+        tier, size = 0, self.segment_docs
+        while segment.count >= size * MERGE_FACTOR:
+            tier += 1
+            size *= MERGE_FACTOR
+        return tier
+
+    def _maybe_merge_locked(self):
+        while True:
+            sealed = self._segments[:-1]
+            if len(sealed) < MERGE_FACTOR:
+                return
+            tail = sealed[-MERGE_FACTOR:]
+            if len({self._tier(s) for s in tail}) != 1:
+                return
+            self._merge_locked(tail)
+
+    def merge(self):
+        """Merge every sealed segment into one."""
+        self._check_writable()
+        with self._lock:
+            sealed = self._segments[:-1]
+            if len(sealed) > 1:
+                self._merge_locked(sealed)
+
+    def _merge_locked(self, parts: List[_Segment]):
+        merged = _Segment(self.directory, self._next_seq(), parts[0].base)
+        grams = set()
+        with open(merged.docs_path, "wb") as out:
+            for part in parts:
+                shift = out.tell()
+                with open(part.docs_path, "rb") as f:
+                    while True:
+                        chunk = f.read(1 << 20)
+                        if not chunk:
+                            break
+                        out.write(chunk)
+                merged.offsets.extend(o + shift for o in part.offsets)
+                merged.created.extend(part.created)
+                merged.niches.extend(part.niches)
+                merged.styles.extend(part.styles)
+                merged.kinds.extend(part.kinds)
+                grams.update(part.spans)
+        for gram in grams:
+            ids = array("I")
+            for part in parts:
+                shift = part.base - merged.base
+                if shift:
+                    ids.extend(i + shift for i in part.ids(gram))
+                else:
+                    ids.extend(part.ids(gram))
+            merged.postings[gram] = ids
+        merged.seal()
+
+        start = self._segments.index(parts[0])
+        self._segments[start:start + len(parts)] = [merged]
+        for part in parts:
+            self._remove_files(part)
+
+    # -- searching -------------------------------------------------------
+
+    def __len__(self) -> int:
+        with self._lock:
+            return sum(s.count for s in self._segments)
+
+    def search(
+        self,
+        query: str = "",
+        niche: Optional[str] = None,
+        style: Optional[str] = None,
+        kind: Optional[str] = None,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        limit: int = 20
+    ) -> List[Hit]:
+        """
+        Newest records matching every word of query (substring match) and
+        the filters. since/until are epoch seconds.
+        """
+        words = runs(query)
+        grams = set()
+        for word in words:
+            # Single characters are only indexed as whole one-character runs,
+            # so they are matched by the substring check alone
+            if len(word) > 1 or not is_cjk(word):
+                grams |= ngram_set(word, (3,) if len(word) >= 3 else (2,))
+
+        # Held throughout: merges delete the files of the segments they replace
+        with self._lock:
+            return self._search_locked(query, words, grams, niche, style, kind, since, until, limit)
+
+    def _search_locked(self, query, words, grams, niche, style, kind, since, until, limit) -> List[Hit]:
+        niche_code = self._codes.get(niche) if niche else None
+        style_code = self._codes.get(style) if style else None
+        if (niche and niche_code is None) or (style and style_code is None):
+            return []
+
+        kind_code = _KINDS.index(kind) if kind else None
+
+        hits: List[Hit] = []
+        for segment in reversed(self._segments):
+            if not segment.count:
+                continue
+            # Records are appended in time order
+            if since is not None and segment.created[-1] < since:
+                break
+            if until is not None and segment.created[0] >= until:
+                continue
+            for local_id in self._candidates(segment, grams):
+                created = segment.created[local_id]
+                if until is not None and created >= until:
+                    continue
+                if since is not None and created < since:
+                    break
+                if niche_code is not None and segment.niches[local_id] != niche_code:
+                    continue
+                if style_code is not None and segment.styles[local_id] != style_code:
+                    continue
+                if kind_code is not None and segment.kinds[local_id] != kind_code:
+                    continue
+                record = segment.read(local_id)
+                text = record_text(record["kind"], record["data"]).lower()
+                if not all(word in text for word in words):
+                    continue
+                hits.append(Hit(
+                    id=record["id"],
+                    kind=record["kind"],
+                    created_at=record["created_at"],
+                    niche=record.get("niche"),
+                    style=record.get("style"),
+                    data=record["data"]
+                ))
+                if len(hits) >= limit:
+                    return hits
+        return hits
+
+    def _candidates(self, segment: _Segment, grams: set) -> Iterable[int]:
+        """Local ids containing every gram, newest first."""
+        if not grams:
+            return range(segment.count - 1, -1, -1)
+        postings = sorted((segment.ids(g) for g in grams), key=len)[:MAX_QUERY_GRAMS]
+        if not postings[0]:
+            return []
+        candidates = set(postings[0])
+        for ids in postings[1:]:
+            candidates.intersection_update(ids)
+            if not candidates:
+                return []
+        return sorted(candidates, reverse=True)
+
+    def iter_records(self, kind: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        """Stream every record, oldest first, without holding them in memory."""
+        with self._lock:
+            # Open handles survive a concurrent merge deleting the files
+            handles = [(open(s.docs_path, "rb"), s.count) for s in self._segments if s.count]
+        try:
+            for f, count in handles:
+                for _, line in zip(range(count), f):
+                    record = json.loads(line)
+                    if kind is None or record["kind"] == kind:
+                        yield record
+        finally:
+            for f, _ in handles:
+                f.close()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "records": sum(s.count for s in self._segments),
+                "segments": [
+                    {"seq": s.seq, "base": s.base, "count": s.count, "sealed": s.sealed,
+                     "grams": len(s.spans) if s.sealed else len(s.postings), "postings_bytes": len(s.blob)}
+                    for s in self._segments
+                ]
+            }
+
+
+_archive: Optional[Archive] = None
+_archive_locked = False
+_archive_lock = threading.Lock()
+
+
+def get_archive() -> Optional[Archive]:
+    """
+    Process-wide archive, or None unless XHS_ARCHIVE_DIR is set (or another
+    process is already writing to it).
+    """
+    global _archive, _archive_locked
+    if not ARCHIVE_DIR:
+        return None
+    with _archive_lock:
+        if _archive is None and not _archive_locked:
+            try:
+                _archive = Archive(ARCHIVE_DIR)
+            except ArchiveLockedError:
+                _archive_locked = True
+        return _archive
@@ -0,0 +1,171 @@
+"""
+Circuit breaker for LLM calls.
+One breaker per endpoint/model, shared by every session in the process.
+"""
+
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional
+
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Raised when a call is rejected because the breaker is open."""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"circuit '{name}' is open, retry in {retry_after:.0f}s")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Sliding-window circuit breaker.
+    Trips when the share of failed or slow calls in the window crosses
+    failure_rate_threshold, fails fast while open, then lets a limited
+    number of half-open probes through before closing again.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_rate_threshold: float = 0.5,
+        slow_call_seconds: float = 30.0,
+        window_size: int = 20,
+        min_calls: int = 5,
+        open_seconds: float = 30.0,
+        half_open_max_calls: int = 1
+    ):
+        self.name = name
+        self.failure_rate_threshold = failure_rate_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.half_open_max_calls = half_open_max_calls
+
+        self._lock = threading.Lock()
+        self._outcomes: Deque[bool] = deque(maxlen=window_size)  # True = bad call
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._half_open_in_flight = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._maybe_half_open()
+            return self._state
+
+    def _maybe_half_open(self):
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+            self._state = HALF_OPEN
+            self._half_open_in_flight = 0
+
+    def _trip(self):
+        self._state = OPEN
+        self._opened_at = time.monotonic()
+        self._half_open_in_flight = 0
+
+    def before_call(self):
+        """Reserve a call slot or raise CircuitOpenError."""
+        with self._lock:
+            self._maybe_half_open()
+            if self._state == OPEN:
+                retry_after = self.open_seconds - (time.monotonic() - self._opened_at)
+                raise CircuitOpenError(self.name, max(retry_after, 0.0))
+            if self._state == HALF_OPEN:
+                if self._half_open_in_flight >= self.half_open_max_calls:
+                    raise CircuitOpenError(self.name, self.open_seconds)
+                self._half_open_in_flight += 1
+
+    def record_success(self, elapsed: float, slow_call_seconds: Optional[float] = None):
+        """
+        Record a completed call. Slow calls count against the breaker;
+        slow_call_seconds overrides the threshold for calls expected to
+        take longer.
+        """
+        slow = elapsed >= (slow_call_seconds if slow_call_seconds is not None else self.slow_call_seconds)
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._half_open_in_flight = max(self._half_open_in_flight - 1, 0)
+                if slow:
+                    self._trip()
+                else:
+                    self._state = CLOSED
+                    self._outcomes.clear()
+                return
+            self._record(slow)
+
+    def record_failure(self):
+        """Record a failed call."""
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._trip()
+                return
+            self._record(True)
+
+    def release(self):
+        """Give back a call slot without recording an outcome (the call failed for its own reasons)."""
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._half_open_in_flight = max(self._half_open_in_flight - 1, 0)
+
+    def _record(self, bad: bool):
+        self._outcomes.append(bad)
+        if self._state != CLOSED or len(self._outcomes) < self.min_calls:
+            return
+        failure_rate = sum(self._outcomes) / len(self._outcomes)
+        if failure_rate >= self.failure_rate_threshold:
+            self._trip()
+
+    def snapshot(self) -> Dict[str, object]:
+        """Current breaker state for diagnostics."""
+        with self._lock:
+            self._maybe_half_open()
+            calls = len(self._outcomes)
+            return {
+                "name": self.name,
+                "state": self._state,
+                "calls": calls,
+                "failure_rate": (sum(self._outcomes) / calls) if calls else 0.0
+            }
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name: str, **kwargs) -> CircuitBreaker:
+    """Get or create the process-wide breaker for an endpoint/model key."""
+    with _breakers_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            breaker = CircuitBreaker(name, **kwargs)
+            _breakers[name] = breaker
+        return breaker
+
+
+def open_breakers() -> List[str]:
+    """Names of breakers that are currently rejecting calls."""
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return [b.name for b in breakers if b.state != CLOSED]
+
+
+def breaker_snapshots() -> List[Dict[str, object]]:
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return [b.snapshot() for b in breakers]
+
+
+def reset_breakers(name: Optional[str] = None):
+    """Drop breaker state (all, or a single key)."""
+    with _breakers_lock:
+        if name is None:
+            _breakers.clear()
+        else:
+            _breakers.pop(name, None)
@@ -0,0 +1,150 @@
+"""
+Local scoring of alternative weekly plans.
+With XHS_PLAN_CANDIDATES > 1 one generation produces several candidate
+plans (n choices in one request, or concurrent requests). They are ranked
+here without another LLM call: invalid plans are dropped, the rest are
+scored on diversity across days, constraint compliance and how well the
+bullets fit the chosen effort. The best is shown and the others are kept
+for "换一版", each use of which saves a regenerate round trip.
+"""
+
+import os
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+from .dedup import MinHashIndex, find_duplicates, jaccard, shingles
+from .rules import DEFAULT_EFFORT_RULE, EFFORT_RULES, check_plan
+
+PLAN_CANDIDATES = max(1, int(os.getenv("XHS_PLAN_CANDIDATES", "1")))
+# "parallel": concurrent requests; "n": one request with n choices (models that support it)
+CANDIDATES_MODE = os.getenv("XHS_CANDIDATES_MODE", "parallel")
+
+WEIGHT_COMPLIANCE = 0.4
+WEIGHT_DIVERSITY = 0.3
+WEIGHT_LENGTH = 0.3
+# Ideal mean bullet length as a share of the effort level's maximum
+TARGET_BULLET_SHARE = 0.6
+
+PLAN_DAYS = 7
+
+
+@dataclass
+class PlanScore:
+    """Components are in [0, 1]; invalid plans score 0."""
+    valid: bool
+    diversity: float = 0.0
+    compliance: float = 0.0
+    length_fit: float = 0.0
+
+    @property
+    def total(self) -> float:
+        if not self.valid:
+            return 0.0
+        return (WEIGHT_COMPLIANCE * self.compliance + WEIGHT_DIVERSITY * self.diversity
+                + WEIGHT_LENGTH * self.length_fit)
+
+
+def plan_problem(days: List, strict: bool = True) -> Optional[str]:
+    """
+    Why a plan can't be used, or None. A plan needs seven days; strictly
+    (when choosing among candidates) they must also be numbered 1-7 and
+    each have a title, hook and bullets.
+    """
+    if len(days) != PLAN_DAYS:
+        return f"生成的内容天数不正确（期望{PLAN_DAYS}天，实际{len(days)}天），请重试。"
+    if not strict:
+        return None
+    if sorted(d.day for d in days) != list(range(1, PLAN_DAYS + 1)):
+        return f"生成的内容天数编号不正确（应为第1-{PLAN_DAYS}天），请重试。"
+    for day in days:
+        if not (day.title and day.hook and day.bullets):
+            return f"生成的第{day.day}天内容不完整（缺少标题、开头或要点），请重试。"
+    return None
+
+
+def is_valid_plan(days: List, strict: bool = True) -> bool:
+    return plan_problem(days, strict) is None
+
+
+def _diversity(days: List, history: Optional[MinHashIndex]) -> float:
+    """1 - mean pairwise similarity, scaled down by days repeating history or each other."""
+    sets = [shingles(d) for d in days]
+    pairs = [jaccard(sets[i], sets[j]) for i in range(len(sets)) for j in range(i)]
+    spread = 1.0 - sum(pairs) / len(pairs) if pairs else 1.0
+    repeated = len(find_duplicates(days, history))
+    return spread * (1.0 - repeated / len(days))
+
+
+def _length_fit(days: List, effort: Optional[str]) -> float:
+    """Per day: bullet count in range, and mean bullet length near the target."""
+    min_bullets, max_bullets, max_chars = EFFORT_RULES.get(effort or "", DEFAULT_EFFORT_RULE)
+    target = max_chars * TARGET_BULLET_SHARE
+    total = 0.0
+    for day in days:
+        count_ok = 1.0 if min_bullets <= len(day.bullets) <= max_bullets else 0.0
+        mean = sum(len(b) for b in day.bullets) / len(day.bullets) if day.bullets else 0.0
+        total += 0.5 * count_ok + 0.5 * max(0.0, 1.0 - abs(mean - target) / target)
+    return total / len(days)
+
+
+def score_plan(
+    days: List,
+    constraints: List[str],
+    effort: Optional[str],
+    history: Optional[MinHashIndex] = None,
+    strict: bool = True
+) -> PlanScore:
+    if not is_valid_plan(days, strict):
+        return PlanScore(valid=False)
+    # Tags are cleaned locally, and sizes are scored by length_fit
+    violating = {
+        v.day for v in check_plan(days, constraints, effort)
+        if v.field != "tags" and v.rule not in ("bullet_count", "length")
+    }
+    return PlanScore(
+        valid=True,
+        diversity=_diversity(days, history),
+        compliance=1.0 - len(violating) / len(days),
+        length_fit=_length_fit(days, effort)
+    )
+
+
+def rank_plans(
+    plans: List[List],
+    constraints: List[str],
+    effort: Optional[str],
+    history: Optional[MinHashIndex] = None,
+    strict: bool = True
+) -> List[List]:
+    """
+    Valid plans, best first (ties keep generation order). Pass strict=False
+    for a lone plan, which only needs seven days.
+    """
+    scored = [(score_plan(days, constraints, effort, history, strict), i, days) for i, days in enumerate(plans)]
+    scored = [s for s in scored if s[0].valid]
+    scored.sort(key=lambda s: (-s[0].total, s[1]))
+    with _stats_lock:
+        _stats["generations"] += 1
+        _stats["candidates"] += len(plans)
+        _stats["valid"] += len(scored)
+    return [days for _, _, days in scored]
+
+
+_stats = {"generations": 0, "candidates": 0, "valid": 0, "alternatives_served": 0}
+_stats_lock = threading.Lock()
+
+
+def record_alternative_served():
+    """Count one "换一版" served from stored alternatives instead of regenerating."""
+    with _stats_lock:
+        _stats["alternatives_served"] += 1
+
+
+def candidate_stats() -> Dict[str, Any]:
+    """
+    Process-wide counts. alternatives_served is the number of regenerate
+    round trips avoided.
+    """
+    with _stats_lock:
+        return dict(_stats)
@@ -0,0 +1,256 @@
+"""
+Record/replay cassettes for LLM calls.
+A cassette is a JSONL file (gzip if it ends in .gz) with one entry per
+call: request (model, messages, params), response text, token usage and
+wall time, keyed by a hash of the normalized request. Failed calls are
+recorded too, with an "error" instead of a text, and replay raises them.
+Gzip cassettes are written in batches of RECORD_BUFFER_ENTRIES (one gzip
+member each) and on exit; plain JSONL is appended per call.
+
+Configure with LLM_CASSETTE=<path> and LLM_CASSETTE_MODE=record|replay,
+plus LLM_CASSETTE_REALTIME=1 to replay at the recorded speed.
+"""
+
+import os
+import re
+import gzip
+import json
+import time
+import atexit
+import hashlib
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+from .breaker import CircuitOpenError
+
+RECORD = "record"
+REPLAY = "replay"
+
+RECORD_BUFFER_ENTRIES = 50
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+class CassetteMiss(Exception):
+    """Raised in replay mode when a request was never recorded."""
+
+
+class RecordedCallError(Exception):
+    """Replay of a call that failed when it was recorded."""
+
+    def __init__(self, error_type: str, message: str):
+        super().__init__(f"{error_type}: {message}")
+        self.error_type = error_type
+
+
+def error_to_dict(error: Exception) -> Dict[str, Any]:
+    data = {"type": type(error).__name__, "message": str(error)}
+    if isinstance(error, CircuitOpenError):
+        data.update(name=error.name, retry_after=error.retry_after)
+    return data
+
+
+def raise_recorded(error: Dict[str, Any]):
+    """Raise a recorded failure; breaker rejections keep their type so fallbacks replay too."""
+    if error.get("type") == "CircuitOpenError":
+        raise CircuitOpenError(error.get("name", "replay"), error.get("retry_after", 0.0))
+    raise RecordedCallError(error.get("type", "Exception"), error.get("message", ""))
+
+
+def normalize_text(text: str) -> str:
+    """Collapse whitespace so formatting-only prompt changes still match."""
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def request_key(model: str, messages: List[Dict[str, Any]], params: Dict[str, Any]) -> str:
+    """Stable hash of a chat request."""
+    payload = {
+        "model": model,
+        "messages": [
+            {"role": m.get("role"), "content": normalize_text(str(m.get("content", "")))}
+            for m in messages
+        ],
+        "params": {k: params[k] for k in sorted(params)}
+    }
+    raw = json.dumps(payload, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
+
+def _open(path: str, mode: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+def read_entries(path: str, errors: bool = False) -> Iterator[Dict[str, Any]]:
+    """Stream entries from a cassette file (failed calls only with errors=True)."""
+    with _open(path, "r") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                entry = json.loads(line)
+                if errors or "error" not in entry:
+                    yield entry
+
+
+class Cassette:
+    """
+    One cassette file in record or replay mode.
+    Replaying a key that was recorded several times returns the
+    recordings in order, then keeps returning the last one.
+    """
+
+    def __init__(self, path: str, mode: str, realtime: bool = False):
+        if mode not in (RECORD, REPLAY):
+            raise ValueError(f"unknown cassette mode: {mode}")
+        self.path = path
+        self.mode = mode
+        self.realtime = realtime
+        self._lock = threading.Lock()
+        self._entries: Dict[str, List[Dict[str, Any]]] = {}
+        self._cursor: Dict[str, int] = {}
+        self._pending: List[str] = []
+        if mode == REPLAY:
+            for entry in read_entries(path, errors=True):
+                self._entries.setdefault(entry["key"], []).append(entry)
+        else:
+            atexit.register(self.flush)
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == REPLAY
+
+    def replay(self, model: str, messages: List[Dict[str, Any]], params: Dict[str, Any]) -> Dict[str, Any]:
+        """Return the recorded entry for this request, sleeping if realtime."""
+        key = request_key(model, messages, params)
+        with self._lock:
+            entries = self._entries.get(key)
+            if not entries:
+                raise CassetteMiss(f"cassette {self.path} has no recording for request {key}")
+            index = self._cursor.get(key, 0)
+            self._cursor[key] = index + 1
+            entry = entries[min(index, len(entries) - 1)]
+        if self.realtime:
+            time.sleep(entry.get("elapsed", 0.0))
+        if "error" in entry:
+            raise_recorded(entry["error"])
+        return entry
+
+    def record(
+        self,
+        model: str,
+        messages: List[Dict[str, Any]],
+        params: Dict[str, Any],
+        text: str,
+        usage: Optional[Dict[str, Any]],
+        elapsed: float,
+        operation: Optional[str] = None,
+        choices: Optional[List[str]] = None
+    ):
+        """Append one call to the cassette (choices: every text of an n > 1 request)."""
+        self._write({
+            "key": request_key(model, messages, params),
+            "operation": operation,
+            "model": model,
+            "messages": messages,
+            "params": params,
+            "text": text,
+            **({"choices": choices} if choices else {}),
+            "usage": usage,
+            "elapsed": round(elapsed, 4),
+            "recorded_at": time.time()
+        })
+
+    def record_error(
+        self,
+        model: str,
+        messages: List[Dict[str, Any]],
+        params: Dict[str, Any],
+        error: Exception,
+        elapsed: float,
+        operation: Optional[str] = None
+    ):
+        """Append one failed call; replaying it raises the failure again."""
+        self._write({
+            "key": request_key(model, messages, params),
+            "operation": operation,
+            "model": model,
+            "messages": messages,
+            "params": params,
+            "error": error_to_dict(error),
+            "elapsed": round(elapsed, 4),
+            "recorded_at": time.time()
+        })
+
+    def _write(self, entry: Dict[str, Any]):
+        line = json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n"
+        with self._lock:
+            if not self.path.endswith(".gz"):
+                with _open(self.path, "a") as f:
+                    f.write(line)
+                return
+            # Every append to a .gz file starts a new gzip member: batch them
+            self._pending.append(line)
+            if len(self._pending) >= RECORD_BUFFER_ENTRIES:
+                self._flush_locked()
+
+    def flush(self):
+        """Write buffered entries (called on exit and when the cassette is swapped out)."""
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        if not self._pending:
+            return
+        with _open(self.path, "a") as f:
+            f.write("".join(self._pending))
+        self._pending = []
+
+
+def usage_to_dict(usage: Any) -> Optional[Dict[str, Any]]:
+    """Plain-dict copy of an SDK usage object (None if the server sent none)."""
+    if usage is None:
+        return None
+    if hasattr(usage, "model_dump"):
+        return usage.model_dump(exclude_none=True)
+    return dict(usage)
+
+
+_cassette: Optional[Cassette] = None
+_cassette_loaded = False
+_cassette_lock = threading.Lock()
+
+
+def get_cassette() -> Optional[Cassette]:
+    """Active cassette, configured from the environment on first use."""
+    global _cassette, _cassette_loaded
+    with _cassette_lock:
+        if not _cassette_loaded:
+            _cassette_loaded = True
+            path = os.getenv("LLM_CASSETTE")
+            mode = os.getenv("LLM_CASSETTE_MODE", "")
+            if path and mode:
+                _cassette = Cassette(path, mode, realtime=os.getenv("LLM_CASSETTE_REALTIME") == "1")
+        return _cassette
+
+
+def set_cassette(cassette: Optional[Cassette]):
+    global _cassette, _cassette_loaded
+    with _cassette_lock:
+        previous = _cassette
+        _cassette = cassette
+        _cassette_loaded = True
+    if previous is not None and previous is not cassette:
+        previous.flush()
+
+
+@contextmanager
+def use_cassette(path: str, mode: str, realtime: bool = False):
+    """Temporarily record to or replay from a cassette."""
+    previous = get_cassette()
+    set_cassette(Cassette(path, mode, realtime=realtime))
+    try:
+        yield get_cassette()
+    finally:
+        set_cassette(previous)
@@ -0,0 +1,229 @@
+"""
+Streaming export of content plans to Markdown, CSV and JSONL.
+Rows come from session state, JSONL files (plans or day rows, e.g. an
+earlier export or a batch run's output) or the archive, and are written
+one at a time, so memory stays constant however many rows there are.
+
+Usage:
+    python -m agent.export --input plans.jsonl.gz --format md --output plans.md
+    python -m agent.export --archive archive --niche 学习/成长 --format csv --output posts.csv.gz --gzip
+"""
+
+import io
+import sys
+import csv
+import gzip
+import json
+import argparse
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, IO, Iterable, Iterator, Optional
+
+from .state import DayContent
+
+MARKDOWN = "md"
+CSV = "csv"
+JSONL = "jsonl"
+FORMATS = (MARKDOWN, CSV, JSONL)
+
+CSV_COLUMNS = ["plan", "week", "day", "title", "hook", "bullets", "cta", "tags", "niche", "style", "created_at"]
+
+
+@dataclass
+class ExportRow:
+    """One post plus where it came from."""
+    plan: str
+    week: int
+    day: DayContent
+    niche: Optional[str] = None
+    style: Optional[str] = None
+    created_at: Optional[float] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = {"plan": self.plan, "week": self.week}
+        data.update(self.day.to_dict())
+        data.update({"niche": self.niche, "style": self.style, "created_at": self.created_at})
+        return data
+
+
+# -- sources ---------------------------------------------------------------
+
+def rows_from_state(state, plan: str = "") -> Iterator[ExportRow]:
+    """Rows of an AppState's plan (every week of a multi-week plan)."""
+    weeks = state.plan_weeks or [state.weekly_plan]
+    for week, days in enumerate(weeks, 1):
+        for day in days:
+            yield ExportRow(plan or state.session_id, week, day, state.niche, state.style)
+
+
+def _open_text(path: str, mode: str, encoding: str = "utf-8") -> IO[str]:
+    if path == "-":
+        return sys.stdin if mode == "r" else sys.stdout
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding=encoding, newline="")
+    return open(path, mode, encoding=encoding, newline="")
+
+
+def rows_from_jsonl(path: str) -> Iterator[ExportRow]:
+    """
+    Rows from a JSONL file (gzip if it ends in .gz, "-" for stdin).
+    Each line is either a day row as written by JsonlWriter, or a plan:
+    {"plan": ..., "niche": ..., "style": ..., "days": [...]} or with
+    "weeks": [[...], ...] for multi-week plans.
+    """
+    f = _open_text(path, "r")
+    try:
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            data = json.loads(line)
+            plan = str(data.get("plan") or data.get("creator") or number)
+            niche, style, created = data.get("niche"), data.get("style"), data.get("created_at")
+            if "weeks" in data or "days" in data:
+                weeks = data.get("weeks") or [data.get("days", [])]
+                for week, days in enumerate(weeks, 1):
+                    for day in days:
+                        yield ExportRow(plan, week, DayContent.from_dict(day), niche, style, created)
+            else:
+                yield ExportRow(plan, data.get("week", 1), DayContent.from_dict(data), niche, style, created)
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+
+def rows_from_archive(archive, niche: Optional[str] = None, style: Optional[str] = None) -> Iterator[ExportRow]:
+    """Every archived post, oldest first, optionally filtered by niche/style."""
+    for record in archive.iter_records(kind="post"):
+        if niche and record.get("niche") != niche:
+            continue
+        if style and record.get("style") != style:
+            continue
+        yield ExportRow(
+            plan=str(record["id"]),
+            week=1,
+            day=DayContent.from_dict(record["data"]),
+            niche=record.get("niche"),
+            style=record.get("style"),
+            created_at=record.get("created_at")
+        )
+
+
+# -- writers ---------------------------------------------------------------
+
+class MarkdownWriter:
+    """Paste-ready text per post, with a heading per plan and week."""
+
+    def __init__(self, out: IO[str]):
+        self.out = out
+        self._current = None
+
+    def write(self, row: ExportRow):
+        day = row.day
+        if (row.plan, row.week) != self._current:
+            self._current = (row.plan, row.week)
+            label = " · ".join(x for x in (row.niche, row.style) if x)
+            self.out.write(f"# {row.plan} · 第{row.week}周" + (f"（{label}）" if label else "") + "\n\n")
+        self.out.write(f"## 第{day.day}天\n\n{day.title}\n\n{day.hook}\n\n")
+        for bullet in day.bullets:
+            self.out.write(f"• {bullet}\n")
+        self.out.write(f"\n{day.cta}\n\n")
+        if day.tags:
+            self.out.write(" ".join(day.tags) + "\n\n")
+        self.out.write("---\n\n")
+
+
+class CsvWriter:
+    """One row per post; bullets are newline-separated in one cell."""
+
+    def __init__(self, out: IO[str]):
+        self._writer = csv.writer(out)
+        self._writer.writerow(CSV_COLUMNS)
+
+    def write(self, row: ExportRow):
+        day = row.day
+        created = datetime.fromtimestamp(row.created_at).isoformat(timespec="seconds") if row.created_at else ""
+        self._writer.writerow([
+            row.plan, row.week, day.day, day.title, day.hook, "\n".join(day.bullets),
+            day.cta, " ".join(day.tags), row.niche or "", row.style or "", created
+        ])
+
+
+class JsonlWriter:
+    """One JSON object per post (readable again by rows_from_jsonl)."""
+
+    def __init__(self, out: IO[str]):
+        self.out = out
+
+    def write(self, row: ExportRow):
+        self.out.write(json.dumps(row.to_dict(), ensure_ascii=False, separators=(",", ":")) + "\n")
+
+
+WRITERS = {MARKDOWN: MarkdownWriter, CSV: CsvWriter, JSONL: JsonlWriter}
+
+
+def export_rows(rows: Iterable[ExportRow], out: IO[str], fmt: str) -> int:
+    """Write rows to an open text stream. Returns the number written."""
+    writer = WRITERS[fmt](out)
+    count = 0
+    for row in rows:
+        writer.write(row)
+        count += 1
+    return count
+
+
+def export_to_path(rows: Iterable[ExportRow], path: str, fmt: str, compress: bool = False) -> int:
+    """Write rows to a file ("-" for stdout), gzip-compressed if compress or path ends in .gz."""
+    if path == "-":
+        if compress:
+            with gzip.open(sys.stdout.buffer, "wt", encoding="utf-8", newline="") as out:
+                return export_rows(rows, out, fmt)
+        return export_rows(rows, sys.stdout, fmt)
+    if compress and not path.endswith(".gz"):
+        path += ".gz"
+    # BOM so spreadsheet apps detect UTF-8 Chinese text
+    with _open_text(path, "w", "utf-8-sig" if fmt == CSV else "utf-8") as out:
+        return export_rows(rows, out, fmt)
+
+
+def export_bytes(rows: Iterable[ExportRow], fmt: str, compress: bool = False) -> bytes:
+    """Export into memory (for download buttons on small plans)."""
+    buffer = io.BytesIO()
+    raw = gzip.GzipFile(fileobj=buffer, mode="wb") if compress else buffer
+    text = io.TextIOWrapper(raw, encoding="utf-8-sig" if fmt == CSV else "utf-8", newline="")
+    export_rows(rows, text, fmt)
+    text.flush()
+    text.detach()
+    if compress:
+        raw.close()
+    return buffer.getvalue()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m agent.export",
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--input", action="append", help="JSONL file of plans or day rows (repeatable, - for stdin)")
+    source.add_argument("--archive", help="archive directory (see XHS_ARCHIVE_DIR)")
+    parser.add_argument("--niche", help="archive only: filter by niche")
+    parser.add_argument("--style", help="archive only: filter by style")
+    parser.add_argument("--format", choices=FORMATS, default=MARKDOWN)
+    parser.add_argument("--output", default="-", help="output file (- for stdout)")
+    parser.add_argument("--gzip", action="store_true", help="gzip the output")
+    args = parser.parse_args(argv)
+
+    if args.archive:
+        from .archive import Archive
+        rows = rows_from_archive(Archive(args.archive, read_only=True), args.niche, args.style)
+    else:
+        rows = (row for path in args.input for row in rows_from_jsonl(path))
+
+    count = export_to_path(rows, args.output, args.format, args.gzip)
+    print(f"exported {count} posts", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""
+Local classification of rewrite instructions.
+Maps a free-text instruction such as "换个标题" or "标签换一下，其他不变"
+to the DayContent fields it touches, so rewrites only regenerate those.
+"""
+
+import re
+from typing import List, Optional
+
+from .rules import AhoCorasick, FIELDS
+
+# Words naming each rewritable field
+FIELD_TERMS = {
+    "title": ["标题", "题目", "title"],
+    "hook": ["开头", "开场", "开篇", "第一句", "hook"],
+    "bullets": ["要点", "正文", "内容要点", "条目", "干货", "bullet"],
+    "cta": ["结尾", "互动", "引导", "行动引导", "收尾", "cta"],
+    "tags": ["标签", "tag"],
+}
+
+# A clause containing one of these keeps the fields it names
+KEEP_TERMS = ["不变", "不要变", "不要改", "不用改", "别改", "别动", "不要动", "保留"]
+
+_CLAUSE_RE = re.compile(r"[，。；！？,.;!?\n]+")
+
+_fields = AhoCorasick({term: field for field, terms in FIELD_TERMS.items() for term in terms})
+_keep = AhoCorasick({term: "keep" for term in KEEP_TERMS})
+
+
+def classify_instruction(instruction: str) -> Optional[List[str]]:
+    """
+    Fields a rewrite instruction asks to change, in DayContent order.
+    None means the instruction is about the whole post (tone, style,
+    or no field named) and every field should be regenerated.
+    """
+    change, keep = set(), set()
+    for clause in _CLAUSE_RE.split(instruction.lower()):
+        named = {field for _, field in _fields.find(clause)}
+        if not named:
+            continue
+        if _keep.find(clause):
+            keep |= named
+        else:
+            change |= named
+    if not change and keep:
+        change = set(FIELDS) - keep
+    if not change or change >= set(FIELDS):
+        return None
+    return [f for f in FIELDS if f in change]
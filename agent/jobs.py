@@ -0,0 +1,297 @@
+"""
+Background job queue for XHS Text Agent.
+LLM work runs on a bounded, process-wide worker pool so the Streamlit
+script thread only submits jobs and polls their status.
+"""
+
+import os
+import time
+import uuid
+import heapq
+import threading
+import contextvars
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+# Priority classes, lower runs first
+PRIORITY_REWRITE = 0
+PRIORITY_GENERATE = 1
+PRIORITY_REVIEW = 1
+PRIORITY_BATCH = 2
+PRIORITY_PREFETCH = 3
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_MAX_PENDING = int(os.getenv("JOB_MAX_PENDING", "256"))
+JOB_RESULT_TTL_SECONDS = 600.0
+QUEUE_WAIT_SAMPLES = 1000
+
+
+class QueueFullError(Exception):
+    """Raised when too many jobs are already waiting."""
+
+
+@dataclass
+class Job:
+    """A unit of background work and its lifecycle timestamps."""
+    id: str
+    key: Tuple[str, str, str]  # (session_id, kind, idempotency_key)
+    kind: str
+    priority: int
+    fn: Callable[..., Any] = field(repr=False)
+    args: Tuple[Any, ...] = field(default=(), repr=False)
+    kwargs: Dict[str, Any] = field(default_factory=dict, repr=False)
+    # Submitter's context vars (profiling sink, ...) carried to the worker
+    context: contextvars.Context = field(default_factory=contextvars.copy_context, repr=False)
+
+    status: str = QUEUED
+    result: Any = None
+    error: Optional[str] = None
+    progress: Optional[str] = None
+    # Predicted monotonic finish time of the current step, see report_eta
+    eta_at: Optional[float] = None
+    submitted_at: float = field(default_factory=time.monotonic)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    cancel_event: threading.Event = field(default_factory=threading.Event, repr=False)
+
+    @property
+    def is_active(self) -> bool:
+        return self.status in (QUEUED, RUNNING)
+
+    @property
+    def queue_wait(self) -> Optional[float]:
+        """Seconds spent waiting for a worker."""
+        if self.started_at is None:
+            return None
+        return self.started_at - self.submitted_at
+
+    @property
+    def elapsed(self) -> float:
+        """Seconds since submission (or total time once finished)."""
+        end = self.finished_at if self.finished_at is not None else time.monotonic()
+        return end - self.submitted_at
+
+    @property
+    def eta(self) -> Optional[float]:
+        """Predicted seconds left in the current step, if one was reported."""
+        if self.eta_at is None or not self.is_active:
+            return None
+        return max(0.0, self.eta_at - time.monotonic())
+
+
+# A context var rather than a thread-local, so helper threads started with
+# contextvars.copy_context().run (parallel candidates, month weeks) still
+# report progress and see cancellation of the job that spawned them
+_current_job: contextvars.ContextVar[Optional[Job]] = contextvars.ContextVar("current_job", default=None)
+
+
+def current_job() -> Optional[Job]:
+    """The job whose work is running in this context, if any."""
+    return _current_job.get()
+
+
+def report_progress(message: str):
+    """Let a running job publish a human-readable progress message."""
+    job = current_job()
+    if job is not None:
+        job.progress = message
+
+
+def report_eta(seconds: float):
+    """Let a running job publish how long its current step should take."""
+    job = current_job()
+    if job is not None:
+        job.eta_at = time.monotonic() + seconds
+
+
+def is_cancelled() -> bool:
+    """Cooperative cancellation check for long-running job functions."""
+    job = current_job()
+    return job is not None and job.cancel_event.is_set()
+
+
+class JobQueue:
+    """
+    Priority queue plus a fixed pool of daemon worker threads.
+    Submitting the same (session, kind, idempotency key) while a job is
+    queued, running or not yet collected returns the existing job.
+    """
+
+    def __init__(self, workers: int = JOB_WORKERS, max_pending: int = JOB_MAX_PENDING):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._cond = threading.Condition()
+        self._heap: List[Tuple[int, int, Job]] = []
+        self._seq = 0
+        self._jobs: Dict[str, Job] = {}
+        self._by_key: Dict[Tuple[str, str, str], str] = {}
+        self._threads: List[threading.Thread] = []
+        self._waits: Dict[int, Deque[float]] = {}
+
+    def _ensure_workers(self):
+        while len(self._threads) < self.workers:
+            t = threading.Thread(target=self._worker, name=f"job-worker-{len(self._threads)}", daemon=True)
+            self._threads.append(t)
+            t.start()
+
+    def submit(
+        self,
+        session_id: str,
+        kind: str,
+        fn: Callable[..., Any],
+        *args,
+        priority: int = PRIORITY_GENERATE,
+        idempotency_key: str = "",
+        **kwargs
+    ) -> Job:
+        """Queue fn(*args, **kwargs) or return the matching existing job."""
+        key = (session_id, kind, idempotency_key)
+        with self._cond:
+            self._expire_locked()
+            existing_id = self._by_key.get(key)
+            if existing_id is not None:
+                existing = self._jobs.get(existing_id)
+                if existing is not None and existing.status != CANCELLED:
+                    return existing
+
+            if len(self._heap) >= self.max_pending:
+                raise QueueFullError("当前排队任务过多，请稍后再试。")
+
+            job = Job(
+                id=uuid.uuid4().hex,
+                key=key,
+                kind=kind,
+                priority=priority,
+                fn=fn,
+                args=args,
+                kwargs=kwargs
+            )
+            self._jobs[job.id] = job
+            self._by_key[key] = job.id
+            self._seq += 1
+            heapq.heappush(self._heap, (priority, self._seq, job))
+            self._ensure_workers()
+            self._cond.notify()
+            return job
+
+    def get(self, job_id: Optional[str]) -> Optional[Job]:
+        if not job_id:
+            return None
+        with self._cond:
+            return self._jobs.get(job_id)
+
+    def collect(self, job_id: str) -> Optional[Job]:
+        """Take a finished job out of the queue so its key can be reused."""
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None or job.is_active:
+                return job
+            self._forget_locked(job)
+            return job
+
+    def cancel(self, job_id: Optional[str]) -> bool:
+        """
+        Cancel a job. Queued jobs never start; running jobs are flagged
+        (see is_cancelled) and their result is discarded.
+        """
+        with self._cond:
+            job = self._jobs.get(job_id or "")
+            if job is None or not job.is_active:
+                return False
+            job.cancel_event.set()
+            if job.status == QUEUED:
+                job.status = CANCELLED
+                job.finished_at = time.monotonic()
+                # Drop it from the heap now so it stops counting toward max_pending
+                self._heap = [entry for entry in self._heap if entry[2] is not job]
+                heapq.heapify(self._heap)
+            self._forget_locked(job)
+            return True
+
+    def _forget_locked(self, job: Job):
+        self._jobs.pop(job.id, None)
+        if self._by_key.get(job.key) == job.id:
+            del self._by_key[job.key]
+
+    def _expire_locked(self):
+        now = time.monotonic()
+        stale = [
+            job for job in self._jobs.values()
+            if not job.is_active and job.finished_at is not None
+            and now - job.finished_at > JOB_RESULT_TTL_SECONDS
+        ]
+        for job in stale:
+            self._forget_locked(job)
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self._heap:
+                    self._cond.wait()
+                _, _, job = heapq.heappop(self._heap)
+                if job.status == CANCELLED:
+                    continue
+                job.status = RUNNING
+                job.started_at = time.monotonic()
+                self._waits.setdefault(job.priority, deque(maxlen=QUEUE_WAIT_SAMPLES)).append(job.queue_wait)
+
+            try:
+                result = job.context.run(self._run, job)
+                status, error = DONE, None
+            except Exception as e:
+                result, status, error = None, FAILED, f"任务执行出错: {str(e)}"
+
+            with self._cond:
+                job.finished_at = time.monotonic()
+                if job.cancel_event.is_set():
+                    job.status = CANCELLED
+                else:
+                    job.result, job.status, job.error = result, status, error
+
+    @staticmethod
+    def _run(job: Job) -> Any:
+        """Run a job inside its own context (see Job.context)."""
+        token = _current_job.set(job)
+        try:
+            return job.fn(*job.args, **job.kwargs)
+        finally:
+            _current_job.reset(token)
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth and queue-wait statistics per priority class."""
+        with self._cond:
+            waits = {}
+            for priority, values in self._waits.items():
+                ordered = sorted(values)
+                waits[priority] = {
+                    "count": len(ordered),
+                    "mean": sum(ordered) / len(ordered),
+                    "p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+                    "max": ordered[-1]
+                }
+            return {
+                "pending": len(self._heap),
+                "running": sum(1 for j in self._jobs.values() if j.status == RUNNING),
+                "workers": len(self._threads),
+                "queue_wait": waits
+            }
+
+
+_queue: Optional[JobQueue] = None
+_queue_lock = threading.Lock()
+
+
+def get_job_queue() -> JobQueue:
+    """Process-wide job queue shared by all sessions."""
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = JobQueue()
+        return _queue
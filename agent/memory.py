@@ -0,0 +1,231 @@
+"""
+Per-process memory accounting and idle-session offload.
+Every AppState seen by get_state() is tracked here; plans of sessions
+idle longer than XHS_IDLE_OFFLOAD_SECONDS are written to a local store
+and loaded back transparently on the session's next get_state().
+States are held weakly, so a closed browser session is freed with its
+session_state; its offload file is deleted on the next sweep.
+"""
+
+import os
+import sys
+import json
+import time
+import tempfile
+import threading
+import weakref
+from typing import Any, Dict, List, Optional
+
+from .state import AppState, DayContent, WeeklyReview
+
+IDLE_OFFLOAD_SECONDS = float(os.getenv("XHS_IDLE_OFFLOAD_SECONDS", "1800"))
+# Sessions not seen for this long are dropped from the registry
+SESSION_TTL_SECONDS = float(os.getenv("XHS_SESSION_TTL_SECONDS", "86400"))
+SWEEP_INTERVAL_SECONDS = 60.0
+OFFLOAD_DIR = os.getenv("XHS_OFFLOAD_DIR") or os.path.join(tempfile.gettempdir(), "xhs-text-agent-offload")
+
+
+def deep_sizeof(obj: Any, seen: Optional[set] = None) -> int:
+    """Approximate retained size of an object graph in bytes."""
+    seen = seen if seen is not None else set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(k, seen) + deep_sizeof(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_sizeof(item, seen) for item in obj)
+    elif hasattr(obj, "__slots__"):
+        size += sum(deep_sizeof(getattr(obj, s), seen) for s in obj.__slots__ if hasattr(obj, s))
+    elif hasattr(obj, "__dict__"):
+        size += deep_sizeof(vars(obj), seen)
+    return size
+
+
+class PlanStore:
+    """One JSON file per offloaded session."""
+
+    def __init__(self, directory: str = OFFLOAD_DIR):
+        self.directory = directory
+        self._checked = False
+
+    def _path(self, session_id: str) -> str:
+        return os.path.join(self.directory, f"{session_id}.json")
+
+    def _ensure_dir(self):
+        """
+        Plans are user content: keep them in a 0700 directory we own (the
+        default location is the shared tmpdir), and drop files not written
+        for SESSION_TTL_SECONDS (left by earlier processes, whose sessions
+        can never be rehydrated).
+        """
+        if self._checked:
+            return
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+        if os.stat(self.directory).st_uid != os.getuid():
+            raise PermissionError(f"offload directory {self.directory} is owned by another user")
+        os.chmod(self.directory, 0o700)
+        self.prune(SESSION_TTL_SECONDS)
+        self._checked = True
+
+    def prune(self, max_age: float) -> int:
+        """Delete offload files not written for max_age seconds. Returns count."""
+        cutoff = time.time() - max_age
+        removed = 0
+        for entry in os.scandir(self.directory):
+            try:
+                if entry.is_file() and entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+                    removed += 1
+            except OSError:
+                pass
+        return removed
+
+    def save(self, session_id: str, data: Dict[str, Any]):
+        self._ensure_dir()
+        tmp = self._path(session_id) + ".tmp"
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp, self._path(session_id))
+
+    def load(self, session_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._path(session_id), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def delete(self, session_id: str):
+        try:
+            os.remove(self._path(session_id))
+        except OSError:
+            pass
+
+
+class SessionRegistry:
+    """Tracks live session states, their last access and offload status."""
+
+    def __init__(self, store: Optional[PlanStore] = None, idle_seconds: float = IDLE_OFFLOAD_SECONDS):
+        self.store = store or PlanStore()
+        self.idle_seconds = idle_seconds
+        self._lock = threading.Lock()
+        self._sessions: "weakref.WeakValueDictionary[str, AppState]" = weakref.WeakValueDictionary()
+        self._last_access: Dict[str, float] = {}
+        self._last_sweep = time.monotonic()
+
+    def touch(self, state: AppState):
+        """Mark a session active, rehydrating its plan if it was offloaded."""
+        now = time.monotonic()
+        with self._lock:
+            self._sessions[state.session_id] = state
+            self._last_access[state.session_id] = now
+            if state.offloaded:
+                self._rehydrate(state)
+            due = now - self._last_sweep >= SWEEP_INTERVAL_SECONDS
+            if due:
+                self._last_sweep = now
+        if due:
+            self.sweep()
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        """Offload idle sessions and forget expired ones. Returns offload count."""
+        now = now if now is not None else time.monotonic()
+        expired, idle = [], []
+        with self._lock:
+            for session_id, last in list(self._last_access.items()):
+                state = self._sessions.get(session_id)
+                if state is None or now - last >= SESSION_TTL_SECONDS:
+                    # Session ended (state collected) or expired
+                    self._sessions.pop(session_id, None)
+                    del self._last_access[session_id]
+                    expired.append(session_id)
+                elif now - last >= self.idle_seconds:
+                    idle.append((state, last))
+        for session_id in expired:
+            self.store.delete(session_id)
+        return sum(1 for state, last in idle if self._offload(state, last))
+
+    def _offload(self, state: AppState, last: float) -> bool:
+        """
+        Write the plan to the store, then drop it from memory unless the
+        session was touched since last (its last access at sweep time).
+        """
+        if state.offloaded or not state.weekly_plan or state.has_active_jobs():
+            return False
+        data = {
+            "weekly_plan": [d.to_dict() for d in state.weekly_plan],
+            "plan_weeks": [[d.to_dict() for d in week] for week in state.plan_weeks],
+            "plan_alternatives": [[d.to_dict() for d in plan] for plan in state.plan_alternatives],
+            "weekly_review": state.weekly_review.to_dict() if state.weekly_review else None
+        }
+        self.store.save(state.session_id, data)
+        with self._lock:
+            swap = (self._last_access.get(state.session_id) == last
+                    and not state.offloaded and not state.has_active_jobs())
+            if swap:
+                state.compact()
+                state.weekly_plan = []
+                state.plan_weeks = []
+                state.plan_alternatives = []
+                state.weekly_review = None
+                state.offloaded = True
+        if not swap:
+            # Back in use while the file was written: keep the plan in memory
+            self.store.delete(state.session_id)
+        return swap
+
+    def _rehydrate(self, state: AppState):
+        data = self.store.load(state.session_id)
+        state.offloaded = False
+        if data is None:
+            return
+        weeks = [[DayContent.from_dict(d) for d in week] for week in data.get("plan_weeks", [])]
+        if weeks:
+            # Restore the alias between weekly_plan and the current week
+            state.plan_weeks = weeks
+            state.weekly_plan = weeks[min(state.current_week, len(weeks) - 1)]
+        else:
+            state.weekly_plan = [DayContent.from_dict(d) for d in data["weekly_plan"]]
+        state.plan_alternatives = [
+            [DayContent.from_dict(d) for d in plan] for plan in data.get("plan_alternatives", [])
+        ]
+        if data.get("weekly_review"):
+            state.weekly_review = WeeklyReview.from_dict(data["weekly_review"])
+        self.store.delete(state.session_id)
+
+    def report(self) -> Dict[str, Any]:
+        """Per-session and total in-memory size of tracked states."""
+        now = time.monotonic()
+        with self._lock:
+            sessions: List[Dict[str, Any]] = [
+                {
+                    "session_id": session_id,
+                    "bytes": deep_sizeof(state),
+                    "days": sum(len(w) for w in state.plan_weeks) or len(state.weekly_plan),
+                    "idle_seconds": now - self._last_access.get(session_id, now),
+                    "offloaded": state.offloaded
+                }
+                for session_id, state in list(self._sessions.items())
+            ]
+        sessions.sort(key=lambda s: s["bytes"], reverse=True)
+        return {
+            "sessions": len(sessions),
+            "offloaded": sum(1 for s in sessions if s["offloaded"]),
+            "total_bytes": sum(s["bytes"] for s in sessions),
+            "top": sessions[:20]
+        }
+
+
+_registry: Optional[SessionRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_session_registry() -> SessionRegistry:
+    """Process-wide session registry."""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = SessionRegistry()
+        return _registry
@@ -0,0 +1,132 @@
+"""
+Opt-in profiling for XHS Text Agent.
+Times views, reruns and agent calls into per-session records and
+process-wide per-name histograms. Disabled by default; when disabled a
+timed call costs a flag check and a context variable lookup.
+
+Enable for the whole process with XHS_PROFILE=1 (or enable()), or for one
+session's context with enable_session() (e.g. from ?profile=1); jobs the
+session submits carry the setting to their worker.
+"""
+
+import os
+import json
+import time
+import bisect
+import threading
+import functools
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+
+# Histogram bucket upper bounds in milliseconds (last bucket is open-ended)
+BUCKETS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000]
+SESSION_RECORDS = 200
+
+_enabled = os.getenv("XHS_PROFILE") == "1"
+_session_enabled: ContextVar[bool] = ContextVar("profiling_enabled", default=False)
+
+# Per-session sink of (name, ms); propagated to job workers via contextvars
+_session_sink: ContextVar[Optional[Deque[Tuple[str, float]]]] = ContextVar("profiling_sink", default=None)
+
+_hist_lock = threading.Lock()
+_histograms: Dict[str, Dict[str, Any]] = {}
+
+
+def is_enabled() -> bool:
+    return _enabled or _session_enabled.get()
+
+
+def enable(on: bool = True):
+    """Profile every session in the process."""
+    global _enabled
+    _enabled = on
+
+
+def enable_session(on: bool = True):
+    """Profile only work done in this context (one session's reruns and jobs)."""
+    _session_enabled.set(on)
+
+
+def new_session_sink() -> Deque[Tuple[str, float]]:
+    return deque(maxlen=SESSION_RECORDS)
+
+
+def bind_session(sink: Optional[Deque[Tuple[str, float]]]):
+    """Route timings recorded in this context to a session's sink."""
+    _session_sink.set(sink)
+
+
+def record(name: str, seconds: float):
+    """Add one timing to the histograms and the current session sink."""
+    ms = seconds * 1000.0
+    sink = _session_sink.get()
+    if sink is not None:
+        sink.append((name, ms))
+    with _hist_lock:
+        hist = _histograms.get(name)
+        if hist is None:
+            hist = {"count": 0, "total_ms": 0.0, "max_ms": 0.0, "buckets": [0] * (len(BUCKETS_MS) + 1)}
+            _histograms[name] = hist
+        hist["count"] += 1
+        hist["total_ms"] += ms
+        hist["max_ms"] = max(hist["max_ms"], ms)
+        hist["buckets"][bisect.bisect_left(BUCKETS_MS, ms)] += 1
+
+
+@contextmanager
+def span(name: str):
+    """Time a block when profiling is enabled."""
+    if not (_enabled or _session_enabled.get()):
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start)
+
+
+def timed(name: Optional[str] = None) -> Callable:
+    """Decorator form of span(); defaults to the function's qualified name."""
+    def decorator(fn: Callable) -> Callable:
+        label = name or f"{fn.__module__}.{fn.__qualname__}"
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not (_enabled or _session_enabled.get()):
+                return fn(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                record(label, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+def histogram_snapshot() -> Dict[str, Dict[str, Any]]:
+    """Copy of the aggregate histograms with bucket labels and mean."""
+    labels = [f"<={b}ms" for b in BUCKETS_MS] + [f">{BUCKETS_MS[-1]}ms"]
+    with _hist_lock:
+        snapshot = {}
+        for name, hist in _histograms.items():
+            snapshot[name] = {
+                "count": hist["count"],
+                "mean_ms": hist["total_ms"] / hist["count"],
+                "max_ms": hist["max_ms"],
+                "buckets": {label: n for label, n in zip(labels, hist["buckets"]) if n}
+            }
+        return snapshot
+
+
+def dump_histograms(path: str):
+    """Write the aggregate histograms to a JSON file."""
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(histogram_snapshot(), f, ensure_ascii=False, indent=2)
+
+
+def reset_histograms():
+    with _hist_lock:
+        _histograms.clear()
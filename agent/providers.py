@@ -0,0 +1,391 @@
+"""
+LLM provider backends for XHS Text Agent.
+Routes OpenAI-compatible chat calls across configured endpoints
+(DashScope, self-hosted llama.cpp/vLLM servers, ...) by observed
+latency and error rate, with per-backend circuit breakers.
+"""
+
+import os
+import json
+import time
+import threading
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+
+from .breaker import CircuitBreaker, CircuitOpenError, get_breaker, CLOSED
+
+if TYPE_CHECKING:
+    # openai pulls in httpx/pydantic; only import it on first real call
+    from openai import OpenAI
+
+# 通义千问 DashScope OpenAI 兼容接口
+DASHSCOPE_BASE_URL = "https://dashscope.aliyuncs.com/compatible-mode/v1"
+
+# Fail fast instead of the SDK's 10 minute default. Both the timeout and
+# the breaker's slow-call threshold are a base (connection, queueing,
+# prefill) plus the expected output at a floor throughput, so a full
+# 7-day plan (~50s at normal speed) is neither cut off nor counted slow.
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "60"))
+LLM_TIMEOUT_TOKENS_PER_SECOND = float(os.getenv("LLM_TIMEOUT_TOKENS_PER_SECOND", "10"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "1"))
+
+# Breaker thresholds (per backend/model)
+BREAKER_FAILURE_RATE = float(os.getenv("LLM_BREAKER_FAILURE_RATE", "0.5"))
+BREAKER_SLOW_CALL_SECONDS = float(os.getenv("LLM_BREAKER_SLOW_CALL_SECONDS", "30"))
+BREAKER_SLOW_TOKENS_PER_SECOND = float(os.getenv("LLM_BREAKER_SLOW_TOKENS_PER_SECOND", "20"))
+BREAKER_OPEN_SECONDS = float(os.getenv("LLM_BREAKER_OPEN_SECONDS", "30"))
+
+# Routing
+EWMA_ALPHA = 0.3
+ERROR_PENALTY = 4.0  # score = latency * (1 + ERROR_PENALTY * error_rate)
+HEALTH_CHECK_INTERVAL = float(os.getenv("LLM_HEALTH_CHECK_INTERVAL", "30"))
+HEALTH_CHECK_TIMEOUT = 5.0
+
+# Context cache: DashScope caches repeated prompt prefixes implicitly;
+# "explicit" also marks the system message for its explicit cache
+PROMPT_CACHE = os.getenv("XHS_PROMPT_CACHE", "implicit")
+EXPLICIT_CACHE_CONTROL = {"type": "ephemeral"}
+
+
+@dataclass
+class Backend:
+    """One OpenAI-compatible endpoint plus its observed performance."""
+    name: str
+    base_url: str
+    api_key: str
+    model: Optional[str] = None  # overrides the requested model (local servers)
+    cache_control: bool = False  # mark system messages for explicit context caching
+
+    ewma_latency: Optional[float] = None
+    ewma_error: float = 0.0
+    healthy: bool = True
+    # Context-cache telemetry from usage.prompt_tokens_details.cached_tokens
+    prompt_tokens: int = 0
+    cached_tokens: int = 0
+    cache_hits: int = 0
+    cache_misses: int = 0
+    hit_seconds: float = 0.0
+    miss_seconds: float = 0.0
+    _client: Optional["OpenAI"] = field(default=None, repr=False)
+
+    @property
+    def client(self) -> "OpenAI":
+        if self._client is None:
+            from openai import OpenAI
+            self._client = OpenAI(
+                api_key=self.api_key,
+                base_url=self.base_url,
+                timeout=LLM_TIMEOUT_SECONDS,
+                max_retries=LLM_MAX_RETRIES
+            )
+        return self._client
+
+    def resolve_model(self, model: str) -> str:
+        return self.model or model
+
+    def breaker(self, model: str) -> CircuitBreaker:
+        return get_breaker(
+            f"{self.name}|{self.base_url}|{self.resolve_model(model)}",
+            failure_rate_threshold=BREAKER_FAILURE_RATE,
+            slow_call_seconds=BREAKER_SLOW_CALL_SECONDS,
+            open_seconds=BREAKER_OPEN_SECONDS
+        )
+
+    def observe(self, elapsed: Optional[float], ok: bool):
+        """Fold one call outcome into the EWMA statistics."""
+        self.ewma_error = EWMA_ALPHA * (0.0 if ok else 1.0) + (1 - EWMA_ALPHA) * self.ewma_error
+        if ok and elapsed is not None:
+            if self.ewma_latency is None:
+                self.ewma_latency = elapsed
+            else:
+                self.ewma_latency = EWMA_ALPHA * elapsed + (1 - EWMA_ALPHA) * self.ewma_latency
+
+    def observe_cache(self, usage: Any, elapsed: float):
+        """Count cached prompt tokens of one successful call."""
+        prompt_tokens = getattr(usage, "prompt_tokens", None)
+        if not prompt_tokens:
+            return
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached = getattr(details, "cached_tokens", None) or 0
+        self.prompt_tokens += prompt_tokens
+        self.cached_tokens += cached
+        if cached:
+            self.cache_hits += 1
+            self.hit_seconds += elapsed
+        else:
+            self.cache_misses += 1
+            self.miss_seconds += elapsed
+
+    def score(self) -> float:
+        """Lower is better. Unmeasured backends score 0 so they get tried."""
+        if self.ewma_latency is None:
+            return 0.0 if self.ewma_error == 0.0 else float("inf")
+        return self.ewma_latency * (1 + ERROR_PENALTY * self.ewma_error)
+
+
+def call_timeout(output_tokens: Optional[int]) -> float:
+    """Request timeout for a call expected to produce output_tokens."""
+    return LLM_TIMEOUT_SECONDS + (output_tokens or 0) / LLM_TIMEOUT_TOKENS_PER_SECOND
+
+
+def slow_call_threshold(output_tokens: Optional[int]) -> float:
+    """Seconds after which a call expected to produce output_tokens counts as slow."""
+    return BREAKER_SLOW_CALL_SECONDS + (output_tokens or 0) / BREAKER_SLOW_TOKENS_PER_SECOND
+
+
+def is_backend_failure(error: Exception) -> bool:
+    """
+    Whether an error says the backend is unhealthy: timeouts, connection
+    errors, 429 and 5xx. Other 4xx (bad request, auth, content filter)
+    are about the request and would fail on any backend.
+    """
+    status = getattr(error, "status_code", None)
+    if isinstance(status, int):
+        return status == 429 or status >= 500
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    try:
+        from openai import APIConnectionError  # includes APITimeoutError
+    except ImportError:
+        return False
+    return isinstance(error, APIConnectionError)
+
+
+def with_cache_control(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Copy of messages with the system message marked for explicit caching."""
+    marked = []
+    for message in messages:
+        if message.get("role") == "system" and isinstance(message.get("content"), str):
+            message = {
+                "role": "system",
+                "content": [{"type": "text", "text": message["content"], "cache_control": EXPLICIT_CACHE_CONTROL}]
+            }
+        marked.append(message)
+    return marked
+
+
+def load_backends_from_env() -> List[Backend]:
+    """
+    Build the backend list from the environment.
+
+    LLM_BACKENDS: JSON list of {"name", "base_url", "api_key" | "api_key_env", "model", "cache_control"}
+    Otherwise DashScope (DASHSCOPE_API_KEY) plus an optional local server
+    (LOCAL_LLM_BASE_URL, LOCAL_LLM_MODEL, LOCAL_LLM_API_KEY).
+    """
+    raw = os.getenv("LLM_BACKENDS")
+    if raw:
+        backends = []
+        for item in json.loads(raw):
+            api_key = item.get("api_key") or os.getenv(item.get("api_key_env", ""), "")
+            if not api_key:
+                continue
+            backends.append(Backend(
+                name=item["name"],
+                base_url=item["base_url"],
+                api_key=api_key,
+                model=item.get("model"),
+                cache_control=item.get("cache_control", False)
+            ))
+        return backends
+
+    backends = []
+    dashscope_key = os.getenv("DASHSCOPE_API_KEY")
+    if dashscope_key:
+        backends.append(Backend(
+            name="dashscope",
+            base_url=DASHSCOPE_BASE_URL,
+            api_key=dashscope_key,
+            cache_control=PROMPT_CACHE == "explicit"
+        ))
+    local_url = os.getenv("LOCAL_LLM_BASE_URL")
+    if local_url:
+        backends.append(Backend(
+            name="local",
+            base_url=local_url,
+            api_key=os.getenv("LOCAL_LLM_API_KEY", "local"),
+            model=os.getenv("LOCAL_LLM_MODEL") or None
+        ))
+    return backends
+
+
+def load_pins_from_env() -> Dict[str, str]:
+    """LLM_PINS="review:local,rewrite:dashscope" -> {"review": "local", ...}"""
+    pins = {}
+    for part in os.getenv("LLM_PINS", "").split(","):
+        if ":" in part:
+            operation, name = part.split(":", 1)
+            pins[operation.strip()] = name.strip()
+    return pins
+
+
+class ProviderRouter:
+    """
+    Picks a backend per call and fails over to the next one on error.
+    Operations pinned to a backend only ever use that backend.
+    """
+
+    def __init__(self, backends: List[Backend], pins: Optional[Dict[str, str]] = None):
+        self.backends = backends
+        self.pins = pins or {}
+        self._lock = threading.Lock()
+        self._health_thread: Optional[threading.Thread] = None
+
+    def get_backend(self, name: str) -> Optional[Backend]:
+        for backend in self.backends:
+            if backend.name == name:
+                return backend
+        return None
+
+    def candidates(self, operation: Optional[str], model: str) -> List[Backend]:
+        """Backends to try, best first."""
+        pinned = self.pins.get(operation or "")
+        if pinned:
+            backend = self.get_backend(pinned)
+            return [backend] if backend else []
+
+        with self._lock:
+            ranked = sorted(self.backends, key=lambda b: b.score())
+        # Unhealthy or tripped backends are kept as a last resort
+        usable = [b for b in ranked if b.healthy and b.breaker(model).state == CLOSED]
+        rest = [b for b in ranked if b not in usable]
+        return usable + rest
+
+    def complete(
+        self,
+        messages: List[Dict[str, Any]],
+        model: str,
+        operation: Optional[str] = None,
+        expected_output_tokens: Optional[int] = None,
+        **params
+    ) -> Any:
+        """
+        Run a chat completion on the best available backend.
+        expected_output_tokens scales the timeout and slow-call threshold.
+        Errors that are not backend failures (see is_backend_failure) are
+        raised without failing over or counting against the breaker.
+        """
+        timeout = call_timeout(expected_output_tokens)
+        slow_after = slow_call_threshold(expected_output_tokens)
+        candidates = self.candidates(operation, model)
+        if not candidates:
+            raise RuntimeError(f"没有可用的模型服务（operation={operation}）")
+
+        last_error: Optional[Exception] = None
+        for backend in candidates:
+            breaker = backend.breaker(model)
+            try:
+                breaker.before_call()
+            except CircuitOpenError as e:
+                last_error = e
+                continue
+
+            start = time.monotonic()
+            try:
+                response = backend.client.chat.completions.create(
+                    model=backend.resolve_model(model),
+                    messages=with_cache_control(messages) if backend.cache_control else messages,
+                    timeout=timeout,
+                    **params
+                )
+            except Exception as e:
+                if not is_backend_failure(e):
+                    breaker.release()
+                    raise
+                breaker.record_failure()
+                with self._lock:
+                    backend.observe(None, ok=False)
+                last_error = e
+                continue
+
+            elapsed = time.monotonic() - start
+            breaker.record_success(elapsed, slow_after)
+            with self._lock:
+                backend.observe(elapsed, ok=True)
+                backend.observe_cache(getattr(response, "usage", None), elapsed)
+            return response
+
+        raise last_error
+
+    def is_degraded(self, model: str) -> bool:
+        """True when no backend can currently take calls for this model."""
+        return all(b.breaker(model).state != CLOSED for b in self.backends)
+
+    def check_health(self):
+        """Probe every backend's /models endpoint."""
+        for backend in self.backends:
+            try:
+                backend.client.with_options(timeout=HEALTH_CHECK_TIMEOUT, max_retries=0).models.list()
+                healthy = True
+            except Exception:
+                healthy = False
+            with self._lock:
+                backend.healthy = healthy
+
+    def start_health_checks(self, interval: float = HEALTH_CHECK_INTERVAL):
+        """Run check_health periodically on a daemon thread (idempotent)."""
+        if self._health_thread is not None or len(self.backends) < 2:
+            return
+
+        def loop():
+            while True:
+                self.check_health()
+                time.sleep(interval)
+
+        self._health_thread = threading.Thread(target=loop, name="llm-health", daemon=True)
+        self._health_thread.start()
+
+    def stats(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [
+                {
+                    "name": b.name,
+                    "base_url": b.base_url,
+                    "healthy": b.healthy,
+                    "ewma_latency": b.ewma_latency,
+                    "ewma_error": b.ewma_error,
+                    "cached_share": b.cached_tokens / b.prompt_tokens if b.prompt_tokens else None,
+                    "cache_hits": b.cache_hits,
+                    "cache_misses": b.cache_misses,
+                    "hit_latency": b.hit_seconds / b.cache_hits if b.cache_hits else None,
+                    "miss_latency": b.miss_seconds / b.cache_misses if b.cache_misses else None
+                }
+                for b in self.backends
+            ]
+
+
+_router: Optional[ProviderRouter] = None
+_router_lock = threading.Lock()
+
+
+def get_router() -> Optional[ProviderRouter]:
+    """Process-wide router built from the environment, or None if nothing is configured."""
+    global _router
+    with _router_lock:
+        if _router is None:
+            backends = load_backends_from_env()
+            if not backends:
+                return None
+            _router = ProviderRouter(backends, load_pins_from_env())
+            _router.start_health_checks()
+        return _router
+
+
+def warm_up():
+    """
+    Import openai and build backend clients on a background thread, so
+    the first real LLM call doesn't pay for it. Safe to call repeatedly.
+    """
+    def load():
+        router = get_router()
+        if router is not None:
+            for backend in router.backends:
+                backend.client
+
+    threading.Thread(target=load, name="llm-warm-up", daemon=True).start()
+
+
+def set_router(router: Optional[ProviderRouter]):
+    """Replace the process-wide router (tests, load tests, batch jobs)."""
+    global _router
+    with _router_lock:
+        _router = router
@@ -0,0 +1,210 @@
+"""
+Local content rules for XHS Text Agent.
+Checks every generated DayContent against the user's constraints with an
+Aho-Corasick matcher over per-constraint lexicons, plus effort-aware
+bullet count and length rules that apply to every plan. The prompts state the same limits (bullet_rule), so ordinary output passes.
+Violations name the field so only that field (or day) needs regenerating.
+"""
+
+import os
+import json
+from collections import deque
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+# Terms that break each onboarding constraint
+CONSTRAINT_LEXICONS: Dict[str, List[str]] = {
+    "不谈金钱/收入": [
+        "收入", "工资", "月薪", "年薪", "薪资", "赚钱", "搞钱", "变现", "存款", "理财收益",
+        "月入", "年入", "日入", "副业收入", "躺赚", "暴富", "多少钱", "万元", "收益"
+    ],
+    "不谈情感隐私": [
+        "恋爱", "男朋友", "女朋友", "前任", "分手", "暗恋", "表白", "离婚", "出轨",
+        "相亲", "婚姻", "老公", "老婆", "感情史", "私生活"
+    ],
+    "不涉及争议话题": [
+        "政治", "宗教", "性别对立", "地域黑", "键盘侠", "撕逼", "互撕", "骂战", "站队", "阴谋论",
+        "敏感话题", "吵架", "网暴"
+    ],
+}
+
+# Effort level -> (min bullets, max bullets, max chars per bullet)
+EFFORT_RULES: Dict[str, Tuple[int, int, int]] = {
+    "很少(1-2条/周)": (3, 4, 30),
+    "一般(3-4条/周)": (3, 5, 50),
+    "还可以(5-7条/周)": (3, 6, 80),
+    "不确定你来安排": (3, 5, 50),
+}
+DEFAULT_EFFORT_RULE = (3, 6, 80)
+MAX_TITLE_CHARS = 30
+MAX_HOOK_CHARS = 120
+
+LEXICON_PATH = os.getenv("XHS_RULES_LEXICON")
+# Shorter lexicon terms (e.g. from XHS_RULES_LEXICON) are ignored
+MIN_TERM_CHARS = 2
+
+FIELDS = ("title", "hook", "bullets", "cta", "tags")
+
+
+@dataclass
+class Violation:
+    """One broken rule, located to a day and field."""
+    day: int
+    field: str
+    rule: str  # constraint name, or "bullet_count" / "length"
+    detail: str
+
+
+class AhoCorasick:
+    """Multi-pattern substring matcher over a fixed set of terms."""
+
+    def __init__(self, patterns: Dict[str, str]):
+        """patterns maps term -> label reported on match."""
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[Tuple[str, str]]] = [[]]
+        for term, label in patterns.items():
+            self._insert(term, label)
+        self._build()
+
+    def _insert(self, term: str, label: str):
+        node = 0
+        for ch in term:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            node = nxt
+        self._out[node].append((term, label))
+
+    def _build(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                target = self._goto[fail].get(ch, 0)
+                self._fail[child] = target if target != child else 0
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+
+    def find(self, text: str) -> List[Tuple[str, str]]:
+        """All (term, label) occurrences in text, in order of match end."""
+        goto, fail, out = self._goto, self._fail, self._out
+        node = 0
+        found = []
+        for ch in text:
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if out[node]:
+                found.extend(out[node])
+        return found
+
+
+def _load_lexicons() -> Dict[str, List[str]]:
+    lexicons = {name: list(terms) for name, terms in CONSTRAINT_LEXICONS.items()}
+    if LEXICON_PATH and os.path.exists(LEXICON_PATH):
+        with open(LEXICON_PATH, encoding="utf-8") as f:
+            for name, terms in json.load(f).items():
+                lexicons.setdefault(name, []).extend(terms)
+    return lexicons
+
+
+_LEXICONS = _load_lexicons()
+
+
+@lru_cache(maxsize=16)
+def _matcher(constraints: Tuple[str, ...]) -> Optional[AhoCorasick]:
+    patterns = {}
+    for name in constraints:
+        for term in _LEXICONS.get(name, []):
+            # A single character matches inside ordinary words (撕 in 手撕鸡)
+            if len(term) >= MIN_TERM_CHARS:
+                patterns.setdefault(term, name)
+    return AhoCorasick(patterns) if patterns else None
+
+
+def check_day(day, constraints: List[str], effort: Optional[str]) -> List[Violation]:
+    """Rule violations of one DayContent."""
+    violations = []
+    # Lexicon rules come from the user's constraints; size rules always apply
+    matcher = _matcher(tuple(sorted(constraints))) if constraints else None
+    if matcher is not None:
+        texts = {
+            "title": day.title,
+            "hook": day.hook,
+            "bullets": "\n".join(day.bullets),
+            "cta": day.cta,
+            "tags": " ".join(day.tags),
+        }
+        for field, text in texts.items():
+            hits = matcher.find(text)
+            if hits:
+                terms = "、".join(sorted({term for term, _ in hits}))
+                rules = sorted({label for _, label in hits})
+                violations.append(Violation(day.day, field, "、".join(rules), f"包含「{terms}」"))
+
+    min_bullets, max_bullets, max_chars = EFFORT_RULES.get(effort or "", DEFAULT_EFFORT_RULE)
+    if not min_bullets <= len(day.bullets) <= max_bullets:
+        violations.append(Violation(
+            day.day, "bullets", "bullet_count",
+            f"要点数量应为{min_bullets}-{max_bullets}个（当前{len(day.bullets)}个）"
+        ))
+    elif any(len(b) > max_chars for b in day.bullets):
+        violations.append(Violation(day.day, "bullets", "length", f"每个要点不超过{max_chars}字"))
+    if len(day.title) > MAX_TITLE_CHARS:
+        violations.append(Violation(day.day, "title", "length", f"标题不超过{MAX_TITLE_CHARS}字"))
+    if len(day.hook) > MAX_HOOK_CHARS:
+        violations.append(Violation(day.day, "hook", "length", f"开头不超过{MAX_HOOK_CHARS}字"))
+    return violations
+
+
+def bullet_rule(effort: Optional[str]) -> str:
+    """The effort level's bullet limits, as worded in the prompts."""
+    min_bullets, max_bullets, max_chars = EFFORT_RULES.get(effort or "", DEFAULT_EFFORT_RULE)
+    return f"{min_bullets}-{max_bullets}个，每个不超过{max_chars}字"
+
+
+def strip_violating_tags(day, constraints: List[str]) -> bool:
+    """Drop tags that hit a constraint lexicon. Returns True if any were dropped."""
+    matcher = _matcher(tuple(sorted(constraints)))
+    if matcher is None:
+        return False
+    kept = [tag for tag in day.tags if not matcher.find(tag)]
+    if len(kept) == len(day.tags):
+        return False
+    day.tags = kept
+    return True
+
+
+def check_plan(days: List, constraints: List[str], effort: Optional[str]) -> List[Violation]:
+    violations = []
+    for day in days:
+        violations.extend(check_day(day, constraints, effort))
+    return violations
+
+
+def violations_by_day(violations: List[Violation]) -> Dict[int, List[Violation]]:
+    grouped: Dict[int, List[Violation]] = {}
+    for v in violations:
+        grouped.setdefault(v.day, []).append(v)
+    return grouped
+
+
+def describe(violations: List[Violation]) -> str:
+    """Human-readable guidance for a regeneration prompt."""
+    field_names = {"title": "标题", "hook": "开头", "bullets": "要点", "cta": "互动引导", "tags": "标签"}
+    lines = []
+    for v in violations:
+        if v.rule in ("bullet_count", "length"):
+            lines.append(f"- {field_names[v.field]}：{v.detail}")
+        else:
+            lines.append(f"- {field_names[v.field]}：{v.detail}，违反了「{v.rule}」，请完全避开相关话题")
+    return "\n".join(lines)
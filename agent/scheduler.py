@@ -0,0 +1,302 @@
+"""
+Fair-share scheduling of LLM calls across tenants.
+Every call_llm takes a slot from a process-wide scheduler first. Waiting
+calls are served by priority class (interactive rewrite, interactive
+generate, batch, prefetch), and within a class by deficit round robin
+over tenants, so a tenant's share of calls is proportional to its weight
+however many calls it queues. Tenants are also capped in concurrent calls
+and, optionally, in tokens per minute.
+
+The tenant (a session id, or an agency name for bulk work) and priority
+live in context variables, which background jobs carry to their worker.
+"""
+
+import os
+import json
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, Iterator, List, Optional
+
+from .jobs import PRIORITY_GENERATE, current_job, is_cancelled
+
+DEFAULT_TENANT = "default"
+
+# Calls in flight across all tenants (the provider's concurrency quota)
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+TENANT_MAX_CONCURRENCY = int(os.getenv("XHS_TENANT_MAX_CONCURRENCY", "4"))
+# 0 = no token quota
+TENANT_TOKENS_PER_MINUTE = int(os.getenv("XHS_TENANT_TOKENS_PER_MINUTE", "0"))
+# {"tenant": weight}; unlisted tenants weigh 1
+TENANT_WEIGHTS: Dict[str, float] = json.loads(os.getenv("XHS_TENANT_WEIGHTS") or "{}")
+# Tokens of credit per round robin visit at weight 1
+DRR_QUANTUM = 2000
+SCHEDULE_TIMEOUT_SECONDS = float(os.getenv("XHS_SCHEDULE_TIMEOUT_SECONDS", "120"))
+# Waiters recheck quotas and cancellation this often
+RECHECK_SECONDS = 0.5
+WAIT_SAMPLES = 1000
+THROUGHPUT_WINDOW_SECONDS = 60.0
+# Tenants with nothing queued or running for this long are forgotten
+TENANT_IDLE_SECONDS = 3600.0
+
+_tenant: ContextVar[Optional[str]] = ContextVar("llm_tenant", default=None)
+_priority: ContextVar[Optional[int]] = ContextVar("llm_priority", default=None)
+
+
+class ScheduleTimeoutError(Exception):
+    """Raised when a call waited too long for a slot (or its job was cancelled)."""
+
+
+def set_tenant(tenant: Optional[str], priority: Optional[int] = None):
+    """Attribute LLM calls made in this context (and jobs submitted from it)."""
+    _tenant.set(tenant)
+    _priority.set(priority)
+
+
+@contextmanager
+def llm_tenant(tenant: str, priority: Optional[int] = None) -> Iterator[None]:
+    """Temporarily attribute LLM calls, e.g. llm_tenant("agency", PRIORITY_BATCH)."""
+    tenant_token = _tenant.set(tenant)
+    priority_token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _tenant.reset(tenant_token)
+        _priority.reset(priority_token)
+
+
+def current_tenant() -> str:
+    return _tenant.get() or DEFAULT_TENANT
+
+
+def current_priority() -> int:
+    """Explicit priority, else the running job's, else interactive generate."""
+    priority = _priority.get()
+    if priority is not None:
+        return priority
+    job = current_job()
+    return job.priority if job is not None else PRIORITY_GENERATE
+
+
+@dataclass
+class Ticket:
+    """One waiting or running call."""
+    tenant: str
+    priority: int
+    cost: int  # estimated tokens, charged at grant
+    queued_at: float = field(default_factory=time.monotonic)
+    granted_at: Optional[float] = None
+    tokens: Optional[int] = None  # actual tokens, set by the caller when known
+    event: threading.Event = field(default_factory=threading.Event, repr=False)
+
+
+class _Tenant:
+    """Queues and accounting of one tenant."""
+
+    def __init__(self, name: str, tokens_per_minute: int):
+        self.name = name
+        self.weight = float(TENANT_WEIGHTS.get(name, 1.0))
+        self.queues: Dict[int, Deque[Ticket]] = {}
+        self.deficit: Dict[int, float] = {}
+        self.running = 0
+        self.capacity = tokens_per_minute
+        self.bucket = float(tokens_per_minute)
+        self.refilled_at = time.monotonic()
+        self.calls = 0
+        self.tokens = 0
+        self.waits: Deque[float] = deque(maxlen=WAIT_SAMPLES)
+        self.recent: Deque[tuple] = deque()  # (finished_at, tokens)
+        self.last_seen = self.refilled_at
+
+    def refill(self, now: float):
+        if self.capacity:
+            self.bucket = min(self.capacity, self.bucket + (now - self.refilled_at) * self.capacity / 60.0)
+        self.refilled_at = now
+
+    def can_start(self, cost: int) -> bool:
+        if self.running >= TENANT_MAX_CONCURRENCY:
+            return False
+        # A call larger than the whole bucket may start once the bucket is full
+        return not self.capacity or self.bucket >= min(cost, self.capacity)
+
+
+class LLMScheduler:
+    """Priority classes, then weighted deficit round robin over tenants."""
+
+    def __init__(
+        self,
+        max_concurrency: int = LLM_MAX_CONCURRENCY,
+        tokens_per_minute: int = TENANT_TOKENS_PER_MINUTE
+    ):
+        self.max_concurrency = max_concurrency
+        self.tokens_per_minute = tokens_per_minute
+        self._lock = threading.Lock()
+        self._tenants: Dict[str, _Tenant] = {}
+        # priority -> tenants with waiting calls, in round robin order
+        self._active: Dict[int, Deque[str]] = {}
+        self._running = 0
+
+    def _tenant_locked(self, name: str, now: float) -> _Tenant:
+        tenant = self._tenants.get(name)
+        if tenant is None:
+            self._forget_idle_locked(now)
+            tenant = self._tenants[name] = _Tenant(name, self.tokens_per_minute)
+        tenant.last_seen = now
+        return tenant
+
+    def _forget_idle_locked(self, now: float):
+        idle = [
+            name for name, t in self._tenants.items()
+            if not t.running and not any(t.queues.values()) and now - t.last_seen > TENANT_IDLE_SECONDS
+        ]
+        for name in idle:
+            del self._tenants[name]
+
+    def _grant_locked(self, tenant: _Tenant, ticket: Ticket, now: float):
+        tenant.queues[ticket.priority].popleft()
+        tenant.running += 1
+        tenant.bucket -= ticket.cost
+        tenant.waits.append(now - ticket.queued_at)
+        self._running += 1
+        ticket.granted_at = now
+        ticket.event.set()
+
+    def _dispatch_locked(self):
+        """Grant waiting calls while global slots are free."""
+        now = time.monotonic()
+        for tenant in self._tenants.values():
+            tenant.refill(now)
+        for priority in sorted(self._active):
+            active = self._active[priority]
+            # Stop after a whole pass over tenants that are all at a limit
+            blocked = 0
+            while active and blocked < len(active) and self._running < self.max_concurrency:
+                tenant = self._tenants.get(active[0])
+                queue = tenant.queues.get(priority) if tenant is not None else None
+                if not queue:
+                    active.popleft()
+                    if tenant is not None:
+                        tenant.deficit[priority] = 0.0
+                    continue
+                if not tenant.can_start(queue[0].cost):
+                    active.rotate(-1)
+                    blocked += 1
+                    continue
+                blocked = 0
+                if tenant.deficit.get(priority, 0.0) < queue[0].cost:
+                    # New turn
+                    tenant.deficit[priority] = tenant.deficit.get(priority, 0.0) + DRR_QUANTUM * tenant.weight
+                while (queue and tenant.deficit[priority] >= queue[0].cost
+                       and tenant.can_start(queue[0].cost) and self._running < self.max_concurrency):
+                    tenant.deficit[priority] -= queue[0].cost
+                    self._grant_locked(tenant, queue[0], now)
+                if not queue:
+                    active.popleft()
+                    tenant.deficit[priority] = 0.0
+                elif tenant.deficit[priority] < queue[0].cost or not tenant.can_start(queue[0].cost):
+                    active.rotate(-1)
+                # else the turn resumes at the next free slot
+            # Lower classes only get the slots this class cannot use
+            if self._running >= self.max_concurrency:
+                return
+
+    def acquire(self, cost: int, tenant: Optional[str] = None, priority: Optional[int] = None,
+                timeout: float = SCHEDULE_TIMEOUT_SECONDS) -> Ticket:
+        """Block until the call may start. Raises ScheduleTimeoutError."""
+        ticket = Ticket(
+            tenant=tenant or current_tenant(),
+            priority=current_priority() if priority is None else priority,
+            cost=max(1, cost)
+        )
+        with self._lock:
+            state = self._tenant_locked(ticket.tenant, ticket.queued_at)
+            state.queues.setdefault(ticket.priority, deque()).append(ticket)
+            active = self._active.setdefault(ticket.priority, deque())
+            if ticket.tenant not in active:
+                active.append(ticket.tenant)
+            self._dispatch_locked()
+
+        deadline = ticket.queued_at + timeout
+        while not ticket.event.wait(RECHECK_SECONDS):
+            with self._lock:
+                if ticket.event.is_set():
+                    break
+                if time.monotonic() >= deadline or is_cancelled():
+                    state.queues[ticket.priority].remove(ticket)
+                    self._dispatch_locked()
+                    raise ScheduleTimeoutError("当前使用人数较多，排队超时，请稍后再试。")
+                # Token buckets refill with time, not with releases
+                self._dispatch_locked()
+        return ticket
+
+    def release(self, ticket: Ticket):
+        """Free the call's slot and settle its actual token usage."""
+        now = time.monotonic()
+        with self._lock:
+            tenant = self._tenants[ticket.tenant]
+            tenant.last_seen = now
+            tenant.running -= 1
+            self._running -= 1
+            tokens = ticket.tokens if ticket.tokens is not None else ticket.cost
+            tenant.bucket += ticket.cost - tokens
+            tenant.calls += 1
+            tenant.tokens += tokens
+            tenant.recent.append((now, tokens))
+            self._dispatch_locked()
+
+    @contextmanager
+    def slot(self, cost: int, tenant: Optional[str] = None, priority: Optional[int] = None) -> Iterator[Ticket]:
+        """acquire/release around a call; set ticket.tokens to the actual usage."""
+        ticket = self.acquire(cost, tenant, priority)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    def stats(self) -> Dict[str, Any]:
+        """Per-tenant queue wait, throughput and quota state."""
+        now = time.monotonic()
+        with self._lock:
+            tenants: List[Dict[str, Any]] = []
+            for tenant in self._tenants.values():
+                tenant.refill(now)
+                while tenant.recent and now - tenant.recent[0][0] > THROUGHPUT_WINDOW_SECONDS:
+                    tenant.recent.popleft()
+                waits = sorted(tenant.waits)
+                tenants.append({
+                    "tenant": tenant.name,
+                    "weight": tenant.weight,
+                    "waiting": sum(len(q) for q in tenant.queues.values()),
+                    "running": tenant.running,
+                    "calls": tenant.calls,
+                    "tokens": tenant.tokens,
+                    "wait_mean": sum(waits) / len(waits) if waits else None,
+                    "wait_p95": waits[min(len(waits) - 1, int(len(waits) * 0.95))] if waits else None,
+                    "tokens_per_minute": sum(t for _, t in tenant.recent) * 60.0 / THROUGHPUT_WINDOW_SECONDS,
+                    "calls_per_minute": len(tenant.recent) * 60.0 / THROUGHPUT_WINDOW_SECONDS,
+                    "quota_left": round(tenant.bucket) if tenant.capacity else None
+                })
+            return {"running": self._running, "max_concurrency": self.max_concurrency, "tenants": tenants}
+
+
+_scheduler: Optional[LLMScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> LLMScheduler:
+    """Process-wide scheduler shared by all sessions and jobs."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = LLMScheduler()
+        return _scheduler
+
+
+def set_scheduler(scheduler: Optional[LLMScheduler]):
+    """Replace the process-wide scheduler (tests, load tests)."""
+    global _scheduler
+    with _scheduler_lock:
+        _scheduler = scheduler
@@ -1,13 +1,25 @@
 """
 State management for XHS Text Agent.
 Single state object stored in st.session_state.
+Classes use __slots__ and intern repeated strings to keep per-session
+memory small (requires Python 3.10+).
 """
 
+import sys
+import uuid
 from dataclasses import dataclass, field
 from typing import Optional, List, Dict, Any
 
 
-@dataclass
+# Fingerprints of earlier weeks kept per creator for repetition checks
+MAX_PAST_SIGNATURES = 7 * 52
+
+
+def _intern(value: Optional[str]) -> Optional[str]:
+    return sys.intern(value) if value else value
+
+
+@dataclass(slots=True)
 class DayContent:
     """Content for a single day's post."""
     day: int
@@ -16,6 +28,14 @@ class DayContent:
     bullets: List[str]
     cta: str
     tags: List[str]
+    # MinHash fingerprint (dedup.signature), set when the day is installed
+    # in a plan so archiving it costs nothing; not serialized
+    signature: Optional[bytes] = field(default=None, repr=False, compare=False)
+
+    def __post_init__(self):
+        # Tags repeat heavily across days, weeks and sessions; the model may
+        # send null or non-string tags
+        self.tags = [sys.intern(str(t)) for t in self.tags or []]
 
     def to_dict(self) -> Dict[str, Any]:
         return {
@@ -39,7 +59,7 @@ class DayContent:
         )
 
 
-@dataclass
+@dataclass(slots=True)
 class WeeklyReview:
     """Weekly review output."""
     reflection: str
@@ -59,12 +79,19 @@ class WeeklyReview:
         )
 
 
-@dataclass
-class AppState:
+class _WeakReferenceable:
+    """Slotted classes drop __weakref__; the session registry needs it."""
+    __slots__ = ("__weakref__",)
+
+
+@dataclass(slots=True)
+class AppState(_WeakReferenceable):
     """
     Main application state.
     Tracks onboarding progress, weekly plan, and review.
     """
+    session_id: str = field(default_factory=lambda: uuid.uuid4().hex)
+
     # Onboarding state
     current_step: str = "niche"  # niche, goal, style, effort, constraints, custom, ready
     niche: Optional[str] = None
@@ -75,9 +102,18 @@ class AppState:
     custom_note: str = ""
 
     # Content state
+    # For a multi-week plan, weekly_plan is the same list as plan_weeks[current_week]
     weekly_plan: List[DayContent] = field(default_factory=list)
+    plan_weeks: List[List[DayContent]] = field(default_factory=list)
+    # Other candidates of the current one-week plan, next one first (see candidates.py)
+    plan_alternatives: List[List[DayContent]] = field(default_factory=list)
+    week_themes: List[str] = field(default_factory=list)
+    current_week: int = 0
     is_generating: bool = False
     generation_error: Optional[str] = None
+    past_signatures: List[bytes] = field(default_factory=list)
+    generation_job_id: Optional[str] = None
+    rewrite_job_id: Optional[str] = None
 
     # View state
     viewing_day: Optional[int] = None
@@ -90,8 +126,14 @@ class AppState:
     review_pace: str = ""
     review_notes: str = ""
     weekly_review: Optional[WeeklyReview] = None
+    # Plan titles and feedback the current review was made for
+    review_basis: Optional[Dict[str, Any]] = None
     is_reviewing: bool = False
     review_error: Optional[str] = None
+    review_job_id: Optional[str] = None
+
+    # Plan and review moved to the local store while the session is idle
+    offloaded: bool = False
 
     def is_onboarding_complete(self) -> bool:
         """Check if all required onboarding steps are done."""
@@ -113,18 +155,122 @@ class AppState:
             "custom_note": self.custom_note
         }
 
+    def has_active_jobs(self) -> bool:
+        return any([self.generation_job_id, self.rewrite_job_id, self.review_job_id])
+
+    def compact(self):
+        """Intern onboarding choices shared by many sessions."""
+        self.niche = _intern(self.niche)
+        self.goal = _intern(self.goal)
+        self.style = _intern(self.style)
+        self.effort = _intern(self.effort)
+        self.constraints = [sys.intern(c) for c in self.constraints]
+
+    @staticmethod
+    def _fingerprint(days: List[DayContent]):
+        """Compute the signature of days that don't have one yet."""
+        from .dedup import signature
+        for day in days:
+            if day.signature is None:
+                day.signature = signature(day)
+
+    def set_plan_weeks(self, weeks: List[List[DayContent]], themes: List[str]):
+        """Install a multi-week plan and show its first week."""
+        self.archive_plan()
+        for week in weeks:
+            self._fingerprint(week)
+        self.plan_weeks = weeks
+        self.plan_alternatives = []
+        self.week_themes = themes
+        self.select_week(0)
+
+    def set_plan_candidates(self, plans: List[List[DayContent]]):
+        """Install the best of ranked candidate plans and keep the others."""
+        self.archive_plan()
+        self._fingerprint(plans[0])
+        self.plan_weeks = []
+        self.weekly_plan = plans[0]
+        self.plan_alternatives = plans[1:]
+
+    def set_day(self, content: DayContent) -> bool:
+        """Replace the shown plan's day content.day (after a rewrite). Returns False if absent."""
+        self._fingerprint([content])
+        for i, day in enumerate(self.weekly_plan):
+            if day.day == content.day:
+                self.weekly_plan[i] = content
+                return True
+        return False
+
+    def next_alternative(self) -> bool:
+        """
+        Show the next stored candidate; the current plan (with any rewrites)
+        goes to the back of the line. Returns False if there is none.
+        """
+        if not self.plan_alternatives:
+            return False
+        self.plan_alternatives.append(self.weekly_plan)
+        self.weekly_plan = self.plan_alternatives.pop(0)
+        self._fingerprint(self.weekly_plan)
+        self.viewing_day = None
+        self.rewriting_day = None
+        self.weekly_review = None
+        self.review_basis = None
+        return True
+
+    def select_week(self, index: int):
+        """Show another week; edits to weekly_plan land in plan_weeks too."""
+        if 0 <= index < len(self.plan_weeks):
+            self.current_week = index
+            self.weekly_plan = self.plan_weeks[index]
+            self.viewing_day = None
+            self.rewriting_day = None
+            self.weekly_review = None
+            self.review_basis = None
+
     def reset_content(self):
         """Reset content-related state."""
         self.weekly_plan = []
+        self.plan_weeks = []
+        self.plan_alternatives = []
+        self.week_themes = []
+        self.current_week = 0
         self.viewing_day = None
         self.rewriting_day = None
         self.rewrite_instruction = ""
         self.generation_error = None
+        self.generation_job_id = None
+        self.rewrite_job_id = None
         self.weekly_review = None
+        self.review_basis = None
         self.review_error = None
+        self.review_job_id = None
+        self.offloaded = False
+
+    def _plan_signatures(self) -> List[bytes]:
+        """Cached signatures of the current plan (computed here only for days rehydrated from an offload)."""
+        weeks = self.plan_weeks or [self.weekly_plan]
+        for week in weeks:
+            self._fingerprint(week)
+        return [day.signature for week in weeks for day in week]
+
+    def archive_plan(self):
+        """
+        Remember the current plan's fingerprints so later weeks avoid
+        repeating it. Called whenever a plan is replaced; the history lives
+        in the session (there is no creator identity across sessions).
+        """
+        signatures = self._plan_signatures()
+        if signatures:
+            self.past_signatures.extend(signatures)
+            del self.past_signatures[:-MAX_PAST_SIGNATURES]
+
+    def history_signatures(self) -> List[bytes]:
+        """Fingerprints a new plan should not repeat: earlier plans and the current one."""
+        return (self.past_signatures + self._plan_signatures())[-MAX_PAST_SIGNATURES:]
 
     def reset_all(self):
-        """Reset entire state."""
+        """Reset entire state (the creator's past-week fingerprints are kept)."""
+        self.archive_plan()
         self.current_step = "niche"
         self.niche = None
         self.goal = None
@@ -140,11 +286,17 @@ class AppState:
 
 
 def get_state() -> AppState:
-    """Get or initialize the app state from session_state."""
+    """
+    Get or initialize the app state from session_state.
+    Plans offloaded while the session was idle are loaded back here.
+    """
     import streamlit as st
+    from .memory import get_session_registry
     if "app_state" not in st.session_state:
         st.session_state.app_state = AppState()
-    return st.session_state.app_state
+    state = st.session_state.app_state
+    get_session_registry().touch(state)
+    return state
 
 
 def update_state(state: AppState):
@@ -0,0 +1,231 @@
+"""
+Local tag recommendation for XHS Text Agent.
+Learns a per-niche tag vocabulary from LLM-generated DayContent.tags and
+assigns tags to new posts by n-gram association scoring, so generation
+and rewrite prompts can skip asking the model for tags.
+"""
+
+import os
+import json
+import math
+import threading
+from collections import Counter
+from typing import Dict, List, Optional
+
+from .state import DayContent
+from .textutil import ngram_set, post_text
+
+TAGS_PER_POST = 5
+# Added when the tag text appears verbatim in the post
+DIRECT_MATCH_BONUS = 3.0
+PRIOR_WEIGHT = 0.1
+
+TAG_VOCAB_PATH = os.getenv("XHS_TAG_VOCAB")
+LOCAL_TAGS = os.getenv("XHS_LOCAL_TAGS") == "1"
+
+# Online learning is bounded: past these sizes a niche keeps its most
+# frequent grams/tags (pruning to PRUNE_KEEP of the cap, so it is rare)
+MAX_VOCAB_GRAMS = int(os.getenv("XHS_TAG_MAX_GRAMS", "20000"))
+MAX_VOCAB_TAGS = int(os.getenv("XHS_TAG_MAX_TAGS", "500"))
+PRUNE_KEEP = 0.8
+# Learned vocabulary is written back to XHS_TAG_VOCAB every this many posts
+SAVE_EVERY_POSTS = int(os.getenv("XHS_TAG_SAVE_EVERY", "50"))
+
+# Cold-start vocabulary for the onboarding niches
+DEFAULT_NICHE_TAGS: Dict[str, List[str]] = {
+    "生活方式": ["#生活方式", "#日常记录", "#生活碎片", "#自律生活", "#好物分享"],
+    "学习/成长": ["#学习方法", "#自我提升", "#学习打卡", "#成长记录", "#干货分享"],
+    "职场/留学": ["#职场干货", "#职场新人", "#留学生活", "#求职经验", "#打工人日常"],
+    "健康/健身": ["#健身打卡", "#健康生活", "#减脂", "#运动日常", "#健身新手"],
+    "副业/搞钱": ["#副业", "#搞钱", "#副业分享", "#个人成长", "#理财入门"],
+    "兴趣/爱好": ["#兴趣爱好", "#爱好分享", "#手工", "#日常分享", "#宝藏爱好"],
+}
+GENERIC_TAGS = ["#新手博主", "#小红书成长笔记", "#日常分享", "#经验分享", "#干货分享"]
+
+
+class _NicheVocab:
+    """Tag counts and gram -> tag associations for one niche."""
+
+    __slots__ = ("docs", "tag_counts", "gram_df", "assoc")
+
+    def __init__(self):
+        self.docs = 0
+        self.tag_counts: Counter = Counter()
+        self.gram_df: Counter = Counter()
+        self.assoc: Dict[str, Counter] = {}
+
+    def observe(self, grams: set, tags: List[str]):
+        self.docs += 1
+        self.tag_counts.update(tags)
+        self.gram_df.update(grams)
+        for gram in grams:
+            counter = self.assoc.get(gram)
+            if counter is None:
+                counter = self.assoc[gram] = Counter()
+            counter.update(tags)
+        if len(self.assoc) > MAX_VOCAB_GRAMS or len(self.tag_counts) > MAX_VOCAB_TAGS:
+            self.prune(int(MAX_VOCAB_GRAMS * PRUNE_KEEP), int(MAX_VOCAB_TAGS * PRUNE_KEEP))
+
+    def prune(self, max_grams: int, max_tags: int):
+        """Keep the max_grams most frequent grams and max_tags most used tags."""
+        if len(self.tag_counts) > max_tags:
+            self.tag_counts = Counter(dict(self.tag_counts.most_common(max_tags)))
+            for gram in list(self.assoc):
+                counter = Counter({t: n for t, n in self.assoc[gram].items() if t in self.tag_counts})
+                if counter:
+                    self.assoc[gram] = counter
+                else:
+                    del self.assoc[gram]
+                    del self.gram_df[gram]
+        if len(self.assoc) > max_grams:
+            self.gram_df = Counter(dict(self.gram_df.most_common(max_grams)))
+            self.assoc = {g: c for g, c in self.assoc.items() if g in self.gram_df}
+
+    def to_dict(self) -> Dict:
+        return {
+            "docs": self.docs,
+            "tag_counts": dict(self.tag_counts),
+            "gram_df": dict(self.gram_df),
+            "assoc": {g: dict(c) for g, c in self.assoc.items()}
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "_NicheVocab":
+        vocab = cls()
+        vocab.docs = data["docs"]
+        vocab.tag_counts = Counter(data["tag_counts"])
+        vocab.gram_df = Counter(data["gram_df"])
+        vocab.assoc = {g: Counter(c) for g, c in data["assoc"].items()}
+        return vocab
+
+
+class TagEngine:
+    """Per-niche vocabularies plus a shared fallback vocabulary."""
+
+    ALL = "*"
+
+    def __init__(self, path: Optional[str] = None):
+        # Where observed vocabulary is saved every SAVE_EVERY_POSTS posts
+        self.path = path
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._vocabs: Dict[str, _NicheVocab] = {}
+        self._unsaved = 0
+
+    def _vocab(self, niche: str) -> _NicheVocab:
+        vocab = self._vocabs.get(niche)
+        if vocab is None:
+            vocab = self._vocabs[niche] = _NicheVocab()
+        return vocab
+
+    def observe(self, niche: Optional[str], day: DayContent):
+        """Learn from one post's LLM-generated tags."""
+        tags = [t for t in day.tags if t]
+        if not tags:
+            return
+        grams = ngram_set(post_text(day))
+        with self._lock:
+            if niche:
+                self._vocab(niche).observe(grams, tags)
+            self._vocab(self.ALL).observe(grams, tags)
+            self._unsaved += 1
+            due = self.path is not None and self._unsaved >= SAVE_EVERY_POSTS
+            if due:
+                self._unsaved = 0
+        if due:
+            self._autosave()
+
+    def _autosave(self):
+        # Skipped if a save is already running; the next one catches up
+        if not self._save_lock.acquire(blocking=False):
+            return
+        try:
+            self.save(self.path)
+        except OSError:
+            pass
+        finally:
+            self._save_lock.release()
+
+    def observe_plan(self, niche: Optional[str], days: List[DayContent]):
+        for day in days:
+            self.observe(niche, day)
+
+    def _score(self, vocab: _NicheVocab, grams: set, text: str) -> Counter:
+        scores: Counter = Counter()
+        if vocab.docs == 0:
+            return scores
+        for gram in grams:
+            counter = vocab.assoc.get(gram)
+            if not counter:
+                continue
+            idf = math.log((1 + vocab.docs) / (1 + vocab.gram_df[gram])) + 1.0
+            for tag, n in counter.items():
+                scores[tag] += idf * n / vocab.tag_counts[tag]
+        for tag, n in vocab.tag_counts.items():
+            if tag.lstrip("#") and tag.lstrip("#") in text:
+                scores[tag] += DIRECT_MATCH_BONUS
+            scores[tag] += PRIOR_WEIGHT * math.log1p(n)
+        return scores
+
+    def assign(self, niche: Optional[str], day: DayContent, k: int = TAGS_PER_POST) -> List[str]:
+        """Top-k tags for a post, topped up with niche and generic defaults."""
+        text = post_text(day)
+        grams = ngram_set(text)
+        with self._lock:
+            scores = Counter()
+            niche_vocab = self._vocabs.get(niche or "")
+            if niche_vocab is not None:
+                scores.update(self._score(niche_vocab, grams, text))
+            shared = self._vocabs.get(self.ALL)
+            if shared is not None and len(scores) < k:
+                for tag, score in self._score(shared, grams, text).items():
+                    scores[tag] += 0.5 * score
+
+        tags = [tag for tag, _ in scores.most_common(k)]
+        for tag in DEFAULT_NICHE_TAGS.get(niche or "", []) + GENERIC_TAGS:
+            if len(tags) >= k:
+                break
+            if tag not in tags:
+                tags.append(tag)
+        return tags
+
+    def assign_plan(self, niche: Optional[str], days: List[DayContent]):
+        """Fill in tags for every day in place."""
+        for day in days:
+            day.tags = self.assign(niche, day)
+
+    def save(self, path: str):
+        with self._lock:
+            data = {niche: vocab.to_dict() for niche, vocab in self._vocabs.items()}
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> "TagEngine":
+        engine = cls()
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        engine._vocabs = {niche: _NicheVocab.from_dict(v) for niche, v in data.items()}
+        return engine
+
+
+_engine: Optional[TagEngine] = None
+_engine_lock = threading.Lock()
+
+
+def get_tag_engine() -> TagEngine:
+    """
+    Process-wide engine, loaded from XHS_TAG_VOCAB if it exists and
+    periodically saved back there.
+    """
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            if TAG_VOCAB_PATH and os.path.exists(TAG_VOCAB_PATH):
+                _engine = TagEngine.load(TAG_VOCAB_PATH)
+                _engine.path = TAG_VOCAB_PATH
+            else:
+                _engine = TagEngine(TAG_VOCAB_PATH)
+        return _engine
@@ -0,0 +1,59 @@
+"""
+Text helpers shared by the local (non-LLM) engines.
+Chinese text has no word boundaries, so matching works on character
+n-grams of CJK runs plus lowercased ASCII words.
+"""
+
+import re
+from functools import lru_cache
+from typing import Iterable, List, Set
+
+# CJK runs or ASCII alphanumeric words; everything else is a separator
+_TOKEN_PATTERN = r"[一-鿿㐀-䶿]+|[A-Za-z0-9]+"
+_CJK_PATTERN = r"[一-鿿㐀-䶿]"
+
+
+@lru_cache(maxsize=None)
+def compiled(pattern: str) -> "re.Pattern[str]":
+    """
+    Compile a pattern on first use. Classes spanning the CJK block take
+    milliseconds to compile, which would otherwise be paid at import.
+    """
+    return re.compile(pattern)
+
+
+def runs(text: str) -> List[str]:
+    """Split text into CJK runs and lowercased ASCII words."""
+    return [m.group(0).lower() for m in compiled(_TOKEN_PATTERN).finditer(text)]
+
+
+def is_cjk(token: str) -> bool:
+    return bool(compiled(_CJK_PATTERN).match(token))
+
+
+def ngrams(text: str, sizes: Iterable[int] = (2, 3)) -> List[str]:
+    """
+    Character n-grams of each CJK run (runs shorter than n are kept
+    whole) plus ASCII words as-is.
+    """
+    grams = []
+    for run in runs(text):
+        if not is_cjk(run):
+            grams.append(run)
+            continue
+        for n in sizes:
+            if len(run) < n:
+                if n == min(sizes):
+                    grams.append(run)
+                continue
+            grams.extend(run[i:i + n] for i in range(len(run) - n + 1))
+    return grams
+
+
+def ngram_set(text: str, sizes: Iterable[int] = (2, 3)) -> Set[str]:
+    return set(ngrams(text, sizes))
+
+
+def post_text(day) -> str:
+    """The matchable text of a DayContent: title, hook and bullets."""
+    return " ".join([day.title, day.hook] + list(day.bullets))
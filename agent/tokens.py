@@ -0,0 +1,351 @@
+"""
+Token estimation and pre-flight checks for LLM calls.
+Counts Qwen-style tokens locally, predicts output tokens per operation
+and effort level from recorded usage, and turns both into a latency and
+cost estimate before a call is made. User input fields are truncated to
+a token budget; prompts over the per-request budget are rejected.
+"""
+
+import os
+import re
+import json
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from .textutil import compiled
+
+# Qwen's vocabulary merges common Chinese words: ~1.4 chars per token
+CJK_TOKENS_PER_CHAR = 0.7
+LATIN_CHARS_PER_TOKEN = 4
+
+MAX_PROMPT_TOKENS = int(os.getenv("XHS_MAX_PROMPT_TOKENS", "8000"))
+CUSTOM_NOTE_MAX_TOKENS = int(os.getenv("XHS_CUSTOM_NOTE_MAX_TOKENS", "200"))
+INSTRUCTION_MAX_TOKENS = int(os.getenv("XHS_INSTRUCTION_MAX_TOKENS", "150"))
+TRUNCATION_MARK = "…"
+
+USAGE_MODEL_PATH = os.getenv("XHS_USAGE_MODEL")
+# Observations needed before a learned value replaces the default
+MIN_SAMPLES = 5
+
+# Expected completion tokens before anything is learned
+DEFAULT_OUTPUT_TOKENS: Dict[str, int] = {
+    "generate": 1800,
+    "rewrite": 300,
+    "review": 250,
+    "json_fix": 1800,
+}
+FALLBACK_OUTPUT_TOKENS = 500
+# Generation output grows with the bullets each effort level allows
+EFFORT_OUTPUT_SCALE: Dict[str, float] = {
+    "很少(1-2条/周)": 0.8,
+    "一般(3-4条/周)": 1.0,
+    "还可以(5-7条/周)": 1.25,
+    "不确定你来安排": 1.0,
+}
+
+# Latency model default: seconds = DEFAULT_FIRST_TOKEN_SECONDS + tokens / DEFAULT_TOKENS_PER_SECOND
+DEFAULT_FIRST_TOKEN_SECONDS = 1.0
+DEFAULT_TOKENS_PER_SECOND = 35.0
+
+# CNY per 1k (input, output) tokens; override with XHS_MODEL_PRICES (same JSON shape)
+MODEL_PRICES: Dict[str, Tuple[float, float]] = {
+    "qwen-turbo": (0.0003, 0.0006),
+    "qwen-plus": (0.0008, 0.002),
+    "qwen-max": (0.0024, 0.0096),
+}
+if os.getenv("XHS_MODEL_PRICES"):
+    MODEL_PRICES.update({k: tuple(v) for k, v in json.loads(os.environ["XHS_MODEL_PRICES"]).items()})
+
+# CJK classes are compiled on first use (see textutil.compiled)
+_TOKEN_PATTERN = r"(?s)([\u3400-\u9fff\uf900-\ufaff]+)|([A-Za-z]+)|(\n+)|\s+|."
+_EFFORT_RE = re.compile(r"更新频率：(.+)")
+# Same classes as _TOKEN_PATTERN, for counting whole texts without a Python loop
+_CJK_RUN_PATTERN = r"[\u3400-\u9fff\uf900-\ufaff]+"
+_WORD_RE = re.compile(r"[A-Za-z]+")
+_NEWLINES_RE = re.compile(r"\n+")
+
+
+class TokenBudgetError(Exception):
+    """Raised before a call whose prompt is over the per-request token budget."""
+
+    def __init__(self, estimate: "Estimate", budget: int):
+        self.estimate = estimate
+        self.budget = budget
+        super().__init__(
+            f"输入内容过长（约{estimate.prompt_tokens} tokens，上限{budget}），请精简补充说明或改写要求后再试。"
+        )
+
+
+def _token_cost(match: "re.Match") -> float:
+    cjk, word, newlines = match.group(1), match.group(2), match.group(3)
+    if cjk:
+        return len(cjk) * CJK_TOKENS_PER_CHAR
+    if word:
+        return -(-len(word) // LATIN_CHARS_PER_TOKEN)
+    if newlines:
+        return 1
+    # Other whitespace merges into the next token; digits, punctuation
+    # and emoji are one token each
+    return 0 if match.group(0).isspace() else 1
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate Qwen token count of text (_token_cost summed over the text)."""
+    cjk = sum(map(len, compiled(_CJK_RUN_PATTERN).findall(text)))
+    words = _WORD_RE.findall(text)
+    visible = sum(map(len, text.split()))
+    other = visible - cjk - sum(map(len, words))
+    word_tokens = sum(-(-len(w) // LATIN_CHARS_PER_TOKEN) for w in words)
+    return round(cjk * CJK_TOKENS_PER_CHAR + word_tokens + len(_NEWLINES_RE.findall(text)) + other)
+
+
+def truncate_tokens(text: str, budget: int) -> str:
+    """Cut text to at most ~budget tokens, marking the cut."""
+    total = 0.0
+    for match in compiled(_TOKEN_PATTERN).finditer(text):
+        cost = _token_cost(match)
+        if total + cost > budget:
+            if match.group(1):
+                # Keep the part of a Chinese run that still fits
+                end = match.start() + int((budget - total) / CJK_TOKENS_PER_CHAR)
+            else:
+                end = match.start()
+            return text[:end].rstrip() + TRUNCATION_MARK
+        total += cost
+    return text
+
+
+def effort_from_prompt(prompt: str) -> Optional[str]:
+    """The effort level formatted into a generation prompt, if any."""
+    match = _EFFORT_RE.search(prompt)
+    return match.group(1).strip() if match else None
+
+
+def per_choice_usage(usage: Optional[Dict[str, Any]], choices: int) -> Optional[Dict[str, Any]]:
+    """
+    Usage of a request with several choices, with completion tokens per
+    choice: choices decode side by side, so one choice's size sets latency.
+    """
+    if not usage or choices <= 1 or not usage.get("completion_tokens"):
+        return usage
+    return dict(usage, completion_tokens=usage["completion_tokens"] // choices)
+
+
+@dataclass
+class Estimate:
+    """Pre-flight prediction for one call."""
+    operation: Optional[str]
+    model: str
+    estimated_prompt_tokens: int  # raw estimate_tokens, before calibration
+    prompt_tokens: int
+    output_tokens: int
+    seconds: float
+    cost: float  # CNY
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.output_tokens
+
+
+class _Stat:
+    """Running sums for a mean and a least-squares line y = a + b * x."""
+    __slots__ = ("n", "sx", "sy", "sxx", "sxy")
+
+    def __init__(self, n=0, sx=0.0, sy=0.0, sxx=0.0, sxy=0.0):
+        self.n, self.sx, self.sy, self.sxx, self.sxy = n, sx, sy, sxx, sxy
+
+    def add(self, x: float, y: float):
+        self.n += 1
+        self.sx += x
+        self.sy += y
+        self.sxx += x * x
+        self.sxy += x * y
+
+    def mean_y(self) -> float:
+        return self.sy / self.n
+
+    def line(self) -> Optional[Tuple[float, float]]:
+        """(intercept, slope), or None without enough spread in x."""
+        var = self.n * self.sxx - self.sx * self.sx
+        if var <= 1e-9 * max(self.sxx, 1.0) * self.n:
+            return None
+        slope = (self.n * self.sxy - self.sx * self.sy) / var
+        return (self.sy - slope * self.sx) / self.n, slope
+
+    def to_list(self):
+        return [self.n, self.sx, self.sy, self.sxx, self.sxy]
+
+
+class UsageModel:
+    """
+    Learns from observed calls: completion tokens per (operation, effort),
+    seconds per completion token per model, and how far estimate_tokens
+    is off from the server's prompt token count.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._output: Dict[str, _Stat] = {}   # "operation|effort" -> (prompt tokens, completion tokens)
+        self._latency: Dict[str, _Stat] = {}  # model -> (completion tokens, seconds)
+        self._prompt = _Stat()                # (estimated, actual) prompt tokens
+
+    @staticmethod
+    def _key(operation: Optional[str], effort: Optional[str]) -> str:
+        return f"{operation or ''}|{effort or ''}"
+
+    def observe(
+        self,
+        operation: Optional[str],
+        effort: Optional[str],
+        model: str,
+        estimated: int,
+        usage: Optional[Dict[str, Any]],
+        elapsed: Optional[float],
+        text: str = ""
+    ):
+        """
+        Record one finished call. estimated is estimate_tokens of the
+        prompt; usage is a plain dict (see cassette.usage_to_dict).
+        """
+        usage = usage or {}
+        completion = usage.get("completion_tokens") or estimate_tokens(text)
+        with self._lock:
+            if usage.get("prompt_tokens"):
+                self._prompt.add(estimated, usage["prompt_tokens"])
+            for key in {self._key(operation, effort), self._key(operation, None)}:
+                self._output.setdefault(key, _Stat()).add(estimated, completion)
+            if elapsed:
+                self._latency.setdefault(model, _Stat()).add(completion, elapsed)
+
+    def fit(self, entries: Iterable[Dict[str, Any]]) -> int:
+        """Observe recorded cassette entries. Returns how many were used."""
+        count = 0
+        for entry in entries:
+            prompt = "\n\n".join(str(m.get("content", "")) for m in entry["messages"])
+            self.observe(
+                entry.get("operation"), effort_from_prompt(prompt), entry.get("model") or "",
+                estimate_tokens(prompt), per_choice_usage(entry.get("usage"), len(entry.get("choices") or [1])),
+                entry.get("elapsed"), entry.get("text") or ""
+            )
+            count += 1
+        return count
+
+    def prompt_tokens(self, estimated: int) -> int:
+        """estimate_tokens of a prompt, corrected by the observed server counts."""
+        with self._lock:
+            if self._prompt.n >= MIN_SAMPLES and self._prompt.sx:
+                return round(estimated * self._prompt.sy / self._prompt.sx)
+        return estimated
+
+    def output_tokens(self, operation: Optional[str], effort: Optional[str]) -> int:
+        """Expected completion tokens for an operation at an effort level."""
+        with self._lock:
+            for key in (self._key(operation, effort), self._key(operation, None)):
+                stat = self._output.get(key)
+                if stat is not None and stat.n >= MIN_SAMPLES:
+                    scale = EFFORT_OUTPUT_SCALE.get(effort or "", 1.0) if key.endswith("|") else 1.0
+                    return round(stat.mean_y() * scale)
+        default = DEFAULT_OUTPUT_TOKENS.get(operation or "", FALLBACK_OUTPUT_TOKENS)
+        return round(default * EFFORT_OUTPUT_SCALE.get(effort or "", 1.0))
+
+    def seconds(self, model: str, output_tokens: int) -> float:
+        """Expected wall time of a call producing output_tokens."""
+        with self._lock:
+            stat = self._latency.get(model)
+            if stat is not None and stat.n >= MIN_SAMPLES:
+                line = stat.line()
+                if line is not None and line[1] > 0:
+                    return max(0.0, line[0]) + line[1] * output_tokens
+                if stat.sx:
+                    # Outputs all about the same size: scale the mean
+                    return stat.sy / stat.sx * output_tokens
+        return DEFAULT_FIRST_TOKEN_SECONDS + output_tokens / DEFAULT_TOKENS_PER_SECOND
+
+    def estimate(
+        self,
+        prompt: str,
+        model: str,
+        operation: Optional[str] = None,
+        effort: Optional[str] = None
+    ) -> Estimate:
+        estimated = estimate_tokens(prompt)
+        prompt_tokens = self.prompt_tokens(estimated)
+        if operation == "json_fix":
+            # The fix repeats the broken response
+            output_tokens = estimated
+        else:
+            output_tokens = self.output_tokens(operation, effort)
+        input_price, output_price = MODEL_PRICES.get(model, (0.0, 0.0))
+        return Estimate(
+            operation=operation,
+            model=model,
+            estimated_prompt_tokens=estimated,
+            prompt_tokens=prompt_tokens,
+            output_tokens=output_tokens,
+            seconds=self.seconds(model, output_tokens),
+            cost=(prompt_tokens * input_price + output_tokens * output_price) / 1000
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "prompt_scale": self._prompt.sy / self._prompt.sx if self._prompt.sx else None,
+                "output_tokens": {k: round(s.mean_y()) for k, s in self._output.items()},
+                "latency": {m: s.line() for m, s in self._latency.items()},
+            }
+
+    def save(self, path: str):
+        with self._lock:
+            data = {
+                "prompt": self._prompt.to_list(),
+                "output": {k: s.to_list() for k, s in self._output.items()},
+                "latency": {k: s.to_list() for k, s in self._latency.items()},
+            }
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> "UsageModel":
+        model = cls()
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        model._prompt = _Stat(*data.get("prompt", []))
+        model._output = {k: _Stat(*v) for k, v in data.get("output", {}).items()}
+        model._latency = {k: _Stat(*v) for k, v in data.get("latency", {}).items()}
+        return model
+
+
+_model: Optional[UsageModel] = None
+_model_lock = threading.Lock()
+
+
+def get_usage_model() -> UsageModel:
+    """Process-wide usage model, loaded from XHS_USAGE_MODEL if it exists."""
+    global _model
+    with _model_lock:
+        if _model is None:
+            if USAGE_MODEL_PATH and os.path.exists(USAGE_MODEL_PATH):
+                _model = UsageModel.load(USAGE_MODEL_PATH)
+            else:
+                _model = UsageModel()
+        return _model
+
+
+def preflight(
+    prompt: str,
+    model: str,
+    operation: Optional[str] = None,
+    effort: Optional[str] = None,
+    budget: int = MAX_PROMPT_TOKENS
+) -> Estimate:
+    """
+    Predict tokens, latency and cost of a call.
+    Raises TokenBudgetError if the prompt is over budget.
+    """
+    estimate = get_usage_model().estimate(prompt, model, operation, effort)
+    if estimate.prompt_tokens > budget:
+        raise TokenBudgetError(estimate, budget)
+    return estimate
@@ -3,75 +3,360 @@ LLM tools for XHS Text Agent.
 Handles Qwen (通义千问) API calls and JSON parsing with retries.
 """
 
-import os
+import copy
 import json
-from typing import Dict, Any, List, Optional, Tuple
-
-from openai import OpenAI
+import hashlib
+import time
+import threading
+import contextvars
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import replace
+from typing import Dict, Any, Callable, List, Optional, Tuple
 
 from .prompts import (
+    WEEKLY_GENERATION_SYSTEM,
     WEEKLY_GENERATION_PROMPT,
+    WEEKLY_TAGS_RULE,
+    WEEKLY_NO_TAGS_RULE,
+    WEEKLY_TAGS_FIELD,
+    WEEK_CONTEXT_TEMPLATE,
+    PREVIOUS_TITLES_TEMPLATE,
+    MONTHLY_OUTLINE_SYSTEM,
+    MONTHLY_OUTLINE_PROMPT,
+    REGENERATE_DAYS_SYSTEM,
+    REGENERATE_DAYS_PROMPT,
+    REWRITE_DAY_SYSTEM,
     REWRITE_DAY_PROMPT,
+    REWRITE_TAGS_RULE,
+    REWRITE_TAGS_FIELD,
+    REWRITE_FIELDS_SYSTEM,
+    REWRITE_FIELDS_PROMPT,
+    REWRITE_FIELD_SPECS,
+    WEEKLY_REVIEW_SYSTEM,
     WEEKLY_REVIEW_PROMPT,
+    REVIEW_DELTA_SYSTEM,
+    REVIEW_DELTA_PROMPT,
+    JSON_FIX_SYSTEM,
     JSON_FIX_PROMPT
 )
 from .state import DayContent, WeeklyReview
+from .breaker import CircuitOpenError
+from .providers import ProviderRouter, get_router
+from .archive import get_archive
+from .cassette import get_cassette, usage_to_dict
+from .profiling import timed, span
+from .tagging import LOCAL_TAGS, get_tag_engine
+from .jobs import is_cancelled, report_eta, report_progress
+from .dedup import build_index, find_duplicates, signature
+from .instructions import classify_instruction
+from .scheduler import ScheduleTimeoutError, get_scheduler
+from .tokens import (
+    CUSTOM_NOTE_MAX_TOKENS, INSTRUCTION_MAX_TOKENS, MODEL_PRICES, Estimate, TokenBudgetError,
+    get_usage_model, per_choice_usage, preflight, truncate_tokens
+)
+from .rules import bullet_rule, check_plan, describe, strip_violating_tags, violations_by_day
+from .candidates import CANDIDATES_MODE, PLAN_CANDIDATES, plan_problem, rank_plans
 
-# 通义千问 DashScope OpenAI 兼容接口
-DASHSCOPE_BASE_URL = "https://dashscope.aliyuncs.com/compatible-mode/v1"
 DEFAULT_MODEL = "qwen-turbo"  # 可选: qwen-turbo, qwen-plus, qwen-max
 
+# Rounds of targeted regeneration for near-duplicate days
+DEDUP_MAX_ROUNDS = 2
+# Rounds of field/day regeneration for rule violations
+RULES_MAX_ROUNDS = 1
+# A day with this many violating fields is regenerated whole
+RULES_WHOLE_DAY_FIELDS = 3
 
-def get_qwen_client() -> Tuple[Optional[OpenAI], Optional[str]]:
-    """Get Qwen client via DashScope. Returns (client, error_message)."""
-    api_key = os.getenv("DASHSCOPE_API_KEY")
-    if not api_key:
-        return None, "未设置 DASHSCOPE_API_KEY 环境变量。请在 .env 文件中设置或导出环境变量。\n获取方式: https://dashscope.console.aliyun.com/apiKey"
+# Multi-week plans
+MONTH_WEEKS = 4
+# Earlier-week titles passed to the next week as "don't repeat" context
+MONTH_CONTEXT_TITLES = 28
+MONTH_PARALLEL_WEEKS = 2
+
+DEGRADED_MESSAGE = "千问服务暂时不可用，已暂停调用以免长时间等待。请稍后再试。"
+
+# Recently generated plans, served while the breaker is open
+PLAN_POOL_SIZE = 64
+_plan_pool: "OrderedDict[Tuple[str, ...], List[Dict[str, Any]]]" = OrderedDict()
+_plan_pool_lock = threading.Lock()
+
+# Reviews by content hash of plan titles plus feedback
+REVIEW_CACHE_SIZE = 256
+_review_cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+_review_cache_lock = threading.Lock()
+
+
+def get_qwen_client() -> Tuple[Optional[ProviderRouter], Optional[str]]:
+    """
+    Get the LLM client (a router over the configured backends).
+    Returns (client, error_message).
+    """
     try:
-        client = OpenAI(
-            api_key=api_key,
-            base_url=DASHSCOPE_BASE_URL
-        )
-        return client, None
+        router = get_router()
     except Exception as e:
         return None, f"千问客户端初始化失败: {str(e)}"
+    if router is None:
+        cassette = get_cassette()
+        if cassette is not None and cassette.replaying:
+            # Replay never touches the network, no backend needed
+            return ProviderRouter([]), None
+        return None, "未设置 DASHSCOPE_API_KEY 环境变量。请在 .env 文件中设置或导出环境变量。\n获取方式: https://dashscope.console.aliyun.com/apiKey"
+    return router, None
+
 
+def is_llm_degraded() -> bool:
+    """True while no backend can take calls for the default model."""
+    router = get_router()
+    return router is not None and router.is_degraded(DEFAULT_MODEL)
 
-def call_llm(client: OpenAI, prompt: str, model: str = DEFAULT_MODEL) -> str:
-    """Make a simple LLM call and return the response text."""
-    response = client.chat.completions.create(
-        model=model,
-        messages=[{"role": "user", "content": prompt}],
-        temperature=0.7,
-        max_tokens=4000
+
+@timed()
+def call_llm(
+    client: ProviderRouter,
+    prompt: str,
+    model: str = DEFAULT_MODEL,
+    operation: Optional[str] = None,
+    effort: Optional[str] = None,
+    system: Optional[str] = None
+) -> str:
+    """
+    Make a simple LLM call and return the response text.
+    system is the static instruction message sent ahead of the prompt,
+    so calls of one kind share a cacheable prefix (see prompts.py).
+    operation (generate/rewrite/review/json_fix) selects pinned backends;
+    with effort it also sets the expected output size reported as the
+    running job's ETA.
+    Raises CircuitOpenError when every backend's breaker is open,
+    TokenBudgetError (before calling) when the prompt is over budget, and
+    ScheduleTimeoutError when no slot frees up for the caller's tenant.
+    With an active cassette, calls are recorded or replayed offline.
+    """
+    return call_llm_choices(client, prompt, 1, model, operation, effort, system)[0]
+
+
+@timed()
+def call_llm_choices(
+    client: ProviderRouter,
+    prompt: str,
+    n: int,
+    model: str = DEFAULT_MODEL,
+    operation: Optional[str] = None,
+    effort: Optional[str] = None,
+    system: Optional[str] = None
+) -> List[str]:
+    """
+    call_llm asking for n choices in one request (the OpenAI "n"
+    parameter). Returns the texts the server sent, which may be fewer than
+    n for models that ignore the parameter.
+    """
+    messages = [{"role": "user", "content": prompt}]
+    if system:
+        messages.insert(0, {"role": "system", "content": system})
+    full_prompt = f"{system}\n\n{prompt}" if system else prompt
+    params = {"temperature": 0.7, "max_tokens": 4000}
+    if n > 1:
+        # Only added when asked so single-choice requests keep their cassette keys
+        params["n"] = n
+    estimate = preflight(full_prompt, model, operation, effort)
+
+    cassette = get_cassette()
+    if cassette is not None and cassette.replaying:
+        entry = cassette.replay(model, messages, params)
+        return [text.strip() for text in entry.get("choices") or [entry["text"]]]
+
+    # Waits for a fair share of the provider's capacity (see scheduler.py)
+    with get_scheduler().slot(estimate.prompt_tokens + estimate.output_tokens * n) as ticket:
+        report_eta(estimate.seconds)
+        start = time.monotonic()
+        try:
+            response = client.complete(
+                messages=messages,
+                model=model,
+                operation=operation,
+                expected_output_tokens=estimate.output_tokens,
+                **params
+            )
+        except Exception as e:
+            if cassette is not None:
+                cassette.record_error(model, messages, params, e, time.monotonic() - start, operation)
+            raise
+        texts = [choice.message.content for choice in response.choices]
+        elapsed = time.monotonic() - start
+        usage = usage_to_dict(getattr(response, "usage", None))
+        if usage and usage.get("total_tokens"):
+            ticket.tokens = usage["total_tokens"]
+    get_usage_model().observe(
+        operation, effort, model, estimate.estimated_prompt_tokens,
+        per_choice_usage(usage, len(texts)), elapsed, texts[0]
     )
-    return response.choices[0].message.content.strip()
+
+    if cassette is not None:
+        cassette.record(
+            model, messages, params, texts[0],
+            usage=usage,
+            elapsed=elapsed,
+            operation=operation,
+            choices=texts if n > 1 else None
+        )
+    return [text.strip() for text in texts]
 
 
-def parse_json_with_retry(client: OpenAI, text: str) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+def estimate_weekly_generation(
+    niche: str,
+    goal: str,
+    style: str,
+    effort: str,
+    constraints: List[str],
+    custom_note: str,
+    local_tags: Optional[bool] = None,
+    candidates: int = 1
+) -> Estimate:
     """
-    Parse JSON with retry logic.
-    1. First attempt: direct parse
-    2. If fails: ask LLM to fix
-    3. If still fails: return error
-    
-    Returns (parsed_dict, error_message)
+    Pre-flight estimate of the first generation call(s), without calling.
+    Candidates are generated side by side, so they add tokens and cost but
+    not time.
+    """
+    if local_tags is None:
+        local_tags = LOCAL_TAGS
+    prompt = WEEKLY_GENERATION_PROMPT.format(
+        week_context="",
+        **_format_profile(niche, goal, style, effort, constraints, custom_note)
+    )
+    system = _weekly_system(local_tags)
+    estimate = get_usage_model().estimate(f"{system}\n\n{prompt}", DEFAULT_MODEL, "generate", effort)
+    if candidates > 1:
+        # Concurrent requests resend the prompt; one n-choice request does not
+        prompt_tokens = estimate.prompt_tokens * (1 if CANDIDATES_MODE == "n" else candidates)
+        output_tokens = estimate.output_tokens * candidates
+        input_price, output_price = MODEL_PRICES.get(DEFAULT_MODEL, (0.0, 0.0))
+        estimate = replace(
+            estimate,
+            prompt_tokens=prompt_tokens,
+            output_tokens=output_tokens,
+            cost=(prompt_tokens * input_price + output_tokens * output_price) / 1000
+        )
+    return estimate
+
+
+def _weekly_system(local_tags: bool) -> str:
+    return WEEKLY_GENERATION_SYSTEM.format(
+        tags_rule=WEEKLY_NO_TAGS_RULE if local_tags else WEEKLY_TAGS_RULE,
+        tags_field="" if local_tags else WEEKLY_TAGS_FIELD
+    )
+
+
+def _plan_pool_keys(niche: str, goal: str, style: str, effort: str, constraints: List[str]) -> List[Tuple[str, ...]]:
+    """Pool keys from most to least specific."""
+    return [
+        (niche, goal, style, effort, "、".join(sorted(constraints))),
+        (niche, style),
+        (niche,)
+    ]
+
+
+def _format_profile(
+    niche: str,
+    goal: str,
+    style: str,
+    effort: str,
+    constraints: List[str],
+    custom_note: str
+) -> Dict[str, str]:
+    """
+    Onboarding fields as formatted into the generation prompts.
+    The free-text note is cut to CUSTOM_NOTE_MAX_TOKENS.
     """
-    # Clean up common issues
+    return {
+        "niche": niche,
+        "goal": goal,
+        "style": style,
+        "effort": effort,
+        "bullet_rule": bullet_rule(effort),
+        "constraints": "、".join(constraints) if constraints else "无特别限制",
+        "custom_note": truncate_tokens(custom_note, CUSTOM_NOTE_MAX_TOKENS) if custom_note else "无"
+    }
+
+
+def _remember_plan(keys: List[Tuple[str, ...]], days: List[DayContent]):
+    data = [d.to_dict() for d in days]
+    with _plan_pool_lock:
+        for key in keys:
+            _plan_pool[key] = data
+            _plan_pool.move_to_end(key)
+        while len(_plan_pool) > PLAN_POOL_SIZE:
+            _plan_pool.popitem(last=False)
+
+
+def _pooled_plan(keys: List[Tuple[str, ...]]) -> Optional[List[DayContent]]:
+    with _plan_pool_lock:
+        for key in keys:
+            data = _plan_pool.get(key)
+            if data is not None:
+                return [DayContent.from_dict(d) for d in copy.deepcopy(data)]
+    return None
+
+
+def _template_review(
+    weekly_plan: List[DayContent],
+    best_days: List[int],
+    hardest_days: List[int],
+    pace: str
+) -> WeeklyReview:
+    """Offline review used while the LLM is unavailable."""
+    titles = {d.day: d.title for d in weekly_plan}
+    reflection = f"这周你完成了{len(weekly_plan)}天的内容规划，坚持本身就很棒！"
+    suggestions = []
+    if best_days:
+        best = "、".join(f"第{d}天《{titles.get(d, '')}》" for d in best_days)
+        suggestions.append(f"{best}让你感觉最好，下周可以沿用相同的选题角度和结构。")
+    if hardest_days:
+        hard = "、".join(f"第{d}天" for d in hardest_days)
+        suggestions.append(f"{hard}写起来比较难，下周可以把要点减到3个，先写短一点。")
+    if pace == "轻松一点":
+        suggestions.append("下周可以少安排1-2条，优先保证每条都能轻松完成。")
+    elif pace == "多尝试新内容":
+        suggestions.append("下周可以尝试一种新形式，比如清单、对比或者经验复盘。")
+    suggestions.append("发布后留意评论区的问题，它们就是下周最好的选题来源。")
+    return WeeklyReview(reflection=reflection, suggestions=suggestions)
+
+
+def _strip_code_fence(text: str) -> str:
+    """Remove a markdown code block around the JSON, if present."""
     cleaned = text.strip()
-    
-    # Remove markdown code blocks if present
     if cleaned.startswith("```json"):
         cleaned = cleaned[7:]
     elif cleaned.startswith("```"):
         cleaned = cleaned[3:]
     if cleaned.endswith("```"):
         cleaned = cleaned[:-3]
-    cleaned = cleaned.strip()
+    return cleaned.strip()
+
+
+def _loads_json(text: str) -> Optional[Dict[str, Any]]:
+    """Direct parse only (no fix call); None unless the text is a JSON object."""
+    try:
+        result = json.loads(_strip_code_fence(text))
+    except json.JSONDecodeError:
+        return None
+    return result if isinstance(result, dict) else None
+
+
+@timed()
+def parse_json_with_retry(client: ProviderRouter, text: str) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    """
+    Parse JSON with retry logic.
+    1. First attempt: direct parse
+    2. If fails: ask LLM to fix
+    3. If still fails: return error
+    
+    Returns (parsed_dict, error_message)
+    """
+    cleaned = _strip_code_fence(text)
     
     # First attempt
     try:
-        result = json.loads(cleaned)
+        with span("parse_json.direct"):
+            result = json.loads(cleaned)
         return result, None
     except json.JSONDecodeError:
         pass
@@ -79,98 +364,527 @@ def parse_json_with_retry(client: OpenAI, text: str) -> Tuple[Optional[Dict[str,
     # Second attempt: ask LLM to fix
     try:
         fix_prompt = JSON_FIX_PROMPT.format(text=text)
-        fixed_text = call_llm(client, fix_prompt)
+        fixed_text = call_llm(client, fix_prompt, operation="json_fix", system=JSON_FIX_SYSTEM)
         
         # Clean again
-        fixed_cleaned = fixed_text.strip()
-        if fixed_cleaned.startswith("```json"):
-            fixed_cleaned = fixed_cleaned[7:]
-        elif fixed_cleaned.startswith("```"):
-            fixed_cleaned = fixed_cleaned[3:]
-        if fixed_cleaned.endswith("```"):
-            fixed_cleaned = fixed_cleaned[:-3]
-        fixed_cleaned = fixed_cleaned.strip()
+        fixed_cleaned = _strip_code_fence(fixed_text)
         
         result = json.loads(fixed_cleaned)
         return result, None
+    except CircuitOpenError:
+        raise
     except Exception as e:
         return None, f"JSON 解析失败，请重试。错误: {str(e)}"
 
 
+def regenerate_days(
+    client: ProviderRouter,
+    profile: Dict[str, str],
+    days: List[DayContent],
+    day_numbers: List[int],
+    local_tags: bool = False
+) -> List[DayContent]:
+    """
+    Regenerate only the given days of a plan, asking the model to avoid
+    every title already in it. profile holds the formatted onboarding
+    fields of WEEKLY_GENERATION_PROMPT. Days the model fails to return
+    are kept unchanged.
+    """
+    system = REGENERATE_DAYS_SYSTEM.format(
+        tags_rule=WEEKLY_NO_TAGS_RULE if local_tags else WEEKLY_TAGS_RULE,
+        tags_field="" if local_tags else WEEKLY_TAGS_FIELD
+    )
+    prompt = REGENERATE_DAYS_PROMPT.format(
+        existing_titles="\n".join(f"- 第{d.day}天: {d.title}" for d in days),
+        day_numbers="、".join(str(n) for n in day_numbers),
+        **profile
+    )
+    response_text = call_llm(client, prompt, operation="generate", effort=profile["effort"], system=system)
+    parsed, parse_error = parse_json_with_retry(client, response_text)
+    if parse_error:
+        return days
+    
+    replacements = {}
+    for day_data in parsed.get("days", []):
+        day_content = DayContent.from_dict(day_data)
+        if day_content.day in day_numbers:
+            replacements[day_content.day] = day_content
+    return [replacements.get(d.day, d) for d in days]
+
+
+def rewrite_fields(
+    client: ProviderRouter,
+    day_content: DayContent,
+    fields: List[str],
+    guidance: str,
+    effort: Optional[str] = None
+) -> DayContent:
+    """
+    Regenerate only the given fields of a day, keeping the rest.
+    Fields the model leaves out keep their old value. With effort, new
+    bullets are asked to fit its limits.
+    """
+    if effort is not None and "bullets" in fields:
+        guidance = f"{guidance}\n要点要求：{bullet_rule(effort)}"
+    prompt = REWRITE_FIELDS_PROMPT.format(
+        title=day_content.title,
+        hook=day_content.hook,
+        bullets="、".join(day_content.bullets),
+        cta=day_content.cta,
+        tags="、".join(day_content.tags),
+        field_names="、".join(REWRITE_FIELD_SPECS[f][0] for f in fields),
+        guidance=guidance,
+        fields_example=",\n".join(REWRITE_FIELD_SPECS[f][1] for f in fields)
+    )
+    response_text = call_llm(client, prompt, operation="rewrite", system=REWRITE_FIELDS_SYSTEM)
+    parsed, parse_error = parse_json_with_retry(client, response_text)
+    if parse_error:
+        return day_content
+    
+    return DayContent(
+        day=day_content.day,
+        title=parsed.get("title", day_content.title) if "title" in fields else day_content.title,
+        hook=parsed.get("hook", day_content.hook) if "hook" in fields else day_content.hook,
+        bullets=parsed.get("bullets", day_content.bullets) if "bullets" in fields else day_content.bullets,
+        cta=parsed.get("cta", day_content.cta) if "cta" in fields else day_content.cta,
+        tags=parsed.get("tags", day_content.tags) if "tags" in fields else day_content.tags
+    )
+
+
+def enforce_rules(
+    client: ProviderRouter,
+    days: List[DayContent],
+    constraints: List[str],
+    effort: Optional[str],
+    profile: Optional[Dict[str, str]] = None,
+    local_tags: bool = False,
+    fields: Optional[List[str]] = None
+) -> List[DayContent]:
+    """
+    Fix rule violations with the smallest regeneration: violating tags are
+    dropped locally, violating fields are rewritten, and days with many
+    violating fields are regenerated whole (when profile is given).
+    With fields, only violations in those fields are fixed.
+    """
+    for day in days:
+        strip_violating_tags(day, constraints)
+    
+    for _ in range(RULES_MAX_ROUNDS):
+        violations = [
+            v for v in check_plan(days, constraints, effort)
+            if v.field != "tags" and (fields is None or v.field in fields)
+        ]
+        if not violations:
+            break
+        grouped = violations_by_day(violations)
+        
+        whole_days = []
+        if profile is not None:
+            whole_days = [n for n, vs in grouped.items() if len({v.field for v in vs}) >= RULES_WHOLE_DAY_FIELDS]
+            if whole_days:
+                days = regenerate_days(client, profile, days, whole_days, local_tags)
+        
+        for i, day in enumerate(days):
+            day_violations = grouped.get(day.day)
+            if not day_violations or day.day in whole_days:
+                continue
+            broken = [f for f in REWRITE_FIELD_SPECS if any(v.field == f for v in day_violations)]
+            days[i] = rewrite_fields(client, day, broken, describe(day_violations))
+        
+        for day in days:
+            strip_violating_tags(day, constraints)
+    return days
+
+
+@timed()
 def generate_weekly_content(
     niche: str,
     goal: str,
     style: str,
     effort: str,
     constraints: List[str],
-    custom_note: str
+    custom_note: str,
+    local_tags: Optional[bool] = None,
+    history: Optional[List[bytes]] = None,
+    week_context: str = ""
 ) -> Tuple[Optional[List[DayContent]], Optional[str]]:
     """
     Generate a 7-day content plan.
+    With local_tags (default: XHS_LOCAL_TAGS) the model is not asked for
+    tags and the local tag engine assigns them.
+    Days that nearly repeat another day or a post from history (the
+    creator's past-week signatures) are regenerated individually.
+    week_context places the week inside a multi-week plan.
     Returns (list of DayContent, error_message)
     """
+    plans, error = generate_weekly_candidates(
+        niche, goal, style, effort, constraints, custom_note,
+        candidates=1,
+        local_tags=local_tags,
+        history=history,
+        week_context=week_context
+    )
+    return (plans[0] if plans else None), error
+
+
+def _plan_texts(
+    client: ProviderRouter,
+    prompt: str,
+    candidates: int,
+    effort: str,
+    system: str
+) -> List[str]:
+    """
+    Raw responses for up to candidates plans, per CANDIDATES_MODE.
+    Concurrent requests that fail are dropped; raises the first error if
+    none succeeded.
+    """
+    if candidates == 1:
+        return [call_llm(client, prompt, operation="generate", effort=effort, system=system)]
+    if CANDIDATES_MODE == "n":
+        return call_llm_choices(client, prompt, candidates, operation="generate", effort=effort, system=system)
+    with ThreadPoolExecutor(max_workers=candidates) as pool:
+        futures = [
+            pool.submit(contextvars.copy_context().run, call_llm, client, prompt,
+                        operation="generate", effort=effort, system=system)
+            for _ in range(candidates)
+        ]
+        texts, errors = [], []
+        for future in futures:
+            try:
+                texts.append(future.result())
+            except Exception as e:
+                errors.append(e)
+    # A failed candidate is dropped; the caller handles the error only if all failed
+    if not texts:
+        raise errors[0]
+    return texts
+
+
+def _parse_plan(parsed: Dict[str, Any]) -> List[DayContent]:
+    return [DayContent.from_dict(day_data) for day_data in parsed.get("days", [])]
+
+
+@timed()
+def generate_weekly_candidates(
+    niche: str,
+    goal: str,
+    style: str,
+    effort: str,
+    constraints: List[str],
+    custom_note: str,
+    candidates: Optional[int] = None,
+    local_tags: Optional[bool] = None,
+    history: Optional[List[bytes]] = None,
+    week_context: str = ""
+) -> Tuple[Optional[List[List[DayContent]]], Optional[str]]:
+    """
+    Generate candidates (default: XHS_PLAN_CANDIDATES) 7-day plans from one
+    prompt and rank them locally (see candidates.py).
+    The best plan goes through the full generate_weekly_content pipeline;
+    the alternatives only get local tag cleanup and tagging, so showing one
+    later costs no LLM call.
+    Returns (plans best first, error_message)
+    """
+    if local_tags is None:
+        local_tags = LOCAL_TAGS
+    if candidates is None:
+        candidates = PLAN_CANDIDATES
+    pool_keys = _plan_pool_keys(niche, goal, style, effort, constraints)
+
     client, error = get_qwen_client()
     if error:
         return None, error
     
-    # Format constraints
-    constraints_str = "、".join(constraints) if constraints else "无特别限制"
-    custom_str = custom_note if custom_note else "无"
-    
-    prompt = WEEKLY_GENERATION_PROMPT.format(
-        niche=niche,
-        goal=goal,
-        style=style,
-        effort=effort,
-        constraints=constraints_str,
-        custom_note=custom_str
-    )
+    profile = _format_profile(niche, goal, style, effort, constraints, custom_note)
+    prompt = WEEKLY_GENERATION_PROMPT.format(week_context=week_context, **profile)
     
     try:
-        response_text = call_llm(client, prompt)
-        parsed, parse_error = parse_json_with_retry(client, response_text)
+        texts = _plan_texts(client, prompt, candidates, effort, _weekly_system(local_tags))
         
-        if parse_error:
-            return None, parse_error
+        plans = []
+        for text in texts:
+            parsed = _loads_json(text)
+            if parsed is not None:
+                plans.append(_parse_plan(parsed))
+        if not plans:
+            # Only when every candidate is broken is the model asked to fix one
+            parsed, parse_error = parse_json_with_retry(client, texts[0])
+            if parse_error:
+                return None, parse_error
+            plans.append(_parse_plan(parsed))
+        
+        history_index = build_index(history) if history else None
+        # A lone plan is only held to the original seven-day check
+        strict = len(plans) > 1
+        ranked = rank_plans(plans, constraints, effort, history_index, strict)
+        if not ranked:
+            return None, plan_problem(plans[0], strict)
+        days, alternatives = ranked[0], ranked[1:]
         
-        # Convert to DayContent objects
-        days = []
-        for day_data in parsed.get("days", []):
-            day_content = DayContent.from_dict(day_data)
-            days.append(day_content)
+        for _ in range(DEDUP_MAX_ROUNDS):
+            duplicates = find_duplicates(days, history_index)
+            if not duplicates:
+                break
+            days = regenerate_days(client, profile, days, [d.day for d in duplicates], local_tags)
         
-        if len(days) != 7:
-            return None, f"生成的内容天数不正确（期望7天，实际{len(days)}天），请重试。"
+        days = enforce_rules(client, days, constraints, effort, profile, local_tags)
         
-        return days, None
+        _apply_tags(niche, days, constraints, local_tags)
+        _remember_plan(pool_keys, days)
+        _archive("post", [d.to_dict() for d in days], niche, style)
+        for alternative in alternatives:
+            for day in alternative:
+                strip_violating_tags(day, constraints)
+            if local_tags:
+                get_tag_engine().assign_plan(niche, alternative)
+        return [days] + alternatives, None
         
+    except CircuitOpenError:
+        pooled = _pooled_plan(pool_keys)
+        if pooled is not None:
+            return [pooled], None
+        return None, DEGRADED_MESSAGE
+    except (TokenBudgetError, ScheduleTimeoutError) as e:
+        return None, str(e)
     except Exception as e:
         return None, f"生成内容时出错: {str(e)}"
 
 
+def _archive(kind: str, items: List[Dict[str, Any]], niche: Optional[str] = None, style: Optional[str] = None):
+    """Append results to the archive (XHS_ARCHIVE_DIR); never fails the caller."""
+    archive = get_archive()
+    if archive is None:
+        return
+    try:
+        archive.add(kind, items, niche, style)
+    except OSError:
+        pass
+
+
+def _apply_tags(niche: str, days: List[DayContent], constraints: List[str], local_tags: bool):
+    """Assign local tags, or learn from the model's tags."""
+    if local_tags:
+        get_tag_engine().assign_plan(niche, days)
+        for day in days:
+            strip_violating_tags(day, constraints)
+    else:
+        get_tag_engine().observe_plan(niche, days)
+
+
+def plan_month_outline(client: ProviderRouter, profile: Dict[str, str], weeks: int) -> List[str]:
+    """One theme per week. Themes the model fails to return are left empty."""
+    prompt = MONTHLY_OUTLINE_PROMPT.format(total_weeks=weeks, **profile)
+    response_text = call_llm(client, prompt, operation="generate", system=MONTHLY_OUTLINE_SYSTEM)
+    parsed, parse_error = parse_json_with_retry(client, response_text)
+    themes = [""] * weeks
+    if parse_error:
+        return themes
+    for i, item in enumerate(parsed.get("weeks", [])[:weeks]):
+        themes[i] = str(item.get("theme", "")) if isinstance(item, dict) else str(item)
+    return themes
+
+
+def _week_context(week: int, total_weeks: int, theme: str, previous_titles: List[str]) -> str:
+    titles = ""
+    if previous_titles:
+        titles = PREVIOUS_TITLES_TEMPLATE.format(titles="\n".join(f"- {t}" for t in previous_titles))
+    return WEEK_CONTEXT_TEMPLATE.format(
+        total_weeks=total_weeks,
+        week=week + 1,
+        theme=theme or "由你安排",
+        previous_titles=titles
+    )
+
+
+@timed()
+def generate_monthly_plan(
+    niche: str,
+    goal: str,
+    style: str,
+    effort: str,
+    constraints: List[str],
+    custom_note: str,
+    weeks: int = MONTH_WEEKS,
+    parallel: bool = False,
+    local_tags: Optional[bool] = None,
+    history: Optional[List[bytes]] = None,
+    on_week: Optional[Callable[[int, List[DayContent]], None]] = None
+) -> Tuple[Optional[Tuple[List[List[DayContent]], List[str]]], Optional[str]]:
+    """
+    Generate a multi-week plan: one outline call for weekly themes, then
+    one generate_weekly_content call per week.
+    Sequentially, each week sees the titles of the weeks before it and is
+    deduplicated against their signatures. With parallel, up to
+    MONTH_PARALLEL_WEEKS weeks run at once and cross-week repeats are
+    regenerated afterwards instead.
+    on_week(index, days) is called as each week completes; progress is
+    reported to the running job.
+    Returns ((weeks, themes), error_message)
+    """
+    client, error = get_qwen_client()
+    if error:
+        return None, error
+    profile = _format_profile(niche, goal, style, effort, constraints, custom_note)
+    
+    report_progress("正在规划每周主题…")
+    try:
+        themes = plan_month_outline(client, profile, weeks)
+    except CircuitOpenError:
+        return None, DEGRADED_MESSAGE
+    except Exception:
+        themes = [""] * weeks
+    
+    history = list(history or [])
+    plan: List[Optional[List[DayContent]]] = [None] * weeks
+    
+    def generate_week(index: int, previous_titles: List[str], week_history: List[bytes]):
+        return generate_weekly_content(
+            niche, goal, style, effort, constraints, custom_note,
+            local_tags=local_tags,
+            history=week_history,
+            week_context=_week_context(index, weeks, themes[index], previous_titles)
+        )
+    
+    def finish_week(index: int, days: List[DayContent]):
+        plan[index] = days
+        done = sum(1 for w in plan if w is not None)
+        report_progress(f"已完成第{index + 1}周（{done}/{weeks}）")
+        if on_week is not None:
+            on_week(index, days)
+    
+    if not parallel:
+        titles: List[str] = []
+        for index in range(weeks):
+            if is_cancelled():
+                return None, "已取消"
+            report_progress(f"正在生成第{index + 1}/{weeks}周…")
+            days, error = generate_week(index, titles[-MONTH_CONTEXT_TITLES:], history)
+            if error:
+                return None, f"第{index + 1}周：{error}"
+            titles.extend(d.title for d in days)
+            history.extend(signature(d) for d in days)
+            finish_week(index, days)
+    else:
+        report_progress(f"正在生成{weeks}周内容…")
+        with ThreadPoolExecutor(max_workers=MONTH_PARALLEL_WEEKS) as pool:
+            # Carry the job's context vars (profiling sink, ...) into each week
+            futures = {
+                pool.submit(contextvars.copy_context().run, generate_week, index, [], history): index
+                for index in range(weeks)
+            }
+            for future in as_completed(futures):
+                index = futures[future]
+                days, error = future.result()
+                if error:
+                    for other in futures:
+                        other.cancel()
+                    return None, f"第{index + 1}周：{error}"
+                finish_week(index, days)
+        if local_tags is None:
+            local_tags = LOCAL_TAGS
+        for index in range(1, weeks):
+            earlier = build_index(history + [signature(d) for week in plan[:index] for d in week])
+            duplicates = find_duplicates(plan[index], earlier)
+            if not duplicates:
+                continue
+            report_progress(f"正在替换第{index + 1}周与前几周重复的内容…")
+            redone = [d.day for d in duplicates]
+            try:
+                days = regenerate_days(client, profile, plan[index], redone, local_tags)
+                days = enforce_rules(client, days, constraints, effort)
+                replaced = [d for d in days if d.day in redone]
+                _apply_tags(niche, replaced, constraints, local_tags)
+                _archive("post", [d.to_dict() for d in replaced], niche, style)
+            except CircuitOpenError:
+                # Same outcome as a week failing on the sequential path
+                return None, DEGRADED_MESSAGE
+            except (TokenBudgetError, ScheduleTimeoutError) as e:
+                return None, f"第{index + 1}周：{e}"
+            except Exception:
+                # Keep the week as generated, like regenerate_days does for unparseable replies
+                continue
+            plan[index] = days
+
+    return (plan, themes), None
+
+
+@timed()
 def rewrite_day_content(
     day_content: DayContent,
-    instruction: str
+    instruction: str,
+    niche: Optional[str] = None,
+    local_tags: Optional[bool] = None,
+    constraints: Optional[List[str]] = None,
+    effort: Optional[str] = None,
+    fields: Optional[List[str]] = None
 ) -> Tuple[Optional[DayContent], Optional[str]]:
     """
     Rewrite a single day's content based on user instruction.
+    Only the fields the instruction touches are regenerated: fields, or
+    if not given, the fields classify_instruction finds in it. With
+    local_tags the tags come from the local tag engine.
+    Fields that break the user's constraints are regenerated on their own.
+    The instruction is cut to INSTRUCTION_MAX_TOKENS.
     Returns (new DayContent, error_message)
     """
+    if local_tags is None:
+        local_tags = LOCAL_TAGS
+    instruction = truncate_tokens(instruction, INSTRUCTION_MAX_TOKENS)
+    if fields is None:
+        fields = classify_instruction(instruction)
+    elif not fields or set(fields) >= set(REWRITE_FIELD_SPECS):
+        fields = None
+    constraints = constraints or []
+    
+    if fields is not None and local_tags and fields == ["tags"]:
+        # Nothing for the model to do
+        new_content = DayContent.from_dict(day_content.to_dict())
+        new_content.tags = get_tag_engine().assign(niche, new_content)
+        strip_violating_tags(new_content, constraints)
+        _archive("post", [new_content.to_dict()], niche)
+        return new_content, None
+    
     client, error = get_qwen_client()
     if error:
         return None, error
     
+    if fields is not None:
+        try:
+            requested = [f for f in fields if not (local_tags and f == "tags")]
+            new_content = rewrite_fields(client, day_content, requested, instruction, effort)
+            # Fields the instruction didn't touch are left as they were
+            new_content = enforce_rules(client, [new_content], constraints, effort, fields=requested)[0]
+            if local_tags:
+                new_content.tags = get_tag_engine().assign(niche, new_content)
+                strip_violating_tags(new_content, constraints)
+            elif "tags" in requested:
+                get_tag_engine().observe(niche, new_content)
+            _archive("post", [new_content.to_dict()], niche)
+            return new_content, None
+        except CircuitOpenError:
+            return None, DEGRADED_MESSAGE
+        except (TokenBudgetError, ScheduleTimeoutError) as e:
+            return None, str(e)
+        except Exception as e:
+            return None, f"改写内容时出错: {str(e)}"
+    
     prompt = REWRITE_DAY_PROMPT.format(
         title=day_content.title,
         hook=day_content.hook,
         bullets="、".join(day_content.bullets),
         cta=day_content.cta,
         tags="、".join(day_content.tags),
+        bullet_rule=bullet_rule(effort),
         instruction=instruction
     )
+    system = REWRITE_DAY_SYSTEM.format(
+        tags_rule="" if local_tags else REWRITE_TAGS_RULE,
+        tags_field="" if local_tags else REWRITE_TAGS_FIELD
+    )
     
     try:
-        response_text = call_llm(client, prompt)
+        response_text = call_llm(client, prompt, operation="rewrite", system=system)
         parsed, parse_error = parse_json_with_retry(client, response_text)
         
         if parse_error:
@@ -186,23 +900,131 @@ def rewrite_day_content(
             tags=parsed.get("tags", day_content.tags)
         )
         
+        new_content = enforce_rules(client, [new_content], constraints, effort)[0]
+        
+        if local_tags:
+            new_content.tags = get_tag_engine().assign(niche, new_content)
+            strip_violating_tags(new_content, constraints)
+        else:
+            get_tag_engine().observe(niche, new_content)
+        
+        _archive("post", [new_content.to_dict()], niche)
         return new_content, None
         
+    except CircuitOpenError:
+        return None, DEGRADED_MESSAGE
+    except (TokenBudgetError, ScheduleTimeoutError) as e:
+        return None, str(e)
     except Exception as e:
         return None, f"改写内容时出错: {str(e)}"
 
 
-def generate_weekly_review(
+def review_basis(
     weekly_plan: List[DayContent],
     best_days: List[int],
     hardest_days: List[int],
     pace: str,
     notes: str
+) -> Dict[str, Any]:
+    """Everything a weekly review depends on."""
+    return {
+        "titles": [d.title for d in weekly_plan],
+        "best_days": sorted(best_days),
+        "hardest_days": sorted(hardest_days),
+        "pace": pace or "",
+        "notes": (notes or "").strip()
+    }
+
+
+def review_key(basis: Dict[str, Any]) -> str:
+    raw = json.dumps(basis, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
+
+def cached_weekly_review(basis: Dict[str, Any]) -> Optional[WeeklyReview]:
+    key = review_key(basis)
+    with _review_cache_lock:
+        data = _review_cache.get(key)
+        if data is None:
+            return None
+        _review_cache.move_to_end(key)
+    return WeeklyReview.from_dict(copy.deepcopy(data))
+
+
+def _remember_review(basis: Dict[str, Any], review: WeeklyReview):
+    key = review_key(basis)
+    with _review_cache_lock:
+        _review_cache[key] = copy.deepcopy(review.to_dict())
+        _review_cache.move_to_end(key)
+        while len(_review_cache) > REVIEW_CACHE_SIZE:
+            _review_cache.popitem(last=False)
+
+
+def _changed_day(previous: Dict[str, Any], basis: Dict[str, Any]) -> Optional[int]:
+    """Index of the only changed title when the feedback is the same, else None."""
+    if any(previous[k] != basis[k] for k in basis if k != "titles"):
+        return None
+    if len(previous["titles"]) != len(basis["titles"]):
+        return None
+    changed = [i for i, (a, b) in enumerate(zip(previous["titles"], basis["titles"])) if a != b]
+    return changed[0] if len(changed) == 1 else None
+
+
+def _update_review(
+    client: ProviderRouter,
+    weekly_plan: List[DayContent],
+    index: int,
+    old_title: str,
+    review: WeeklyReview,
+    summary: Dict[str, str]
+) -> Optional[WeeklyReview]:
+    """Revise a review after one day changed. None if the delta answer is unusable."""
+    prompt = REVIEW_DELTA_PROMPT.format(
+        day=weekly_plan[index].day,
+        old_title=old_title,
+        new_title=weekly_plan[index].title,
+        reflection=review.reflection,
+        suggestions="\n".join(f"{i}. {s}" for i, s in enumerate(review.suggestions, 1)),
+        **summary
+    )
+    response_text = call_llm(client, prompt, operation="review", system=REVIEW_DELTA_SYSTEM)
+    parsed, parse_error = parse_json_with_retry(client, response_text)
+    if parse_error or not isinstance(parsed, dict):
+        return None
+    
+    suggestions = list(review.suggestions)
+    for update in parsed.get("updates", []):
+        try:
+            i = int(update["index"]) - 1
+        except (KeyError, TypeError, ValueError):
+            continue
+        if 0 <= i < len(suggestions) and update.get("suggestion"):
+            suggestions[i] = update["suggestion"]
+    return WeeklyReview(reflection=parsed.get("reflection") or review.reflection, suggestions=suggestions)
+
+
+@timed()
+def generate_weekly_review(
+    weekly_plan: List[DayContent],
+    best_days: List[int],
+    hardest_days: List[int],
+    pace: str,
+    notes: str,
+    previous_basis: Optional[Dict[str, Any]] = None,
+    previous_review: Optional[WeeklyReview] = None
 ) -> Tuple[Optional[WeeklyReview], Optional[str]]:
     """
     Generate weekly review based on user feedback.
+    Reviews are memoized on review_basis(). When previous_review was made
+    for previous_basis and only one day's title changed since, a delta
+    prompt updates just the affected suggestions.
     Returns (WeeklyReview, error_message)
     """
+    basis = review_basis(weekly_plan, best_days, hardest_days, pace, notes)
+    cached = cached_weekly_review(basis)
+    if cached is not None:
+        return cached, None
+    
     client, error = get_qwen_client()
     if error:
         return None, error
@@ -219,24 +1041,40 @@ def generate_weekly_review(
     pace_str = pace if pace else "未选择"
     notes_str = notes if notes else "无"
     
-    prompt = WEEKLY_REVIEW_PROMPT.format(
-        weekly_summary=weekly_summary,
-        best_days=best_str,
-        hardest_days=hardest_str,
-        pace=pace_str,
-        notes=notes_str
-    )
+    summary = {
+        "weekly_summary": weekly_summary,
+        "best_days": best_str,
+        "hardest_days": hardest_str,
+        "pace": pace_str,
+        "notes": notes_str
+    }
+    prompt = WEEKLY_REVIEW_PROMPT.format(**summary)
     
     try:
-        response_text = call_llm(client, prompt)
+        if previous_basis is not None and previous_review is not None:
+            index = _changed_day(previous_basis, basis)
+            if index is not None:
+                review = _update_review(
+                    client, weekly_plan, index, previous_basis["titles"][index], previous_review, summary
+                )
+                if review is not None:
+                    _remember_review(basis, review)
+                    _archive("review", [review.to_dict()])
+                    return review, None
+        
+        response_text = call_llm(client, prompt, operation="review", system=WEEKLY_REVIEW_SYSTEM)
         parsed, parse_error = parse_json_with_retry(client, response_text)
         
         if parse_error:
             return None, parse_error
         
         review = WeeklyReview.from_dict(parsed)
+        _remember_review(basis, review)
+        _archive("review", [review.to_dict()])
         return review, None
         
+    except (CircuitOpenError, ScheduleTimeoutError):
+        return _template_review(weekly_plan, best_days, hardest_days, pace), None
     except Exception as e:
         return None, f"生成复盘时出错: {str(e)}"
 
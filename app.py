@@ -3,6 +3,13 @@ XHS Text Agent - 小红书创作小白 · 文字内容生成
 A Streamlit app for generating weekly text content plans.
 """
 
+import io
+import os
+import json
+import time
+import pstats
+import cProfile
+
 import streamlit as st
 from dotenv import load_dotenv
 
@@ -10,7 +17,23 @@ from dotenv import load_dotenv
 load_dotenv()
 from agent.state import get_state, update_state, DayContent
 from agent.router import get_current_view, advance_onboarding
-from agent.tools import generate_weekly_content, rewrite_day_content, generate_weekly_review
+from agent.tools import (
+    MONTH_WEEKS, generate_weekly_candidates, generate_monthly_plan, rewrite_day_content, generate_weekly_review,
+    review_basis, review_key, cached_weekly_review, estimate_weekly_generation, is_llm_degraded
+)
+from agent.instructions import classify_instruction
+from agent.candidates import PLAN_CANDIDATES, candidate_stats, record_alternative_served
+from agent.export import export_bytes, rows_from_state
+from agent.providers import get_router, warm_up
+from agent import profiling
+from agent.memory import deep_sizeof, get_session_registry
+from agent.scheduler import get_scheduler, set_tenant
+from agent.jobs import get_job_queue, QueueFullError, PRIORITY_GENERATE, PRIORITY_REWRITE, PRIORITY_REVIEW
+
+# How often a waiting view reruns to poll its background job
+JOB_POLL_SECONDS = 0.5
+# The profiling panel shows process-wide data (other sessions, all tenants) only with this set
+PROFILE_ADMIN = os.getenv("XHS_PROFILE_ADMIN") == "1"
 
 
 # Page config
@@ -61,6 +84,34 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 
+def poll_job(job_id):
+    """
+    Check a background job. Returns (job, finished).
+    Finished jobs are collected from the queue; a job that no longer
+    exists (expired or cancelled) is reported as (None, True).
+    """
+    queue = get_job_queue()
+    job = queue.get(job_id)
+    if job is None:
+        return None, True
+    if job.is_active:
+        return job, False
+    return queue.collect(job_id), True
+
+
+def wait_for_job(job, label, cancel_key):
+    """Show job progress and poll again. Returns True if the user cancelled."""
+    status = "排队中" if job.status == "queued" else (job.progress or "处理中")
+    eta = job.eta
+    remaining = f"，预计还需约 {max(1, round(eta))} 秒" if eta is not None else ""
+    st.info(f"⏳ {label}（{status}，已等待 {int(job.elapsed)} 秒{remaining}）")
+    if st.button("取消", key=cancel_key):
+        get_job_queue().cancel(job.id)
+        return True
+    time.sleep(JOB_POLL_SECONDS)
+    st.rerun()
+
+
 def render_header():
     """Render the app header."""
     st.markdown("""
@@ -240,6 +291,11 @@ def render_ready_to_generate():
     
     st.markdown("### ✅ 设置完成！")
     
+    # Onboarding never needs the LLM SDK; start loading it now
+    if "llm_warmed_up" not in st.session_state:
+        st.session_state.llm_warmed_up = True
+        warm_up()
+    
     st.markdown("**你的创作档案：**")
     st.markdown(f"""
     - 🎯 赛道：{state.niche}
@@ -252,6 +308,32 @@ def render_ready_to_generate():
     
     st.divider()
     
+    if state.generation_job_id:
+        job, finished = poll_job(state.generation_job_id)
+        if not finished:
+            if wait_for_job(job, "正在生成内容，请稍候", "cancel_generation"):
+                state.generation_job_id = None
+                update_state(state)
+                st.rerun()
+            return
+        
+        state.generation_job_id = None
+        if job is not None and job.error:
+            state.generation_error = job.error
+        elif job is not None:
+            result, error = job.result
+            if error:
+                state.generation_error = error
+            elif job.kind == "generate_month":
+                weeks, themes = result
+                state.set_plan_weeks(weeks, themes)
+                state.generation_error = None
+            else:
+                state.set_plan_candidates(result)
+                state.generation_error = None
+        update_state(state)
+        st.rerun()
+    
     if state.generation_error:
         st.error(state.generation_error)
     
@@ -269,34 +351,74 @@ def render_ready_to_generate():
             st.rerun()
     
     with col2:
-        if st.button("🎉 生成我的一周内容", type="primary", use_container_width=True):
-            with st.spinner("正在生成内容，请稍候..."):
-                days, error = generate_weekly_content(
-                    niche=state.niche,
-                    goal=state.goal,
-                    style=state.style,
-                    effort=state.effort,
-                    constraints=state.constraints,
-                    custom_note=state.custom_note
-                )
-                
-                if error:
-                    state.generation_error = error
-                    update_state(state)
-                    st.rerun()
-                else:
-                    state.weekly_plan = days
-                    state.generation_error = None
-                    update_state(state)
-                    st.rerun()
+        generate_week = st.button("🎉 生成我的一周内容", type="primary", use_container_width=True)
+    generate_month = st.button(f"📆 一次生成{MONTH_WEEKS}周内容", use_container_width=True)
+    estimate = estimate_weekly_generation(
+        state.niche, state.goal, state.style, state.effort, list(state.constraints), state.custom_note,
+        candidates=PLAN_CANDIDATES
+    )
+    alternatives = f"，同时准备 {PLAN_CANDIDATES - 1} 个备选版本" if PLAN_CANDIDATES > 1 else ""
+    st.caption(f"预计生成一周约需 {round(estimate.seconds)} 秒（约 {estimate.total_tokens} tokens{alternatives}）")
+    
+    if generate_week or generate_month:
+        profile_key = "|".join([
+            state.niche, state.goal, state.style, state.effort,
+            "、".join(state.constraints), state.custom_note
+        ])
+        kind, fn, extra = "generate", generate_weekly_candidates, {}
+        if generate_month:
+            kind, fn, extra = "generate_month", generate_monthly_plan, {"weeks": MONTH_WEEKS}
+        try:
+            job = get_job_queue().submit(
+                state.session_id,
+                kind,
+                fn,
+                priority=PRIORITY_GENERATE,
+                idempotency_key=profile_key,
+                niche=state.niche,
+                goal=state.goal,
+                style=state.style,
+                effort=state.effort,
+                constraints=list(state.constraints),
+                custom_note=state.custom_note,
+                history=state.history_signatures(),
+                **extra
+            )
+            state.generation_job_id = job.id
+            state.generation_error = None
+        except QueueFullError as e:
+            state.generation_error = str(e)
+        update_state(state)
+        st.rerun()
 
 
 def render_weekly_plan():
     """Render the weekly plan view."""
     state = get_state()
     
-    st.markdown("### 📅 你的一周内容计划")
-    st.markdown(f"赛道：**{state.niche}** | 风格：**{state.style}**")
+    if len(state.plan_weeks) > 1:
+        st.markdown(f"### 📅 你的{len(state.plan_weeks)}周内容计划")
+        st.markdown(f"赛道：**{state.niche}** | 风格：**{state.style}**")
+        labels = [
+            f"第{i + 1}周" + (f" · {theme}" if theme else "")
+            for i, theme in enumerate(state.week_themes or [""] * len(state.plan_weeks))
+        ]
+        selected = st.selectbox("选择周", range(len(labels)), index=state.current_week,
+                                format_func=lambda i: labels[i], key="week_select")
+        if selected != state.current_week:
+            state.select_week(selected)
+            update_state(state)
+            st.rerun()
+    else:
+        st.markdown("### 📅 你的一周内容计划")
+        st.markdown(f"赛道：**{state.niche}** | 风格：**{state.style}**")
+        if state.plan_alternatives:
+            # Candidates generated with this plan: switching needs no LLM call
+            if st.button(f"🔀 换一版（共 {len(state.plan_alternatives) + 1} 版，无需等待）", key="next_alternative"):
+                state.next_alternative()
+                record_alternative_served()
+                update_state(state)
+                st.rerun()
     
     # Day cards
     for day in state.weekly_plan:
@@ -322,6 +444,9 @@ def render_weekly_plan():
     
     st.divider()
     
+    with st.expander("📤 导出内容", expanded=False):
+        render_export()
+    
     # Weekly review section
     with st.expander("📊 周复盘与下周建议", expanded=False):
         render_weekly_review_form()
@@ -335,6 +460,21 @@ def render_weekly_plan():
         st.rerun()
 
 
+def render_export():
+    """Render the plan download button."""
+    state = get_state()
+    labels = {"md": "Markdown（可直接粘贴到小红书）", "csv": "CSV（表格）", "jsonl": "JSONL"}
+    fmt = st.radio("格式", list(labels), format_func=lambda f: labels[f], horizontal=True, key="export_format")
+    weeks = f"{len(state.plan_weeks)}周" if len(state.plan_weeks) > 1 else "一周"
+    st.download_button(
+        f"⬇️ 下载{weeks}内容",
+        data=export_bytes(rows_from_state(state, plan="小红书内容计划"), fmt),
+        file_name=f"xhs_plan.{fmt}",
+        mime={"md": "text/markdown", "csv": "text/csv", "jsonl": "application/jsonl"}[fmt],
+        key="export_download"
+    )
+
+
 def render_view_day():
     """Render single day content view."""
     state = get_state()
@@ -419,6 +559,44 @@ def render_rewrite_day():
         key="rewrite_instruction_input"
     )
     
+    field_labels = {"title": "标题", "hook": "开头", "bullets": "要点", "cta": "互动引导", "tags": "标签"}
+    selected_fields = st.multiselect(
+        "只改这些部分（不选则根据要求自动判断）",
+        list(field_labels),
+        format_func=lambda f: field_labels[f],
+        key="rewrite_fields_input"
+    )
+    fields = selected_fields or classify_instruction(instruction)
+    if instruction.strip():
+        scope = "、".join(field_labels[f] for f in fields) if fields else "整条内容"
+        st.caption(f"将改写：{scope}")
+    
+    if state.rewrite_job_id:
+        job, finished = poll_job(state.rewrite_job_id)
+        if not finished:
+            if wait_for_job(job, "正在改写", "cancel_rewrite"):
+                state.rewrite_job_id = None
+                update_state(state)
+                st.rerun()
+            return
+        
+        state.rewrite_job_id = None
+        if job is not None and job.error:
+            state.generation_error = job.error
+        elif job is not None:
+            new_content, error = job.result
+            if error:
+                state.generation_error = error
+            else:
+                # Update the weekly plan
+                state.set_day(new_content)
+                
+                state.rewriting_day = None
+                state.viewing_day = day_num  # Show the updated content
+                state.generation_error = None
+        update_state(state)
+        st.rerun()
+    
     if state.generation_error:
         st.error(state.generation_error)
     
@@ -432,25 +610,26 @@ def render_rewrite_day():
     
     with col2:
         if st.button("🔄 开始改写", type="primary", disabled=not instruction.strip()):
-            with st.spinner("正在改写..."):
-                new_content, error = rewrite_day_content(day_content, instruction)
-                
-                if error:
-                    state.generation_error = error
-                    update_state(state)
-                    st.rerun()
-                else:
-                    # Update the weekly plan
-                    for i, d in enumerate(state.weekly_plan):
-                        if d.day == day_num:
-                            state.weekly_plan[i] = new_content
-                            break
-                    
-                    state.rewriting_day = None
-                    state.viewing_day = day_num  # Show the updated content
-                    state.generation_error = None
-                    update_state(state)
-                    st.rerun()
+            try:
+                job = get_job_queue().submit(
+                    state.session_id,
+                    "rewrite",
+                    rewrite_day_content,
+                    day_content,
+                    instruction,
+                    niche=state.niche,
+                    constraints=list(state.constraints),
+                    effort=state.effort,
+                    fields=fields,
+                    priority=PRIORITY_REWRITE,
+                    idempotency_key=f"{state.current_week}|{day_num}|{instruction}|{','.join(fields or [])}"
+                )
+                state.rewrite_job_id = job.id
+                state.generation_error = None
+            except QueueFullError as e:
+                state.generation_error = str(e)
+            update_state(state)
+            st.rerun()
 
 
 def render_weekly_review_form():
@@ -487,6 +666,32 @@ def render_weekly_review_form():
         key="review_notes"
     )
     
+    if state.review_job_id:
+        job, finished = poll_job(state.review_job_id)
+        if not finished:
+            if wait_for_job(job, "正在生成复盘", "cancel_review"):
+                state.review_job_id = None
+                update_state(state)
+                st.rerun()
+            return
+        
+        state.review_job_id = None
+        if job is not None and job.error:
+            state.review_error = job.error
+        elif job is not None:
+            review, error = job.result
+            if error:
+                state.review_error = error
+            else:
+                state.weekly_review = review
+                state.review_basis = review_basis(
+                    job.kwargs["weekly_plan"], job.kwargs["best_days"], job.kwargs["hardest_days"],
+                    job.kwargs["pace"], job.kwargs["notes"]
+                )
+                state.review_error = None
+        update_state(state)
+        st.rerun()
+    
     if state.review_error:
         st.error(state.review_error)
     
@@ -495,24 +700,37 @@ def render_weekly_review_form():
         best_days = [int(d.replace("第", "").replace("天", "")) for d in best_selected]
         hardest_days = [int(d.replace("第", "").replace("天", "")) for d in hardest_selected]
         
-        with st.spinner("正在生成复盘..."):
-            review, error = generate_weekly_review(
-                weekly_plan=state.weekly_plan,
-                best_days=best_days,
-                hardest_days=hardest_days,
-                pace=pace,
-                notes=notes
-            )
-            
-            if error:
-                state.review_error = error
-                update_state(state)
-                st.rerun()
-            else:
-                state.weekly_review = review
+        basis = review_basis(state.weekly_plan, best_days, hardest_days, pace, notes)
+        cached = None if basis == state.review_basis else cached_weekly_review(basis)
+        if basis == state.review_basis and state.weekly_review is not None:
+            # Nothing changed since the last review
+            state.review_error = None
+        elif cached is not None:
+            state.weekly_review = cached
+            state.review_basis = basis
+            state.review_error = None
+        else:
+            try:
+                job = get_job_queue().submit(
+                    state.session_id,
+                    "review",
+                    generate_weekly_review,
+                    priority=PRIORITY_REVIEW,
+                    idempotency_key=review_key(basis),
+                    weekly_plan=list(state.weekly_plan),
+                    best_days=best_days,
+                    hardest_days=hardest_days,
+                    pace=pace,
+                    notes=notes,
+                    previous_basis=state.review_basis,
+                    previous_review=state.weekly_review
+                )
+                state.review_job_id = job.id
                 state.review_error = None
-                update_state(state)
-                st.rerun()
+            except QueueFullError as e:
+                state.review_error = str(e)
+        update_state(state)
+        st.rerun()
     
     # Show review if available
     if state.weekly_review:
@@ -525,34 +743,183 @@ def render_weekly_review_form():
             st.markdown(f"{i}. {suggestion}")
 
 
-def main():
-    """Main app entry point."""
+def get_query_param(name):
+    """Read a query parameter on both old and new Streamlit versions."""
+    if hasattr(st, "query_params"):
+        return st.query_params.get(name)
+    values = st.experimental_get_query_params().get(name)
+    return values[0] if values else None
+
+
+def render_profiling_panel():
+    """
+    Per-session timings and cProfile capture. Aggregate histograms, other
+    sessions and other tenants are only shown with XHS_PROFILE_ADMIN=1.
+    """
+    state = get_state()
+    with st.expander("⏱️ 性能分析", expanded=False):
+        sink = st.session_state.get("profiling_sink") or []
+        st.markdown("**本会话最近的耗时（毫秒）**")
+        st.dataframe(
+            [{"名称": name, "耗时(ms)": round(ms, 1)} for name, ms in reversed(sink)],
+            use_container_width=True
+        )
+        
+        if not PROFILE_ADMIN:
+            st.markdown(f"**本会话内存**：{deep_sizeof(state) / 1024:.1f} KiB")
+            own = [t for t in get_scheduler().stats()["tenants"] if t["tenant"] == state.session_id]
+            if own:
+                t = own[0]
+                st.markdown(
+                    f"**本会话模型调用**：{t['calls']} 次 · 平均等待 {round(t['wait_mean'] or 0, 2)} 秒 · "
+                    f"排队 {t['waiting']} · 进行中 {t['running']}"
+                )
+        else:
+            render_process_profiling()
+        
+        if st.button("捕获下一次运行的 cProfile"):
+            st.session_state.cprofile_next = True
+            st.rerun()
+        if st.session_state.get("cprofile_report"):
+            st.code(st.session_state.cprofile_report)
+
+
+def render_process_profiling():
+    """Process-wide histograms, sessions, backends, tenants and candidates (admin only)."""
+    st.markdown("**全进程各视图耗时分布**")
+    histograms = profiling.histogram_snapshot()
+    st.dataframe(
+        [
+            {"名称": name, "次数": h["count"], "平均(ms)": round(h["mean_ms"], 1), "最大(ms)": round(h["max_ms"], 1)}
+            for name, h in sorted(histograms.items())
+        ],
+        use_container_width=True
+    )
+    st.download_button(
+        "导出直方图 JSON",
+        data=json.dumps(histograms, ensure_ascii=False, indent=2),
+        file_name="profile_histograms.json",
+        mime="application/json"
+    )
+    
+    st.markdown("**会话内存**")
+    memory = get_session_registry().report()
+    st.markdown(
+        f"会话数：{memory['sessions']} · 已转存：{memory['offloaded']} · "
+        f"状态总大小：{memory['total_bytes'] / 1024:.1f} KiB"
+    )
+    st.dataframe(
+        [
+            {"会话": s["session_id"][:8], "大小(KiB)": round(s["bytes"] / 1024, 1), "天数": s["days"],
+             "空闲(秒)": int(s["idle_seconds"]), "已转存": s["offloaded"]}
+            for s in memory["top"]
+        ],
+        use_container_width=True
+    )
+    
+    router = get_router()
+    if router is not None:
+        st.markdown("**模型服务与上下文缓存**")
+        st.dataframe(
+            [
+                {"服务": b["name"], "延迟(秒)": round(b["ewma_latency"] or 0, 2),
+                 "缓存命中": f"{b['cache_hits']}/{b['cache_hits'] + b['cache_misses']}",
+                 "缓存 token 占比": f"{b['cached_share']:.0%}" if b["cached_share"] is not None else "-",
+                 "命中延迟(秒)": round(b["hit_latency"], 2) if b["hit_latency"] else "-",
+                 "未命中延迟(秒)": round(b["miss_latency"], 2) if b["miss_latency"] else "-"}
+                for b in router.stats()
+            ],
+            use_container_width=True
+        )
+    
+    st.markdown("**模型调用调度（按租户）**")
+    scheduler = get_scheduler().stats()
+    st.markdown(f"进行中：{scheduler['running']}/{scheduler['max_concurrency']}")
+    st.dataframe(
+        [
+            {"租户": t["tenant"][:12], "权重": t["weight"], "排队": t["waiting"], "进行中": t["running"],
+             "调用数": t["calls"], "平均等待(秒)": round(t["wait_mean"] or 0, 2),
+             "P95等待(秒)": round(t["wait_p95"] or 0, 2), "tokens/分钟": round(t["tokens_per_minute"])}
+            for t in scheduler["tenants"]
+        ],
+        use_container_width=True
+    )
+    
+    st.markdown("**备选方案**")
+    candidates = candidate_stats()
+    st.markdown(
+        f"生成次数：{candidates['generations']} · 候选方案：{candidates['candidates']}"
+        f"（有效 {candidates['valid']}）· 「换一版」省去的重新生成请求：{candidates['alternatives_served']}"
+    )
+
+
+def render_app():
+    """Render the header and the view for the current state."""
     render_header()
     
+    if is_llm_degraded():
+        st.warning("⚠️ 千问服务当前不稳定，部分结果来自最近的缓存或模板，稍后可以重新生成。")
+    
     state = get_state()
     current_view = get_current_view(state)
+    # LLM calls of this session, and the jobs it submits, share one fair-share tenant
+    set_tenant(state.session_id)
     
     # Route to appropriate view
-    if current_view == "onboarding_niche":
-        render_onboarding_niche()
-    elif current_view == "onboarding_goal":
-        render_onboarding_goal()
-    elif current_view == "onboarding_style":
-        render_onboarding_style()
-    elif current_view == "onboarding_effort":
-        render_onboarding_effort()
-    elif current_view == "onboarding_constraints":
-        render_onboarding_constraints()
-    elif current_view == "onboarding_custom":
-        render_onboarding_custom()
-    elif current_view == "ready_to_generate":
-        render_ready_to_generate()
-    elif current_view == "weekly_plan":
-        render_weekly_plan()
-    elif current_view == "view_day":
-        render_view_day()
-    elif current_view == "rewrite_day":
-        render_rewrite_day()
+    with profiling.span(f"view.{current_view}"):
+        if current_view == "onboarding_niche":
+            render_onboarding_niche()
+        elif current_view == "onboarding_goal":
+            render_onboarding_goal()
+        elif current_view == "onboarding_style":
+            render_onboarding_style()
+        elif current_view == "onboarding_effort":
+            render_onboarding_effort()
+        elif current_view == "onboarding_constraints":
+            render_onboarding_constraints()
+        elif current_view == "onboarding_custom":
+            render_onboarding_custom()
+        elif current_view == "ready_to_generate":
+            render_ready_to_generate()
+        elif current_view == "weekly_plan":
+            render_weekly_plan()
+        elif current_view == "view_day":
+            render_view_day()
+        elif current_view == "rewrite_day":
+            render_rewrite_day()
+
+
+def main():
+    """Main app entry point."""
+    # ?profile=1 / ?profile=0 toggle profiling for this session only
+    profile_param = get_query_param("profile")
+    if profile_param in ("0", "1"):
+        st.session_state.profiling = profile_param == "1"
+    profiling.enable_session(st.session_state.get("profiling", False))
+    
+    if not profiling.is_enabled():
+        render_app()
+        return
+    
+    if "profiling_sink" not in st.session_state:
+        st.session_state.profiling_sink = profiling.new_session_sink()
+    profiling.bind_session(st.session_state.profiling_sink)
+    
+    capture = st.session_state.pop("cprofile_next", False) or get_query_param("cprofile") == "1"
+    profiler = cProfile.Profile() if capture else None
+    if profiler:
+        profiler.enable()
+    try:
+        with profiling.span("rerun"):
+            render_app()
+    finally:
+        if profiler:
+            profiler.disable()
+            out = io.StringIO()
+            pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(30)
+            st.session_state.cprofile_report = out.getvalue()
+    
+    render_profiling_panel()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,103 @@
+"""
+Import-time budget for the agent package.
+
+Runs `python -X importtime -c "import <module>"` in a fresh interpreter
+and fails if the cumulative import time exceeds the budget or if a heavy
+dependency (openai, httpx, pydantic, streamlit) is imported eagerly.
+Imports are measured cold, standard library included, since that is
+what a new replica or batch worker pays. openai is budgeted separately
+on top of agent.tools: it is loaded by warm_up() before the first LLM
+call, so it delays readiness but not the first page (skipped when it is
+not installed). Bytecode is compiled first, because a run with stale
+.pyc files (or PYTHONDONTWRITEBYTECODE) would time the compiler rather
+than the import.
+
+Usage:
+    python benchmarks/import_time.py [--budget-ms 150] [--openai-budget-ms 1000] [--repeat 5]
+"""
+
+import os
+import sys
+import argparse
+import compileall
+import subprocess
+import importlib.util
+from typing import Dict, List, Optional, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Module -> packages that must not be loaded by importing it
+CHECKS: Dict[str, List[str]] = {
+    "agent.state": ["streamlit", "openai"],
+    "agent.router": ["streamlit", "openai"],
+    "agent.tools": ["streamlit", "openai", "httpx", "pydantic"],
+    "agent.jobs": ["streamlit", "openai"],
+}
+
+# Loaded after the app modules, before the first LLM call
+OPENAI_AFTER = "agent.tools"
+
+
+def measure(module: str, after: Optional[str] = None) -> Tuple[float, List[str]]:
+    """Return (cumulative import ms, top-level packages imported), optionally once after is loaded."""
+    code = f"import {after}; import {module}" if after else f"import {module}"
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True
+    )
+    cumulative_us = None
+    packages = set()
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        parts = line[len("import time:"):].split("|")
+        name = parts[2].strip()
+        if not parts[1].strip().isdigit():
+            continue  # header line
+        packages.add(name.split(".")[0])
+        if name == module:
+            cumulative_us = int(parts[1])
+    if cumulative_us is None:
+        raise RuntimeError(f"no importtime entry for {module}")
+    return cumulative_us / 1000.0, sorted(packages)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--budget-ms", type=float, default=150.0,
+                        help="max cold import time per agent module")
+    parser.add_argument("--openai-budget-ms", type=float, default=1000.0,
+                        help=f"max import time of openai on top of {OPENAI_AFTER}")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per module, best is reported")
+    args = parser.parse_args()
+
+    compileall.compile_dir(os.path.join(ROOT, "agent"), quiet=1)
+    failed = False
+    for module, forbidden in CHECKS.items():
+        runs = [measure(module) for _ in range(args.repeat)]
+        best_ms = min(ms for ms, _ in runs)
+        packages = runs[0][1]
+        leaked = [p for p in forbidden if p in packages]
+        ok = best_ms <= args.budget_ms and not leaked
+        failed = failed or not ok
+        status = "ok  " if ok else "FAIL"
+        extra = f"  eager imports: {', '.join(leaked)}" if leaked else ""
+        print(f"{status} {module:<16} {best_ms:7.2f} ms (budget {args.budget_ms:.0f} ms){extra}")
+
+    if importlib.util.find_spec("openai") is None:
+        print(f"skip {'openai':<16} not installed")
+    else:
+        best_ms = min(measure("openai", OPENAI_AFTER)[0] for _ in range(args.repeat))
+        ok = best_ms <= args.openai_budget_ms
+        failed = failed or not ok
+        status = "ok  " if ok else "FAIL"
+        print(f"{status} {'openai':<16} {best_ms:7.2f} ms (budget {args.openai_budget_ms:.0f} ms)")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,321 @@
+"""
+Micro-benchmarks for the parsing, state and routing hot paths.
+
+Each benchmark is timed like timeit: the call count per round is
+calibrated so a round takes ~min-time/rounds, and per-call min/median/
+mean over the rounds are reported. Results can be saved as a named
+baseline under benchmarks/baselines/ and later compared against it; the
+compare command exits non-zero when any benchmark's min (the least noisy
+statistic, see --stat) regresses by more than the threshold. Baselines
+are machine-specific, so none is committed and compare has no default:
+save one on the machine you compare on.
+
+Usage:
+    python benchmarks/micro.py run [-k parse] [--save local]
+    python benchmarks/micro.py compare --baseline local [--threshold 0.25]
+"""
+
+import os
+import gc
+import sys
+import json
+import time
+import pickle
+import argparse
+import platform
+import statistics
+import types
+from typing import Any, Callable, Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from agent.state import AppState, DayContent
+from agent.router import get_current_view, advance_onboarding
+from agent.tools import parse_json_with_retry
+
+BASELINE_DIR = os.path.join(ROOT, "benchmarks", "baselines")
+
+# name -> setup(); setup returns the zero-argument callable to time
+BENCHMARKS: Dict[str, Callable[[], Callable[[], Any]]] = {}
+
+
+def benchmark(name: str):
+    def register(setup: Callable[[], Callable[[], Any]]):
+        BENCHMARKS[name] = setup
+        return setup
+    return register
+
+
+# -- fixtures --------------------------------------------------------------
+
+def _day(n: int) -> Dict[str, Any]:
+    return {
+        "day": n,
+        "title": f"第{n}天：新手也能坚持的{n}个小习惯",
+        "hook": "今天分享一个我坚持了一个月的小方法，真的有用！",
+        "bullets": ["先从5分钟开始", "固定一个时间点", "记录每天的变化", "允许自己偶尔偷懒"],
+        "cta": "你们有什么坚持的小习惯？留言告诉我～",
+        "tags": ["#生活方式", "#自律", "#新手博主", "#日常记录", "#小习惯"]
+    }
+
+
+WEEK = {"days": [_day(n) for n in range(1, 8)]}
+CLEAN = json.dumps(WEEK, ensure_ascii=False, indent=2)
+FENCED = f"```json\n{CLEAN}\n```"
+# Trailing comma: direct parse fails, the (stubbed) LLM fix returns CLEAN
+MALFORMED = CLEAN[:-2] + ",\n}"
+
+
+class _FixStub:
+    """Stands in for ProviderRouter; answers the JSON fix prompt instantly."""
+
+    def complete(self, messages, model, operation=None, **params):
+        message = types.SimpleNamespace(content=CLEAN)
+        return types.SimpleNamespace(choices=[types.SimpleNamespace(message=message)], usage=None)
+
+
+def _plan_state() -> AppState:
+    state = AppState(niche="生活方式", goal="记录生活", style="轻松日常", effort="一般(3-4条/周)")
+    state.current_step = "ready"
+    state.set_plan_candidates([[DayContent.from_dict(d) for d in WEEK["days"]]])
+    return state
+
+
+# -- parse_json_with_retry -------------------------------------------------
+
+@benchmark("parse_json.clean")
+def _parse_clean():
+    return lambda: parse_json_with_retry(None, CLEAN)
+
+
+@benchmark("parse_json.fenced")
+def _parse_fenced():
+    return lambda: parse_json_with_retry(None, FENCED)
+
+
+@benchmark("parse_json.malformed_fix")
+def _parse_malformed():
+    client = _FixStub()
+    return lambda: parse_json_with_retry(client, MALFORMED)
+
+
+# -- DayContent ------------------------------------------------------------
+
+@benchmark("day_content.from_dict")
+def _day_from_dict():
+    data = WEEK["days"]
+    return lambda: [DayContent.from_dict(d) for d in data]
+
+
+@benchmark("day_content.round_trip")
+def _day_round_trip():
+    days = [DayContent.from_dict(d) for d in WEEK["days"]]
+    return lambda: [DayContent.from_dict(d.to_dict()) for d in days]
+
+
+# -- AppState --------------------------------------------------------------
+
+@benchmark("app_state.reset_content")
+def _state_reset_content():
+    state = _plan_state()
+    plan = list(state.weekly_plan)
+
+    def run():
+        state.weekly_plan = plan
+        state.reset_content()
+    return run
+
+
+@benchmark("app_state.reset_all")
+def _state_reset_all():
+    # Includes archive_plan(), which copies the signatures cached at install time
+    state = _plan_state()
+    plan = list(state.weekly_plan)
+
+    def run():
+        state.weekly_plan = plan
+        state.niche = "生活方式"
+        state.reset_all()
+        state.past_signatures.clear()
+    return run
+
+
+@benchmark("app_state.pickle_round_trip")
+def _state_pickle():
+    state = _plan_state()
+    return lambda: pickle.loads(pickle.dumps(state))
+
+
+@benchmark("app_state.offload_json")
+def _state_offload_json():
+    # Same payload as memory.SessionRegistry._offload
+    state = _plan_state()
+
+    def run():
+        raw = json.dumps({"weekly_plan": [d.to_dict() for d in state.weekly_plan]}, ensure_ascii=False)
+        return [DayContent.from_dict(d) for d in json.loads(raw)["weekly_plan"]]
+    return run
+
+
+# -- router ----------------------------------------------------------------
+
+@benchmark("router.get_current_view")
+def _router_view():
+    states = [AppState()]
+    for step in ("goal", "style", "effort", "constraints", "custom", "ready"):
+        state = AppState(niche="生活方式", current_step=step)
+        state.goal = "记录生活" if step != "goal" else None
+        state.style = "轻松日常" if step not in ("goal", "style") else None
+        state.effort = "一般(3-4条/周)" if step not in ("goal", "style", "effort") else None
+        states.append(state)
+    plan = _plan_state()
+    viewing = _plan_state()
+    viewing.viewing_day = 3
+    states += [plan, viewing]
+    return lambda: [get_current_view(s) for s in states]
+
+
+@benchmark("router.advance_onboarding")
+def _router_advance():
+    state = AppState()
+
+    def run():
+        state.current_step = "niche"
+        for _ in range(6):
+            advance_onboarding(state)
+    return run
+
+
+# -- harness ---------------------------------------------------------------
+
+def measure(fn: Callable[[], Any], min_time: float, rounds: int) -> Dict[str, float]:
+    """Per-call seconds over rounds, each round calling fn `number` times."""
+    number = 1
+    target = min_time / rounds
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        if time.perf_counter() - start >= target or number >= 1 << 24:
+            break
+        number *= 2
+
+    samples = []
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(rounds):
+            start = time.perf_counter()
+            for _ in range(number):
+                fn()
+            samples.append((time.perf_counter() - start) / number)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    return {
+        "min": min(samples),
+        "median": statistics.median(samples),
+        "mean": statistics.fmean(samples),
+        "stddev": statistics.stdev(samples) if len(samples) > 1 else 0.0,
+        "rounds": rounds,
+        "number": number
+    }
+
+
+def run_all(keyword: Optional[str], min_time: float, rounds: int) -> Dict[str, Dict[str, float]]:
+    results = {}
+    for name, setup in BENCHMARKS.items():
+        if keyword and keyword not in name:
+            continue
+        results[name] = measure(setup(), min_time, rounds)
+    return results
+
+
+def _fmt(seconds: float) -> str:
+    if seconds >= 1e-3:
+        return f"{seconds * 1e3:.3f} ms"
+    return f"{seconds * 1e6:.2f} µs"
+
+
+def print_results(results: Dict[str, Dict[str, float]]):
+    print(f"{'benchmark':<30}{'min':>12}{'median':>12}{'stddev':>12}{'ops/s':>12}")
+    for name, r in results.items():
+        print(f"{name:<30}{_fmt(r['min']):>12}{_fmt(r['median']):>12}{_fmt(r['stddev']):>12}{1 / r['median']:>12.0f}")
+
+
+def _baseline_path(name: str) -> str:
+    return name if name.endswith(".json") else os.path.join(BASELINE_DIR, f"{name}.json")
+
+
+def save_baseline(name: str, results: Dict[str, Dict[str, float]]):
+    os.makedirs(BASELINE_DIR, exist_ok=True)
+    data = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "created_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "results": results
+    }
+    with open(_baseline_path(name), "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def compare(
+    baseline: Dict[str, Dict[str, float]],
+    current: Dict[str, Dict[str, float]],
+    threshold: float,
+    stat: str = "min"
+) -> List[str]:
+    """Print a comparison table; return the names that regressed."""
+    regressed = []
+    print(f"{'benchmark':<30}{'baseline':>12}{'current':>12}{'change':>10}")
+    for name, r in current.items():
+        base = baseline.get(name)
+        if base is None:
+            print(f"{name:<30}{'-':>12}{_fmt(r[stat]):>12}{'new':>10}")
+            continue
+        change = r[stat] / base[stat] - 1
+        flag = ""
+        if change > threshold:
+            regressed.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:<30}{_fmt(base[stat]):>12}{_fmt(r[stat]):>12}{change:>+10.1%}{flag}")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+    for command in ("run", "compare"):
+        p = sub.add_parser(command)
+        p.add_argument("-k", dest="keyword", help="only benchmarks whose name contains this")
+        p.add_argument("--min-time", type=float, default=0.5, help="seconds per benchmark")
+        p.add_argument("--rounds", type=int, default=7)
+    sub.choices["run"].add_argument("--save", metavar="NAME", help="store results as a baseline")
+    sub.choices["compare"].add_argument("--baseline", required=True,
+                                        help="baseline name or JSON path, saved on this machine")
+    sub.choices["compare"].add_argument("--threshold", type=float, default=0.25,
+                                        help="fail if a benchmark is slower by more than this fraction")
+    sub.choices["compare"].add_argument("--stat", choices=["min", "median", "mean"], default="min")
+    args = parser.parse_args()
+
+    results = run_all(args.keyword, args.min_time, args.rounds)
+    if args.command == "run":
+        print_results(results)
+        if args.save:
+            save_baseline(args.save, results)
+            print(f"\nbaseline saved to {_baseline_path(args.save)}")
+        return
+
+    with open(_baseline_path(args.baseline), encoding="utf-8") as f:
+        baseline = json.load(f)["results"]
+    regressed = compare(baseline, results, args.threshold, args.stat)
+    if regressed:
+        print(f"\n{len(regressed)} benchmark(s) regressed by more than {args.threshold:.0%}: {', '.join(regressed)}")
+        sys.exit(1)
+    print(f"\nno regressions beyond {args.threshold:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Report context-cache hits on recorded calls.
+
+Reads one or more cassettes and, per operation, reports how many prompt
+tokens the provider served from its context cache
+(usage.prompt_tokens_details.cached_tokens), latency with and without a
+cache hit, and the input cost saved. Also reports the static system prefix
+each operation sends, which is what the cache can reuse.
+
+Usage:
+    python scripts/eval_prompt_cache.py cassettes/*.jsonl.gz [--cached-price 0.4]
+"""
+
+import os
+import sys
+import argparse
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agent.cassette import read_entries
+from agent.tokens import MODEL_PRICES, estimate_tokens
+
+
+def _mean(values) -> str:
+    return f"{sum(values) / len(values):.2f}s" if values else "-"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("cassettes", nargs="+")
+    parser.add_argument("--cached-price", type=float, default=0.4,
+                        help="price of a cached input token relative to an uncached one")
+    args = parser.parse_args()
+
+    totals = defaultdict(lambda: {"calls": 0, "prompt": 0, "cached": 0, "system": 0, "saved": 0.0,
+                                  "hit": [], "miss": []})
+    for path in args.cassettes:
+        for entry in read_entries(path):
+            usage = entry.get("usage") or {}
+            if not usage.get("prompt_tokens"):
+                continue
+            cached = (usage.get("prompt_tokens_details") or {}).get("cached_tokens") or 0
+            t = totals[entry.get("operation") or "-"]
+            t["calls"] += 1
+            t["prompt"] += usage["prompt_tokens"]
+            t["cached"] += cached
+            if entry["messages"][0]["role"] == "system":
+                t["system"] += estimate_tokens(entry["messages"][0]["content"])
+            input_price = MODEL_PRICES.get(entry.get("model") or "", (0.0, 0.0))[0]
+            t["saved"] += cached * input_price * (1 - args.cached_price) / 1000
+            if entry.get("elapsed"):
+                t["hit" if cached else "miss"].append(entry["elapsed"])
+
+    if not totals:
+        sys.exit("no calls with usage found")
+
+    print(f"{'operation':<12}{'calls':>7}{'system':>9}{'cached':>9}{'hit':>9}{'miss':>9}{'saved':>11}")
+    for operation, t in sorted(totals.items()):
+        print(f"{operation:<12}{t['calls']:>7}{t['system'] // t['calls']:>9}"
+              f"{t['cached'] / t['prompt']:>9.1%}{_mean(t['hit']):>9}{_mean(t['miss']):>9}{t['saved']:>10.4f}元")
+    prompt = sum(t["prompt"] for t in totals.values())
+    cached = sum(t["cached"] for t in totals.values())
+    print(f"\ncached prompt tokens: {cached}/{prompt} ({cached / prompt:.1%})")
+    print("system: average static prefix tokens per call; hit/miss: mean latency with/without a cache hit")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Measure what field-targeted rewrites save on recorded rewrite calls.
+
+Reads whole-post rewrites (REWRITE_DAY_PROMPT) from one or more cassettes,
+classifies each instruction locally and reports how many output tokens
+and how much latency a rewrite of only the touched fields would take.
+Latency is scaled by output tokens, since rewrites are decode-bound.
+Field-targeted rewrites already in the cassettes are reported as measured.
+
+Usage:
+    python scripts/eval_rewrite_scope.py cassettes/*.jsonl.gz [--show 20]
+"""
+
+import os
+import re
+import sys
+import json
+import argparse
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agent.cassette import read_entries
+from agent.instructions import classify_instruction
+from agent.tokens import estimate_tokens
+from agent.tools import parse_json_with_retry
+
+_INSTRUCTION_RE = re.compile(r"用户的改写要求：(.+)")
+_TARGETED_MARKER = "只需要重新写以下部分"
+
+
+def _completion_tokens(entry) -> int:
+    usage = entry.get("usage") or {}
+    return usage.get("completion_tokens") or estimate_tokens(entry["text"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("cassettes", nargs="+")
+    parser.add_argument("--show", type=int, default=10, help="print this many classified instructions")
+    args = parser.parse_args()
+
+    calls = 0
+    whole = 0
+    full_tokens = targeted_tokens = 0
+    full_seconds = targeted_seconds = 0.0
+    scopes: Counter = Counter()
+    measured = []
+    shown = 0
+
+    for path in args.cassettes:
+        for entry in read_entries(path):
+            if entry.get("operation") != "rewrite":
+                continue
+            prompt = entry["messages"][-1]["content"]
+            if _TARGETED_MARKER in prompt:
+                measured.append((_completion_tokens(entry), entry.get("elapsed") or 0.0))
+                continue
+            match = _INSTRUCTION_RE.search(prompt)
+            parsed, error = parse_json_with_retry(None, entry["text"])
+            if not match or error or not isinstance(parsed, dict):
+                continue
+
+            calls += 1
+            instruction = match.group(1).strip()
+            fields = classify_instruction(instruction)
+            tokens = _completion_tokens(entry)
+            elapsed = entry.get("elapsed") or 0.0
+            full_tokens += tokens
+            full_seconds += elapsed
+            if fields is None:
+                whole += 1
+                scopes["(whole post)"] += 1
+                targeted_tokens += tokens
+                targeted_seconds += elapsed
+            else:
+                scopes["+".join(fields)] += 1
+                part = estimate_tokens(json.dumps({f: parsed.get(f) for f in fields}, ensure_ascii=False))
+                share = min(1.0, part / max(estimate_tokens(entry["text"]), 1))
+                targeted_tokens += tokens * share
+                targeted_seconds += elapsed * share
+            if shown < args.show:
+                shown += 1
+                print(f"  {instruction[:40]:<42} -> {'+'.join(fields) if fields else 'whole post'}")
+
+    if not calls and not measured:
+        sys.exit("no rewrite calls found")
+
+    if calls:
+        print(f"\nwhole-post rewrites recorded: {calls} ({calls - whole} classified as field-targeted)")
+        for scope, n in scopes.most_common():
+            print(f"  {scope:<24}{n:>6}")
+        print(f"output tokens: {full_tokens} -> {targeted_tokens:.0f} "
+              f"({1 - targeted_tokens / max(full_tokens, 1):.1%} saved)")
+        if full_seconds:
+            print(f"rewrite latency: {full_seconds / calls:.2f}s -> {targeted_seconds / calls:.2f}s per call (estimated)")
+    if measured:
+        tokens = sum(t for t, _ in measured) / len(measured)
+        seconds = sum(s for _, s in measured) / len(measured)
+        print(f"field-targeted rewrites recorded: {len(measured)}, {tokens:.0f} output tokens, {seconds:.2f}s per call")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Build the local tag vocabulary from recorded LLM output and measure it.
+
+Reads generation/rewrite calls from one or more cassettes, trains the tag
+engine on the first part and compares its tags with the LLM's tags on the
+rest (overlap@5 and Jaccard). Also reports how many output tokens the
+tags took, i.e. what XHS_LOCAL_TAGS=1 saves.
+
+Usage:
+    python scripts/eval_tags.py cassettes/*.jsonl.gz [--test-fraction 0.2] [--save tag_vocab.json]
+"""
+
+import os
+import re
+import sys
+import json
+import argparse
+from typing import List, Optional, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agent.cassette import read_entries
+from agent.state import DayContent
+from agent.tagging import TagEngine
+from agent.tokens import estimate_tokens
+from agent.tools import parse_json_with_retry
+
+_NICHE_RE = re.compile(r"赛道/领域：(.+)")
+
+
+def load_samples(paths: List[str]) -> Tuple[List[Tuple[Optional[str], DayContent]], int, int]:
+    """(niche, day) pairs with LLM tags, plus tag tokens and completion tokens seen."""
+    samples = []
+    tag_tokens = 0
+    completion_tokens = 0
+    for path in paths:
+        for entry in read_entries(path):
+            if entry.get("operation") not in ("generate", "rewrite"):
+                continue
+            parsed, error = parse_json_with_retry(None, entry["text"])
+            if error:
+                continue
+            match = _NICHE_RE.search(entry["messages"][-1]["content"])
+            niche = match.group(1).strip() if match else None
+            days = parsed.get("days", [parsed]) if isinstance(parsed, dict) else []
+            for data in days:
+                day = DayContent.from_dict(data)
+                if day.tags:
+                    samples.append((niche, day))
+                    tag_tokens += estimate_tokens(json.dumps({"tags": day.tags}, ensure_ascii=False))
+            usage = entry.get("usage") or {}
+            completion_tokens += usage.get("completion_tokens") or estimate_tokens(entry["text"])
+    return samples, tag_tokens, completion_tokens
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("cassettes", nargs="+")
+    parser.add_argument("--test-fraction", type=float, default=0.2)
+    parser.add_argument("--save", help="write the vocabulary trained on all samples here (use as XHS_TAG_VOCAB)")
+    args = parser.parse_args()
+
+    samples, tag_tokens, completion_tokens = load_samples(args.cassettes)
+    if not samples:
+        sys.exit("no tagged generations found")
+
+    split = int(len(samples) * (1 - args.test_fraction))
+    train, test = samples[:split], samples[split:]
+    engine = TagEngine()
+    for niche, day in train:
+        engine.observe(niche, day)
+
+    overlap = jaccard = 0.0
+    for niche, day in test:
+        predicted = set(engine.assign(niche, day))
+        actual = set(day.tags)
+        overlap += len(predicted & actual) / max(len(actual), 1)
+        jaccard += len(predicted & actual) / max(len(predicted | actual), 1)
+
+    print(f"posts: {len(samples)} (train {len(train)}, test {len(test)})")
+    if test:
+        print(f"agreement with LLM tags: overlap {overlap / len(test):.1%}  jaccard {jaccard / len(test):.1%}")
+    print(f"tag output tokens: {tag_tokens} of {completion_tokens} "
+          f"({tag_tokens / max(completion_tokens, 1):.1%} of completion tokens saved with local tags)")
+
+    if args.save:
+        full = TagEngine()
+        for niche, day in samples:
+            full.observe(niche, day)
+        full.save(args.save)
+        print(f"vocabulary saved to {args.save}")
+
+
+if __name__ == "__main__":
+    main()
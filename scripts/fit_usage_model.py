@@ -0,0 +1,78 @@
+"""
+Fit the pre-flight usage model on recorded calls and measure it.
+
+Trains agent.tokens.UsageModel on the first part of one or more cassettes
+and reports, on the rest, how far the prompt token estimate, the expected
+output tokens and the predicted latency are from what the server
+reported. The model trained on everything can be saved for XHS_USAGE_MODEL.
+
+Usage:
+    python scripts/fit_usage_model.py cassettes/*.jsonl.gz [--test-fraction 0.2] [--save usage_model.json]
+"""
+
+import os
+import sys
+import argparse
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agent.cassette import read_entries
+from agent.tokens import UsageModel, effort_from_prompt
+
+
+def _error(errors) -> str:
+    if not errors:
+        return "-"
+    errors = sorted(errors)
+    return f"{sum(errors) / len(errors):.1%} mean, {errors[len(errors) // 2]:.1%} median"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("cassettes", nargs="+")
+    parser.add_argument("--test-fraction", type=float, default=0.2)
+    parser.add_argument("--save", help="write the model fitted on all calls to this path")
+    args = parser.parse_args()
+
+    entries = [e for path in args.cassettes for e in read_entries(path)]
+    if not entries:
+        sys.exit("no calls found")
+    split = int(len(entries) * (1 - args.test_fraction))
+    train, test = entries[:split], entries[split:]
+
+    model = UsageModel()
+    model.fit(train)
+
+    raw_prompt, prompt, latency = [], [], []
+    output = defaultdict(list)
+    for entry in test:
+        usage = entry.get("usage") or {}
+        text = "\n\n".join(m["content"] for m in entry["messages"])
+        estimate = model.estimate(text, entry.get("model") or "", entry.get("operation"), effort_from_prompt(text))
+        if usage.get("prompt_tokens"):
+            raw_prompt.append(abs(estimate.estimated_prompt_tokens / usage["prompt_tokens"] - 1))
+            prompt.append(abs(estimate.prompt_tokens / usage["prompt_tokens"] - 1))
+        if usage.get("completion_tokens"):
+            output[entry.get("operation") or "-"].append(
+                abs(estimate.output_tokens / usage["completion_tokens"] - 1)
+            )
+        if entry.get("elapsed"):
+            latency.append(abs(estimate.seconds / entry["elapsed"] - 1))
+
+    print(f"calls: {len(train)} train, {len(test)} test")
+    print(f"prompt tokens, raw estimate:  {_error(raw_prompt)} relative error")
+    print(f"prompt tokens, calibrated:    {_error(prompt)} relative error")
+    for operation, errors in sorted(output.items()):
+        print(f"output tokens, {operation:<14} {_error(errors)} relative error ({len(errors)} calls)")
+    print(f"latency:                      {_error(latency)} relative error")
+
+    if args.save:
+        full = UsageModel()
+        full.fit(entries)
+        full.save(args.save)
+        print(f"\nmodel saved to {args.save}")
+
+
+if __name__ == "__main__":
+    main()
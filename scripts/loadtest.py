@@ -0,0 +1,245 @@
+"""
+Multi-session load test for the Streamlit app.
+
+Runs N concurrent simulated creators through the real flow (onboarding,
+generation, viewing days, rewriting, reviewing) with Streamlit's
+in-process AppTest and a mock LLM backend, then reports per-view script
+run time, state memory per session and throughput at each concurrency.
+
+Usage:
+    python scripts/loadtest.py --levels 1,4,16 --sessions-per-level 32 --llm-latency 0.5
+"""
+
+import os
+import sys
+import json
+import time
+import types
+import argparse
+import threading
+import tracemalloc
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from streamlit.testing.v1 import AppTest
+
+from agent.memory import deep_sizeof
+from agent.providers import Backend, ProviderRouter, set_router
+from agent.router import get_current_view
+
+APP_PATH = os.path.join(ROOT, "app.py")
+SCRIPT_TIMEOUT = 120
+
+
+# One distinct post per day (and one for rewrites), so the mock plan
+# passes the near-duplicate check like a real one instead of triggering
+# extra regenerate calls
+_MOCK_POSTS = [
+    ("早起打卡第一周", "闹钟响了三次才起床的我，终于连续早起七天了",
+     ["前一晚十一点前放下手机", "闹钟放在离床远的地方", "起床先喝一杯温水", "早上留半小时给自己"]),
+    ("宿舍收纳大改造", "十平米的宿舍也能住得清清爽爽",
+     ["桌面只留每天要用的东西", "床底用带轮子的收纳箱", "衣服按季节分袋装好", "每周日花十分钟整理"]),
+    ("一人食的快手晚餐", "下课回来二十分钟就能吃上热乎饭",
+     ["电饭煲焖饭顺便蒸蛋", "提前切好一周的配菜", "调味只备生抽和蚝油", "剩菜第二天做成炒饭"]),
+    ("图书馆占座攻略", "考试周也能找到靠窗的安静位置",
+     ["七点半开门前十分钟到", "三楼期刊区人最少", "带好插线板和保温杯", "午饭错开十二点高峰"]),
+    ("周末城市漫步路线", "不花钱也能把周末过得很充实",
+     ["老街区适合拍照散步", "公园湖边看日落", "顺路逛一家独立书店", "用地图记下走过的路"]),
+    ("月底省钱小记账", "这个月生活费居然还剩下三百块",
+     ["每笔开销当天记下来", "外卖换成食堂打包", "想买的东西先放购物车三天", "月底回看哪些钱花得值"]),
+    ("睡前半小时放松法", "失眠了大半年，这几个办法帮我睡得更好",
+     ["关掉顶灯只开台灯", "听一段白噪音或播客", "写下明天最重要的三件事", "拉伸肩颈五分钟"]),
+    ("换季衣橱大整理", "把不穿的衣服清出去，衣柜一下子宽敞了",
+     ["一年没穿的直接捐出", "同色系衣服挂在一起", "常穿的放在最顺手的位置", "拍照建一个电子衣橱"]),
+]
+
+
+def _mock_day(day: int, salt: str, post: int = None) -> Dict:
+    title, hook, bullets = _MOCK_POSTS[(day if post is None else post) - 1]
+    return {
+        "day": day,
+        "title": f"第{day}天：{title} {salt}",
+        "hook": hook,
+        "bullets": bullets,
+        "cta": "你们有什么坚持的小习惯？留言告诉我～",
+        "tags": ["#生活方式", "#自律", "#新手博主", "#日常记录", "#小习惯"]
+    }
+
+
+class MockCompletions:
+    """Answers each prompt type with canned JSON after a fixed delay."""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def create(self, model, messages, **params):
+        with self._lock:
+            self.calls += 1
+            salt = str(self.calls)
+        time.sleep(self.latency)
+        prompt = "\n".join(m["content"] for m in messages)
+        if "复盘" in prompt:
+            body = {"reflection": "这周完成得很好！", "suggestions": ["继续保持", "尝试新形式", "多和评论区互动"]}
+        elif "改写" in prompt:
+            body = _mock_day(1, salt, post=len(_MOCK_POSTS))
+        else:
+            body = {"days": [_mock_day(d, salt) for d in range(1, 8)]}
+        message = types.SimpleNamespace(content=json.dumps(body, ensure_ascii=False))
+        return types.SimpleNamespace(choices=[types.SimpleNamespace(message=message)], usage=None)
+
+
+def install_mock_llm(latency: float) -> MockCompletions:
+    completions = MockCompletions(latency)
+    backend = Backend(name="mock", base_url="mock://", api_key="mock")
+    backend._client = types.SimpleNamespace(chat=types.SimpleNamespace(completions=completions))
+    set_router(ProviderRouter([backend]))
+    return completions
+
+
+def _click(at: AppTest, label: str = None, key: str = None):
+    if key is not None:
+        return at.button(key=key).click()
+    for button in at.button:
+        if button.label == label:
+            return button.click()
+    raise LookupError(f"button not found: {label}")
+
+
+class Session:
+    """One simulated creator walking the app."""
+
+    def __init__(self, timings: Dict[str, List[float]], lock: threading.Lock):
+        self.at = AppTest.from_file(APP_PATH, default_timeout=SCRIPT_TIMEOUT)
+        self.timings = timings
+        self.lock = lock
+
+    def _view(self) -> str:
+        try:
+            return get_current_view(self.at.session_state["app_state"])
+        except KeyError:
+            return "startup"
+
+    def step(self, action=None):
+        """Apply an optional widget action, rerun the script, time it per view."""
+        view = self._view()
+        if action is not None:
+            action()
+        start = time.perf_counter()
+        self.at.run()
+        elapsed = time.perf_counter() - start
+        if self.at.exception:
+            raise RuntimeError(f"{view}: {self.at.exception[0].value}")
+        with self.lock:
+            self.timings[view].append(elapsed)
+
+    def run_flow(self):
+        at = self.at
+        self.step()
+        self.step(lambda: _click(at, key="niche_生活方式"))
+        self.step(lambda: _click(at, key="goal_记录生活"))
+        self.step(lambda: _click(at, key="style_轻松日常"))
+        self.step(lambda: _click(at, key="effort_一般(3-4条/周)"))
+        self.step(lambda: at.checkbox(key="constraint_不谈金钱/收入").check())
+        self.step(lambda: _click(at, "继续 →"))
+        self.step(lambda: at.text_area(key="custom_note_input").input("我是大学生，想分享考研经验"))
+        self.step(lambda: _click(at, "完成设置 ✓"))
+        # Submits the job; the view polls (sleep + rerun) until the plan is ready
+        self.step(lambda: _click(at, "🎉 生成我的一周内容"))
+        for day in (1, 4, 7):
+            self.step(lambda: _click(at, key=f"view_{day}"))
+            self.step(lambda: _click(at, "← 返回计划"))
+        self.step(lambda: _click(at, key="rewrite_2"))
+        self.step(lambda: at.text_area(key="rewrite_instruction_input").input("语气更轻松一点"))
+        self.step(lambda: _click(at, "🔄 开始改写"))
+        self.step(lambda: _click(at, "← 返回计划"))
+        self.step(lambda: at.multiselect(key="review_best").select("第1天"))
+        self.step(lambda: _click(at, "📝 生成下周建议"))
+
+    def state_bytes(self) -> int:
+        return deep_sizeof(self.at.session_state["app_state"])
+
+
+def run_level(concurrency: int, sessions: int) -> Dict:
+    timings: Dict[str, List[float]] = defaultdict(list)
+    lock = threading.Lock()
+    errors: List[str] = []
+    state_sizes: List[int] = []
+
+    def one(_):
+        session = Session(timings, lock)
+        try:
+            session.run_flow()
+            state_sizes.append(session.state_bytes())
+        except Exception as e:
+            errors.append(str(e))
+        return session
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        finished = list(pool.map(one, range(sessions)))
+    wall = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del finished
+
+    return {
+        "concurrency": concurrency,
+        "sessions": sessions,
+        "errors": errors,
+        "wall": wall,
+        "throughput": (sessions - len(errors)) / wall,
+        "timings": timings,
+        "state_bytes": (sum(state_sizes) / len(state_sizes)) if state_sizes else 0,
+        "peak_bytes_per_session": peak / sessions
+    }
+
+
+def _pct(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+def print_report(result: Dict):
+    print(f"\n=== concurrency {result['concurrency']} · {result['sessions']} sessions ===")
+    print(f"wall {result['wall']:.2f}s  throughput {result['throughput']:.2f} flows/s  errors {len(result['errors'])}")
+    print(f"app_state ≈ {result['state_bytes'] / 1024:.1f} KiB/session  "
+          f"peak traced ≈ {result['peak_bytes_per_session'] / 1024:.1f} KiB/session")
+    print(f"{'view':<24}{'runs':>6}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}")
+    for view, values in sorted(result["timings"].items()):
+        print(f"{view:<24}{len(values):>6}{_pct(values, 0.5) * 1000:>10.1f}"
+              f"{_pct(values, 0.95) * 1000:>10.1f}{max(values) * 1000:>10.1f}")
+    for error in result["errors"][:5]:
+        print(f"  error: {error}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--levels", default="1,2,4,8", help="comma-separated concurrency levels")
+    parser.add_argument("--sessions-per-level", type=int, default=0, help="default: 2x concurrency")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="mock LLM latency in seconds")
+    parser.add_argument("--json", help="also write raw results to this file")
+    args = parser.parse_args()
+
+    completions = install_mock_llm(args.llm_latency)
+    results = []
+    for level in [int(x) for x in args.levels.split(",")]:
+        sessions = args.sessions_per_level or level * 2
+        result = run_level(level, sessions)
+        print_report(result)
+        results.append(result)
+    print(f"\nmock LLM calls: {completions.calls}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Replay a recorded LLM cassette offline as a regression/performance run.
+
+Every recorded call is replayed through call_llm_choices (with the
+recorded n) and parse_json_with_retry on each choice (the JSON-fix call
+is replayed too if it was recorded), and the script reports parse
+failures plus recorded vs replayed wall time. Calls that failed when
+recorded must fail again on replay.
+
+Usage:
+    python scripts/replay_cassette.py cassettes/prod.jsonl.gz [--realtime]
+"""
+
+import os
+import sys
+import time
+import argparse
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agent.cassette import REPLAY, read_entries, use_cassette
+from agent.providers import ProviderRouter
+from agent.tools import call_llm_choices, parse_json_with_retry
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("cassette")
+    parser.add_argument("--realtime", action="store_true", help="sleep for the recorded latency of each call")
+    args = parser.parse_args()
+
+    entries = [e for e in read_entries(args.cassette, errors=True) if e.get("operation") != "json_fix"]
+    client = ProviderRouter([])
+    failures = Counter()
+    recorded_seconds = 0.0
+
+    start = time.monotonic()
+    with use_cassette(args.cassette, REPLAY, realtime=args.realtime):
+        for entry in entries:
+            recorded_seconds += entry.get("elapsed", 0.0)
+            prompt = entry["messages"][-1]["content"]
+            system = entry["messages"][0]["content"] if entry["messages"][0]["role"] == "system" else None
+            try:
+                texts = call_llm_choices(
+                    client, prompt, (entry.get("params") or {}).get("n", 1),
+                    model=entry["model"], operation=entry.get("operation"), system=system
+                )
+                error = "recorded failure replayed as a success" if "error" in entry else None
+                for text in texts:
+                    if error:
+                        break
+                    _, error = parse_json_with_retry(client, text)
+            except Exception as e:
+                error = None if "error" in entry else str(e)
+            if error:
+                failures[entry.get("operation") or "unknown"] += 1
+                print(f"FAIL {entry['key']} ({entry.get('operation')}): {error}")
+    replay_seconds = time.monotonic() - start
+
+    print(f"calls: {len(entries)}  failures: {sum(failures.values())} {dict(failures)}")
+    print(f"recorded time: {recorded_seconds:.2f}s  replay time: {replay_seconds:.2f}s")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
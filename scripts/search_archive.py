@@ -0,0 +1,120 @@
+"""
+Search the archive of generated posts and reviews (XHS_ARCHIVE_DIR).
+
+Usage:
+    python scripts/search_archive.py 考研 --niche 学习/成长 --since 2024-05-01 --limit 20
+    python scripts/search_archive.py --stats
+    python scripts/search_archive.py --merge
+    python scripts/search_archive.py --self-check
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agent.archive import ARCHIVE_DIR, POST, REVIEW, Archive, ArchiveLockedError
+
+
+def _epoch(date: str) -> float:
+    return datetime.strptime(date, "%Y-%m-%d").timestamp()
+
+
+def self_check():
+    """Index and search a few posts in a temporary archive: live, sealed and reopened read_only."""
+    cases = {"考研党": 1, "考研": 1, "研党": 1, "手账": 1, "考": 1, "考研党日常": 0}
+    with tempfile.TemporaryDirectory() as directory:
+        archive = Archive(directory)
+        archive.add(POST, [
+            {"day": 1, "title": "备考第一周", "hook": "每天三小时", "bullets": ["先定目标"], "cta": "", "tags": ["#考研党"]},
+            {"day": 2, "title": "手账排版", "hook": "", "bullets": [], "cta": "", "tags": []}
+        ])
+        failures = []
+        for state in ("live", "sealed", "reopened"):
+            if state == "sealed":
+                archive.flush()
+            elif state == "reopened":
+                try:
+                    Archive(directory)
+                    failures.append("a second writer could open the archive")
+                except ArchiveLockedError:
+                    pass
+                archive.close()
+                archive = Archive(directory, read_only=True)
+            for query, expected in cases.items():
+                found = len(archive.search(query))
+                if found != expected:
+                    failures.append(f"{state}: search({query!r}) found {found}, expected {expected}")
+    for failure in failures:
+        print(f"FAIL {failure}")
+    print(f"self-check: {'ok' if not failures else f'{len(failures)} failures'}")
+    sys.exit(1 if failures else 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("query", nargs="?", default="")
+    parser.add_argument("--dir", default=ARCHIVE_DIR, help="archive directory (default: XHS_ARCHIVE_DIR)")
+    parser.add_argument("--niche")
+    parser.add_argument("--style")
+    parser.add_argument("--kind", choices=[POST, REVIEW])
+    parser.add_argument("--since", help="YYYY-MM-DD")
+    parser.add_argument("--until", help="YYYY-MM-DD (exclusive)")
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--stats", action="store_true", help="print segment statistics")
+    parser.add_argument("--merge", action="store_true", help="merge all sealed segments into one")
+    parser.add_argument("--self-check", action="store_true", help="check indexing and search on a temporary archive")
+    args = parser.parse_args()
+
+    if args.self_check:
+        self_check()
+
+    if not args.dir:
+        sys.exit("set XHS_ARCHIVE_DIR or pass --dir")
+    if args.merge:
+        # Rewrites segments: refuses while a server has the archive open
+        try:
+            archive = Archive(args.dir)
+        except ArchiveLockedError as e:
+            sys.exit(f"{e} (stop the server before --merge)")
+        archive.flush()
+        archive.merge()
+    else:
+        archive = Archive(args.dir, read_only=True)
+    if args.stats or args.merge:
+        stats = archive.stats()
+        print(f"records: {stats['records']}")
+        for segment in stats["segments"]:
+            print(f"  segment {segment['seq']:>6}  ids {segment['base']}+{segment['count']}  "
+                  f"grams {segment['grams']}  postings {segment['postings_bytes'] / 1024:.0f} KiB"
+                  f"{'' if segment['sealed'] else '  (live)'}")
+        return
+
+    start = time.perf_counter()
+    hits = archive.search(
+        args.query,
+        niche=args.niche,
+        style=args.style,
+        kind=args.kind,
+        since=_epoch(args.since) if args.since else None,
+        until=_epoch(args.until) if args.until else None,
+        limit=args.limit
+    )
+    elapsed = time.perf_counter() - start
+
+    for hit in hits:
+        created = datetime.fromtimestamp(hit.created_at).strftime("%Y-%m-%d %H:%M")
+        label = " / ".join(x for x in (hit.niche, hit.style) if x)
+        if hit.kind == REVIEW:
+            print(f"[{created}] 复盘 {label}\n    {hit.data.get('reflection', '')}")
+        else:
+            print(f"[{created}] {hit.data.get('title', '')}  {label}\n    {hit.data.get('hook', '')}")
+    print(f"\n{len(hits)} results in {elapsed * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Shared fixtures. Every test runs offline: backend environment variables
+are cleared and process-wide state (router, cassette, breakers,
+scheduler, caches) is reset around each test.
+"""
+
+import re
+import json
+import random
+import threading
+import types
+from typing import Dict, List
+
+import pytest
+
+from agent import tools
+from agent.breaker import reset_breakers
+from agent.cassette import RECORD, REPLAY, set_cassette, use_cassette
+from agent.prompts import REWRITE_FIELD_SPECS
+from agent.providers import Backend, ProviderRouter, set_router
+from agent.scheduler import set_scheduler
+
+_BACKEND_ENV = (
+    "DASHSCOPE_API_KEY", "LLM_BACKENDS", "LOCAL_LLM_BASE_URL",
+    "LLM_CASSETTE", "LLM_CASSETTE_MODE"
+)
+
+# Chinese field name -> DayContent field, as REWRITE_FIELDS_PROMPT names them
+_FIELD_NAMES = {name: field for field, (name, _) in REWRITE_FIELD_SPECS.items()}
+
+
+def _text(rng: random.Random, length: int) -> str:
+    # Random CJK characters share no shingles, so fresh posts never look alike
+    return "".join(chr(rng.randrange(0x4E00, 0x9FA6)) for _ in range(length))
+
+
+def _day(rng: random.Random, day: int) -> Dict:
+    return {
+        "day": day,
+        "title": _text(rng, 12),
+        "hook": _text(rng, 20),
+        "bullets": [_text(rng, 10) for _ in range(4)],
+        "cta": _text(rng, 10),
+        "tags": ["#" + _text(rng, 3) for _ in range(5)]
+    }
+
+
+class FakeLLM:
+    """
+    Chat completions backend answering each prompt type with valid JSON.
+    Weekly generation always returns the same stock week, so every week
+    after the first repeats it and goes through regeneration; regenerated
+    and rewritten content is fresh on every call.
+    """
+
+    def __init__(self):
+        self.requests: List[Dict[str, str]] = []
+        self._rng = random.Random(0)
+        self._lock = threading.Lock()
+        stock = random.Random("stock")
+        self.stock_week = [_day(stock, d) for d in range(1, 8)]
+
+    @property
+    def calls(self) -> int:
+        return len(self.requests)
+
+    def create(self, model, messages, **params):
+        system, prompt = messages[0]["content"], messages[-1]["content"]
+        with self._lock:
+            self.requests.append({"system": system, "prompt": prompt})
+            body = self._answer(system, prompt)
+        texts = [json.dumps(body, ensure_ascii=False)] * params.get("n", 1)
+        choices = [types.SimpleNamespace(message=types.SimpleNamespace(content=t)) for t in texts]
+        return types.SimpleNamespace(choices=choices, usage=None)
+
+    def _answer(self, system: str, prompt: str) -> Dict:
+        rng = self._rng
+        if "重复的几天" in system:
+            days = re.search(r"请重新生成第(.+?)天", prompt).group(1).split("、")
+            return {"days": [_day(rng, int(d)) for d in days]}
+        if "每周的内容主题" in system:
+            weeks = int(re.search(r"共(\d+)周", prompt).group(1))
+            return {"weeks": [{"week": w, "theme": _text(rng, 8)} for w in range(1, weeks + 1)]}
+        if "制定内容计划" in system:
+            return {"days": self.stock_week}
+        if "用户指定的部分" in system:
+            names = re.search(r"只需要重新写以下部分：(.+)", prompt).group(1).split("、")
+            fresh = _day(rng, 1)
+            return {_FIELD_NAMES[n]: fresh[_FIELD_NAMES[n]] for n in names}
+        if "改写一条内容" in system:
+            return _day(rng, 1)
+        if "之前已经为用户写好了" in system:
+            return {"reflection": "", "updates": [{"index": 1, "suggestion": _text(rng, 15)}]}
+        if "复盘" in system:
+            return {"reflection": _text(rng, 30), "suggestions": [_text(rng, 15) for _ in range(3)]}
+        raise AssertionError(f"unexpected prompt: {system[:40]}")
+
+
+def _reset_caches():
+    tools._plan_pool.clear()
+    tools._review_cache.clear()
+
+
+@pytest.fixture(autouse=True)
+def offline(monkeypatch):
+    for name in _BACKEND_ENV:
+        monkeypatch.delenv(name, raising=False)
+    set_router(None)
+    set_cassette(None)
+    set_scheduler(None)
+    reset_breakers()
+    _reset_caches()
+    yield
+    set_router(None)
+    set_cassette(None)
+    set_scheduler(None)
+    reset_breakers()
+    _reset_caches()
+
+
+@pytest.fixture
+def fake_llm() -> FakeLLM:
+    """FakeLLM installed as the only backend."""
+    fake = FakeLLM()
+    backend = Backend(name="fake", base_url="fake://", api_key="fake")
+    backend._client = types.SimpleNamespace(chat=types.SimpleNamespace(completions=fake))
+    set_router(ProviderRouter([backend]))
+    return fake
+
+
+@pytest.fixture
+def record_replay(tmp_path, fake_llm):
+    """
+    run(fn) calls fn while recording to a cassette, then again replaying
+    it with no backend configured. Returns (recorded, replayed).
+    """
+    def run(fn):
+        path = str(tmp_path / "calls.jsonl")
+        with use_cassette(path, RECORD):
+            recorded = fn()
+        calls = fake_llm.calls
+        set_router(None)
+        _reset_caches()
+        with use_cassette(path, REPLAY):
+            replayed = fn()
+        assert fake_llm.calls == calls
+        return recorded, replayed
+    return run
@@ -0,0 +1,98 @@
+"""CircuitBreaker state transitions."""
+
+import pytest
+
+from agent import breaker as breaker_module
+from agent.breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(breaker_module.time, "monotonic", lambda: now[0])
+    return now
+
+
+def _breaker(**kwargs) -> CircuitBreaker:
+    return CircuitBreaker("test", min_calls=4, window_size=4, open_seconds=30.0, slow_call_seconds=10.0, **kwargs)
+
+
+def test_stays_closed_below_min_calls():
+    breaker = _breaker()
+    for _ in range(3):
+        breaker.before_call()
+        breaker.record_failure()
+    assert breaker.state == CLOSED
+
+
+def test_trips_at_failure_rate():
+    breaker = _breaker()
+    for failed in (False, True, False, True):
+        breaker.before_call()
+        breaker.record_failure() if failed else breaker.record_success(1.0)
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_slow_calls_count_as_failures():
+    breaker = _breaker()
+    for _ in range(4):
+        breaker.before_call()
+        breaker.record_success(12.0)
+    assert breaker.state == OPEN
+
+
+def test_slow_call_threshold_override():
+    breaker = _breaker()
+    for _ in range(4):
+        breaker.before_call()
+        breaker.record_success(12.0, slow_call_seconds=60.0)
+    assert breaker.state == CLOSED
+
+
+def _tripped(clock) -> CircuitBreaker:
+    breaker = _breaker()
+    for _ in range(4):
+        breaker.before_call()
+        breaker.record_failure()
+    clock[0] += 30.0
+    assert breaker.state == HALF_OPEN
+    return breaker
+
+
+def test_half_open_limits_probes(clock):
+    breaker = _tripped(clock)
+    breaker.before_call()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_half_open_closes_on_success(clock):
+    breaker = _tripped(clock)
+    breaker.before_call()
+    breaker.record_success(1.0)
+    assert breaker.state == CLOSED
+    assert breaker.snapshot()["calls"] == 0
+
+
+def test_half_open_reopens_on_failure(clock):
+    breaker = _tripped(clock)
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+
+
+def test_half_open_reopens_on_slow_probe(clock):
+    breaker = _tripped(clock)
+    breaker.before_call()
+    breaker.record_success(12.0)
+    assert breaker.state == OPEN
+
+
+def test_release_frees_probe_slot(clock):
+    breaker = _tripped(clock)
+    breaker.before_call()
+    breaker.release()
+    assert breaker.state == HALF_OPEN
+    breaker.before_call()
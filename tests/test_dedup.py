@@ -0,0 +1,43 @@
+"""Near-duplicate detection within a week and against history."""
+
+from agent.dedup import build_index, find_duplicates, signature
+from agent.state import DayContent
+
+
+def _day(day: int, title: str, hook: str, bullets) -> DayContent:
+    return DayContent(day=day, title=title, hook=hook, bullets=list(bullets), cta="留言告诉我～", tags=[])
+
+
+MORNING = _day(1, "早起打卡第一周", "闹钟响了三次才起床的我，终于连续早起七天了",
+               ["前一晚十一点前放下手机", "闹钟放在离床远的地方", "起床先喝一杯温水"])
+MORNING_AGAIN = _day(3, "早起打卡第一周！", "闹钟响了三次才起床的我，终于连续早起七天啦",
+                     ["前一晚十一点前放下手机", "闹钟放在离床远的地方", "起床先喝一杯温水"])
+DORM = _day(2, "宿舍收纳大改造", "十平米的宿舍也能住得清清爽爽",
+            ["桌面只留每天要用的东西", "床底用带轮子的收纳箱", "衣服按季节分袋装好"])
+DINNER = _day(4, "一人食的快手晚餐", "下课回来二十分钟就能吃上热乎饭",
+              ["电饭煲焖饭顺便蒸蛋", "提前切好一周的配菜", "调味只备生抽和蚝油"])
+
+
+def test_distinct_days_pass():
+    assert find_duplicates([MORNING, DORM, DINNER]) == []
+
+
+def test_repeat_within_week_keeps_first():
+    duplicates = find_duplicates([MORNING, DORM, MORNING_AGAIN])
+    assert [(d.day, d.other_day) for d in duplicates] == [(3, 1)]
+    assert duplicates[0].similarity >= 0.5
+
+
+def test_repeat_of_history():
+    history = build_index([signature(MORNING), signature(DINNER)])
+    duplicates = find_duplicates([DORM, MORNING_AGAIN], history)
+    assert [(d.day, d.other_day) for d in duplicates] == [(3, None)]
+
+
+def test_empty_history_index():
+    assert find_duplicates([MORNING, DORM], build_index([])) == []
+
+
+def test_signature_ignores_tags_and_cta():
+    retagged = DayContent.from_dict({**MORNING.to_dict(), "tags": ["#早起"], "cta": "关注我"})
+    assert signature(retagged) == signature(MORNING)
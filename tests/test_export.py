@@ -0,0 +1,28 @@
+"""Reading plans and day rows for export."""
+
+import json
+
+from agent.export import rows_from_jsonl
+
+DAY = {"day": 1, "title": "早起打卡", "hook": "连续早起七天", "bullets": ["早睡"], "cta": "留言", "tags": []}
+
+
+def _write(tmp_path, records) -> str:
+    path = tmp_path / "plans.jsonl"
+    path.write_text("\n".join(json.dumps(r, ensure_ascii=False) for r in records), encoding="utf-8")
+    return str(path)
+
+
+def test_plan_shapes(tmp_path):
+    path = _write(tmp_path, [
+        {"plan": "week", "days": [DAY]},
+        {"plan": "month", "weeks": [[DAY], [{**DAY, "day": 2}]]},
+        {**DAY, "plan": "row", "week": 3},
+    ])
+    rows = [(r.plan, r.week, r.day.day) for r in rows_from_jsonl(path)]
+    assert rows == [("week", 1, 1), ("month", 1, 1), ("month", 2, 2), ("row", 3, 1)]
+
+
+def test_empty_weeks_without_days(tmp_path):
+    path = _write(tmp_path, [{"plan": "empty", "weeks": []}, {"plan": "week", "days": [DAY]}])
+    assert [r.plan for r in rows_from_jsonl(path)] == ["week"]
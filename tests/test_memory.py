@@ -0,0 +1,49 @@
+"""Idle-session offload and rehydration."""
+
+import os
+
+from agent.memory import PlanStore, SessionRegistry
+from agent.state import AppState, DayContent
+
+DAY = {"day": 1, "title": "早起打卡", "hook": "连续早起七天", "bullets": ["早睡"], "cta": "留言", "tags": ["#早起"]}
+
+
+def _registry(tmp_path) -> SessionRegistry:
+    return SessionRegistry(PlanStore(str(tmp_path / "offload")), idle_seconds=60.0)
+
+
+def _state() -> AppState:
+    state = AppState(niche="生活方式")
+    state.set_plan_candidates([[DayContent.from_dict(DAY)]])
+    return state
+
+
+def test_offload_and_rehydrate(tmp_path):
+    registry = _registry(tmp_path)
+    state = _state()
+    registry.touch(state)
+    plan = list(state.weekly_plan)
+
+    assert registry.sweep(now=registry._last_access[state.session_id] + 61.0) == 1
+    assert state.offloaded and state.weekly_plan == []
+
+    registry.touch(state)
+    assert not state.offloaded
+    assert state.weekly_plan == plan
+    assert os.listdir(registry.store.directory) == []
+
+
+def test_touched_during_offload_keeps_plan(tmp_path):
+    registry = _registry(tmp_path)
+    state = _state()
+    registry.touch(state)
+    save = registry.store.save
+
+    def save_then_touch(session_id, data):
+        save(session_id, data)
+        registry.touch(state)
+
+    registry.store.save = save_then_touch
+    assert registry.sweep(now=registry._last_access[state.session_id] + 61.0) == 0
+    assert not state.offloaded and len(state.weekly_plan) == 1
+    assert os.listdir(registry.store.directory) == []
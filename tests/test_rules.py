@@ -0,0 +1,60 @@
+"""Rule checks of generated days."""
+
+from agent.rules import DEFAULT_EFFORT_RULE, EFFORT_RULES, MAX_TITLE_CHARS, check_day, check_plan
+from agent.state import DayContent
+
+EFFORT = "很少(1-2条/周)"
+
+
+def _day(**fields) -> DayContent:
+    data = {
+        "day": 1,
+        "title": "周末城市漫步路线",
+        "hook": "不花钱也能把周末过得很充实",
+        "bullets": ["老街区适合拍照散步", "公园湖边看日落", "顺路逛一家独立书店"],
+        "cta": "你们周末都去哪儿？",
+        "tags": ["#周末去哪儿"]
+    }
+    data.update(fields)
+    return DayContent.from_dict(data)
+
+
+def _rules(violations):
+    return [(v.field, v.rule) for v in violations]
+
+
+def test_clean_day():
+    assert check_day(_day(), [], EFFORT) == []
+
+
+def test_bullet_count_without_constraints():
+    max_bullets = EFFORT_RULES[EFFORT][1]
+    day = _day(bullets=["要点"] * (max_bullets + 1))
+    assert _rules(check_day(day, [], EFFORT)) == [("bullets", "bullet_count")]
+
+
+def test_bullet_length():
+    max_chars = EFFORT_RULES[EFFORT][2]
+    day = _day(bullets=["短", "短", "长" * (max_chars + 1)])
+    assert _rules(check_day(day, [], EFFORT)) == [("bullets", "length")]
+
+
+def test_unknown_effort_uses_default_rule():
+    day = _day(bullets=["要点"] * DEFAULT_EFFORT_RULE[1])
+    assert check_day(day, [], None) == []
+
+
+def test_title_length():
+    day = _day(title="标" * (MAX_TITLE_CHARS + 1))
+    assert _rules(check_day(day, [], EFFORT)) == [("title", "length")]
+
+
+def test_check_plan_reports_each_day():
+    days = [_day(), _day(day=2, title="标" * (MAX_TITLE_CHARS + 1))]
+    assert [v.day for v in check_plan(days, [], EFFORT)] == [2]
+
+
+def test_constraint_lexicon():
+    day = _day(hook="第一个月工资就这样花完了")
+    assert _rules(check_day(day, ["不谈金钱/收入"], EFFORT)) == [("hook", "不谈金钱/收入")]
+    assert check_day(day, [], EFFORT) == []
@@ -0,0 +1,104 @@
+"""Priority classes and deficit round robin of the LLM scheduler."""
+
+import threading
+import time
+
+import pytest
+
+from agent import scheduler as scheduler_module
+from agent.jobs import PRIORITY_BATCH, PRIORITY_GENERATE, PRIORITY_REWRITE
+from agent.scheduler import DRR_QUANTUM, LLMScheduler, ScheduleTimeoutError
+
+
+def _waiting(scheduler: LLMScheduler) -> int:
+    return sum(t["waiting"] for t in scheduler.stats()["tenants"])
+
+
+class Calls:
+    """Queues calls on threads; each records its tenant when granted and finishes at once."""
+
+    def __init__(self, scheduler: LLMScheduler):
+        self.scheduler = scheduler
+        self.order = []
+        self.threads = []
+
+    def queue(self, tenant: str, priority: int = PRIORITY_GENERATE, cost: int = DRR_QUANTUM):
+        def run():
+            ticket = self.scheduler.acquire(cost, tenant, priority)
+            self.order.append(tenant)
+            self.scheduler.release(ticket)
+
+        waiting = _waiting(self.scheduler)
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        self.threads.append(thread)
+        deadline = time.monotonic() + 5.0
+        while _waiting(self.scheduler) == waiting:
+            assert time.monotonic() < deadline, "call was never queued"
+            time.sleep(0.001)
+
+    def join(self):
+        for thread in self.threads:
+            thread.join(5.0)
+        return self.order
+
+
+@pytest.fixture
+def busy():
+    """A one-slot scheduler whose slot is taken; release the returned ticket to start dispatching."""
+    scheduler = LLMScheduler(max_concurrency=1)
+    holder = scheduler.acquire(1, "holder", PRIORITY_GENERATE)
+    return scheduler, holder
+
+
+def test_round_robin_between_tenants(busy):
+    scheduler, holder = busy
+    calls = Calls(scheduler)
+    for tenant in ("a", "a", "a", "b"):
+        calls.queue(tenant)
+    scheduler.release(holder)
+    assert calls.join() == ["a", "b", "a", "a"]
+
+
+def test_weighted_share(busy, monkeypatch):
+    monkeypatch.setitem(scheduler_module.TENANT_WEIGHTS, "a", 2.0)
+    scheduler, holder = busy
+    calls = Calls(scheduler)
+    for tenant in ("a", "a", "a", "b", "b", "b"):
+        calls.queue(tenant)
+    scheduler.release(holder)
+    assert calls.join() == ["a", "a", "b", "a", "b", "b"]
+
+
+def test_priority_classes_first(busy):
+    scheduler, holder = busy
+    calls = Calls(scheduler)
+    calls.queue("batch", PRIORITY_BATCH)
+    calls.queue("generate", PRIORITY_GENERATE)
+    calls.queue("rewrite", PRIORITY_REWRITE)
+    scheduler.release(holder)
+    assert calls.join() == ["rewrite", "generate", "batch"]
+
+
+def test_tenant_concurrency_cap(monkeypatch):
+    monkeypatch.setattr(scheduler_module, "TENANT_MAX_CONCURRENCY", 1)
+    scheduler = LLMScheduler(max_concurrency=2)
+    first = scheduler.acquire(1, "a", PRIORITY_GENERATE)
+    calls = Calls(scheduler)
+    calls.queue("a")
+    # The other tenant takes the free slot ahead of a's second call
+    other = scheduler.acquire(1, "b", PRIORITY_GENERATE)
+    assert calls.order == []
+    scheduler.release(other)
+    scheduler.release(first)
+    assert calls.join() == ["a"]
+
+
+def test_timeout_leaves_queue(busy, monkeypatch):
+    monkeypatch.setattr(scheduler_module, "RECHECK_SECONDS", 0.01)
+    scheduler, holder = busy
+    with pytest.raises(ScheduleTimeoutError):
+        scheduler.acquire(1, "late", PRIORITY_GENERATE, timeout=0.05)
+    assert _waiting(scheduler) == 0
+    scheduler.release(holder)
+    assert scheduler.stats()["running"] == 0
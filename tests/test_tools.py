@@ -0,0 +1,104 @@
+"""Generation, rewrite and review flows, recorded and replayed offline."""
+
+from agent.dedup import find_duplicates, signature
+from agent.state import DayContent
+from agent.tools import (
+    generate_monthly_plan,
+    generate_weekly_content,
+    generate_weekly_review,
+    review_basis,
+    rewrite_day_content,
+)
+
+PROFILE = ("生活方式", "记录生活", "轻松日常", "一般(3-4条/周)", [], "")
+
+
+def _flatten(weeks):
+    return [day for week in weeks for day in week]
+
+
+def test_weekly_content_replays(record_replay, fake_llm):
+    recorded, replayed = record_replay(lambda: generate_weekly_content(*PROFILE))
+    days, error = recorded
+    assert error is None
+    assert [d.title for d in days] == [d["title"] for d in fake_llm.stock_week]
+    assert replayed == recorded
+
+
+def test_weekly_content_regenerates_history_repeats(record_replay, fake_llm):
+    stock = [DayContent.from_dict(d) for d in fake_llm.stock_week]
+    history = [signature(stock[0]), signature(stock[3])]
+
+    recorded, replayed = record_replay(lambda: generate_weekly_content(*PROFILE, history=history))
+    days, error = recorded
+    assert error is None
+    changed = [d.day for d, old in zip(days, stock) if d.title != old.title]
+    assert changed == [1, 4]
+    assert replayed == recorded
+
+
+def test_rewrite_fields_keeps_other_fields(record_replay, fake_llm):
+    day = DayContent.from_dict(fake_llm.stock_week[2])
+
+    recorded, replayed = record_replay(
+        lambda: rewrite_day_content(day, "标题更吸引人一点", niche="生活方式", fields=["title"])
+    )
+    new_content, error = recorded
+    assert error is None
+    assert new_content.title != day.title
+    assert (new_content.day, new_content.hook, new_content.bullets, new_content.cta, new_content.tags) == (
+        day.day, day.hook, day.bullets, day.cta, day.tags
+    )
+    assert replayed == recorded
+
+
+def test_review_is_memoized(fake_llm):
+    plan = [DayContent.from_dict(d) for d in fake_llm.stock_week]
+
+    first, error = generate_weekly_review(plan, [1], [5], "保持", "")
+    assert error is None
+    calls = fake_llm.calls
+    second, _ = generate_weekly_review(plan, [1], [5], "保持", "")
+    assert second == first
+    assert fake_llm.calls == calls
+
+
+def test_review_delta_updates_one_suggestion(record_replay, fake_llm):
+    plan = [DayContent.from_dict(d) for d in fake_llm.stock_week]
+    edited = list(plan)
+    edited[2] = DayContent.from_dict({**fake_llm.stock_week[2], "title": "换了一个新标题"})
+
+    def review_twice():
+        previous, _ = generate_weekly_review(plan, [1], [5], "保持", "")
+        basis = review_basis(plan, [1], [5], "保持", "")
+        return previous, generate_weekly_review(
+            edited, [1], [5], "保持", "", previous_basis=basis, previous_review=previous
+        )
+
+    recorded, replayed = record_replay(review_twice)
+    previous, (review, error) = recorded
+    assert error is None
+    assert "之前已经为用户写好了" in fake_llm.requests[-1]["system"]
+    assert review.reflection == previous.reflection
+    assert review.suggestions[0] != previous.suggestions[0]
+    assert review.suggestions[1:] == previous.suggestions[1:]
+    assert replayed == recorded
+
+
+def test_monthly_plan_sequential(record_replay):
+    recorded, replayed = record_replay(lambda: generate_monthly_plan(*PROFILE, weeks=3))
+    (weeks, themes), error = recorded
+    assert error is None
+    assert len(weeks) == 3 and all(themes)
+    assert find_duplicates(_flatten(weeks)) == []
+    assert replayed == recorded
+
+
+def test_monthly_plan_parallel(record_replay):
+    recorded, replayed = record_replay(lambda: generate_monthly_plan(*PROFILE, weeks=3, parallel=True))
+    (weeks, themes), error = recorded
+    assert error is None
+    assert [len(week) for week in weeks] == [7, 7, 7]
+    # Every week starts as the stock week; the cross-week pass replaces the repeats
+    assert find_duplicates(_flatten(weeks)) == []
+    assert replayed == recorded